@@ -1,30 +1,263 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, Response, g, stream_with_context, render_template, request, redirect, url_for, session, jsonify, flash
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from collections import Counter
+from itertools import islice
+from datetime import datetime, timedelta
 from functools import wraps
+import click
+import json
 import os
-import requests
+import re
+import time
+import uuid
+import zipfile
+
+from auth import HashingBusy, PasswordHasher, UserCache
+from bitmaps import bit_count, bits_or, has_bit, set_bit
+from chat_gateway import ChatGateway
+from chatbot import ChatCache, ChatError, ChatService, sse_event
+from course_bundle import course_record, jsonl_chunks, open_lines, read_courses, zip_chunks
+from conversations import ASSISTANT, USER, build_context, create_store
+from ingest import EventWriter, IngestBusy
+from instrumentation import Instrumentation, Metrics
+from page_cache import PageCache, create_backend
+from rollups import METRICS as ROLLUP_METRICS, PERIODS, PeriodicJob, build_series, csv_chunks, parse_day
+from quiz_bank import QuizCache, grade, item_statistics, pack_correct, read_banks, validate_bank
+from search_index import SearchIndex
+from synthetic import SCALES, TABLES as SYNTHETIC_TABLES, synthetic_rows
+from storage import current_pragmas, engine_options, install_functions, install_pragmas, sqlite_pragmas
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'oguz-ai-academy-secret-key-2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///oguz_ai_academy.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///oguz_ai_academy.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Database engine. SQLite gets its pragmas on every new connection; any other
+# SQLAlchemy URL (e.g. postgresql+psycopg://...) only takes the pool settings.
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -64000))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    pool_size=app.config['DB_POOL_SIZE'],
+    max_overflow=app.config['DB_MAX_OVERFLOW'],
+    pool_timeout=app.config['DB_POOL_TIMEOUT'],
+    pool_recycle=app.config['DB_POOL_RECYCLE']
+)
+
+# Relationship loading strategies: 'select' (lazy), 'joined', 'selectin' or 'subquery'
+app.config['USER_PROGRESS_LOADING'] = os.getenv('USER_PROGRESS_LOADING', 'select')
+app.config['PROGRESS_COURSE_LOADING'] = os.getenv('PROGRESS_COURSE_LOADING', 'select')
+app.config['DASHBOARD_LOADING'] = os.getenv('DASHBOARD_LOADING', 'joined')
+
+# Listing pagination
+app.config['PAGE_SIZE'] = int(os.getenv('PAGE_SIZE', 24))
+app.config['MAX_PAGE_SIZE'] = 100
+
+# Rendered-page cache for public catalog routes: 'memory', 'sqlite' or 'none'
+app.config['PAGE_CACHE_BACKEND'] = os.getenv('PAGE_CACHE_BACKEND', 'memory')
+app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 300))
+app.config['PAGE_CACHE_SIZE'] = int(os.getenv('PAGE_CACHE_SIZE', 512))
+app.config['PAGE_CACHE_PATH'] = os.getenv('PAGE_CACHE_PATH', os.path.join(app.instance_path, 'page_cache.sqlite'))
+
+# Chat assistant (OpenRouter-compatible completions endpoint)
+app.config['CHAT_API_URL'] = os.getenv('CHAT_API_URL', 'https://openrouter.ai/api/v1/chat/completions')
+app.config['CHAT_MODEL'] = os.getenv('CHAT_MODEL', 'deepseek/deepseek-chat')
+app.config['CHAT_TIMEOUT'] = int(os.getenv('CHAT_TIMEOUT', 30))
+app.config['CHAT_CACHE_SIZE'] = int(os.getenv('CHAT_CACHE_SIZE', 1024))
+app.config['CHAT_CACHE_TTL'] = int(os.getenv('CHAT_CACHE_TTL', 3600))
+app.config['CHAT_MAX_CONCURRENCY'] = int(os.getenv('CHAT_MAX_CONCURRENCY', 16))
+app.config['CHAT_MAX_QUEUE'] = int(os.getenv('CHAT_MAX_QUEUE', 64))
+# Request threads per process that may wait on the assistant at once (0: no
+# limit); serve.py leaves half of each worker's threads for other pages
+app.config['CHAT_MAX_WAITING'] = int(os.getenv('CHAT_MAX_WAITING', 0))
+app.config['CHAT_RATE_PER_MINUTE'] = float(os.getenv('CHAT_RATE_PER_MINUTE', 20))
+app.config['CHAT_RATE_BURST'] = int(os.getenv('CHAT_RATE_BURST', 5))
+app.config['CHAT_MAX_RETRIES'] = int(os.getenv('CHAT_MAX_RETRIES', 3))
+app.config['CHAT_CONTEXT_TOKENS'] = int(os.getenv('CHAT_CONTEXT_TOKENS', 1500))
+app.config['CHAT_RECENT_TURNS'] = int(os.getenv('CHAT_RECENT_TURNS', 6))
+app.config['CHAT_MEMORY_TURNS'] = int(os.getenv('CHAT_MEMORY_TURNS', 40))
+app.config['CHAT_MEMORY_CHARS'] = int(os.getenv('CHAT_MEMORY_CHARS', 16000))
+app.config['CHAT_SESSION_TTL'] = int(os.getenv('CHAT_SESSION_TTL', 1800))
+app.config['CHAT_MAX_SESSIONS'] = int(os.getenv('CHAT_MAX_SESSIONS', 10000))
+# Conversation memory: 'memory' (one process) or 'sqlite' (shared by workers)
+app.config['CHAT_MEMORY_BACKEND'] = os.getenv('CHAT_MEMORY_BACKEND', 'memory')
+app.config['CHAT_MEMORY_PATH'] = os.getenv('CHAT_MEMORY_PATH', os.path.join(app.instance_path, 'conversations.sqlite'))
+
+# Course material retrieval for the chat assistant
+app.config['SEARCH_INDEX_PATH'] = os.getenv('SEARCH_INDEX_PATH', os.path.join(app.instance_path, 'search_index.pkl'))
+# Admin edits queue the documents they change; the flask run-jobs scheduler
+# applies the queue and saves the index once every SEARCH_INDEX_INTERVAL
+# seconds (0 applies it inside the edit request instead).
+app.config['SEARCH_INDEX_INTERVAL'] = int(os.getenv('SEARCH_INDEX_INTERVAL', 60))
+app.config['CHAT_GROUNDING_PASSAGES'] = int(os.getenv('CHAT_GROUNDING_PASSAGES', 3))
+app.config['CHAT_DIRECT_ANSWER_CONFIDENCE'] = float(os.getenv('CHAT_DIRECT_ANSWER_CONFIDENCE', 0.9))
+# Share of the question's terms the passage must contain to be answered without the model
+app.config['CHAT_DIRECT_ANSWER_COVERAGE'] = float(os.getenv('CHAT_DIRECT_ANSWER_COVERAGE', 0.8))
+# Write-behind ingestion of enrollments and quiz results. With INGEST_DURABLE
+# a request waits for the batched commit holding its event; without it the
+# request returns as soon as the event is queued.
+app.config['INGEST_DURABLE'] = os.getenv('INGEST_DURABLE', '1') == '1'
+app.config['INGEST_MAX_QUEUE'] = int(os.getenv('INGEST_MAX_QUEUE', 10000))
+app.config['INGEST_BATCH_SIZE'] = int(os.getenv('INGEST_BATCH_SIZE', 500))
+app.config['INGEST_FLUSH_INTERVAL'] = float(os.getenv('INGEST_FLUSH_INTERVAL', 0.05))
+# Seconds a durable request waits for its commit before answering 503; the
+# event stays queued and is still written
+app.config['INGEST_TIMEOUT'] = float(os.getenv('INGEST_TIMEOUT', 10))
+
+# Login path: password checks run in a bounded pool; stored hashes made with
+# other parameters are upgraded to PASSWORD_HASH_METHOD on the next login.
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 32))
+app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 30))
+
+# Quiz question banks loaded into an empty database
+app.config['QUESTION_BANK_PATH'] = os.getenv('QUESTION_BANK_PATH', os.path.join(app.root_path, 'question_bank'))
+
+# Analytics rollups: the flask run-jobs scheduler folds new activity into
+# per-day rows every ROLLUP_INTERVAL seconds (0 disables it; use flask
+# refresh-rollups).
+# Days within ROLLUP_LATE_SECONDS of the last run are recomputed, which
+# covers events committed after the time they carry.
+app.config['ROLLUP_INTERVAL'] = int(os.getenv('ROLLUP_INTERVAL', 300))
+app.config['ROLLUP_LATE_SECONDS'] = int(os.getenv('ROLLUP_LATE_SECONDS', 3600))
+app.config['ANALYTICS_DEFAULT_DAYS'] = int(os.getenv('ANALYTICS_DEFAULT_DAYS', 90))
+
+# Course recommendations: the flask run-jobs scheduler rescores learners
+# with new activity every RECOMMENDATION_INTERVAL seconds (0 disables it; use
+# flask refresh-recommendations) and refits the co-enrollment model once it is
+# older than RECOMMENDATION_REFIT_SECONDS.
+app.config['RECOMMENDATION_INTERVAL'] = int(os.getenv('RECOMMENDATION_INTERVAL', 600))
+app.config['RECOMMENDATION_REFIT_SECONDS'] = int(os.getenv('RECOMMENDATION_REFIT_SECONDS', 86400))
+app.config['RECOMMENDATION_COUNT'] = int(os.getenv('RECOMMENDATION_COUNT', 6))
+app.config['RECOMMENDATION_NEIGHBOURS'] = int(os.getenv('RECOMMENDATION_NEIGHBOURS', 50))
+app.config['RECOMMENDATION_MODEL_PATH'] = os.getenv('RECOMMENDATION_MODEL_PATH', os.path.join(app.instance_path, 'recommendations.npz'))
+
+# Bulk course import: courses upserted per transaction
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 100))
+
+# Opt-in request metrics served at /admin/metrics. With PROFILE_SLOW_REQUEST_MS
+# set, requests are also stack-sampled and those slower than the threshold
+# are written to PROFILE_DIR as collapsed stacks for flame graphs.
+app.config['INSTRUMENTATION'] = os.getenv('INSTRUMENTATION', '0') == '1'
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 100))
+app.config['PROFILE_SLOW_REQUEST_MS'] = float(os.getenv('PROFILE_SLOW_REQUEST_MS', 0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+app.config['CHAT_SYSTEM_PROMPT'] = 'You are a helpful AI learning assistant for Oguz AI Academy. Help students with questions about AI, machine learning, deep learning, and programming. Be friendly, educational, and encourage learning.'
+
 db = SQLAlchemy(app)
 
+with app.app_context():
+    install_pragmas(db.engine, sqlite_pragmas(
+        journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+        synchronous=app.config['SQLITE_SYNCHRONOUS'],
+        mmap_size=app.config['SQLITE_MMAP_SIZE'],
+        cache_size=app.config['SQLITE_CACHE_SIZE']
+    ))
+    install_functions(db.engine, {'has_bit': (2, has_bit), 'bits_or': (2, bits_or), 'bit_count': (1, bit_count)})
+
+metrics = Metrics()
+instrumentation = None
+if app.config['INSTRUMENTATION']:
+    with app.app_context():
+        instrumentation = Instrumentation(
+            app, db.engine, metrics,
+            slow_query_ms=app.config['SLOW_QUERY_MS'],
+            profile_slow_ms=app.config['PROFILE_SLOW_REQUEST_MS'],
+            profile_interval=app.config['PROFILE_INTERVAL_MS'] / 1000,
+            profile_dir=app.config['PROFILE_DIR']
+        )
+    metrics.describe('chat_upstream_seconds', 'Upstream completion latency per attempt (headers only for streams).')
+
+def observe_chat_upstream(seconds, status, stream):
+    metrics.observe('chat_upstream_seconds', seconds, status=status, stream='true' if stream else 'false')
+
+if app.config['PAGE_CACHE_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['PAGE_CACHE_PATH']), exist_ok=True)
+page_cache = PageCache(
+    create_backend(app.config['PAGE_CACHE_BACKEND'], app.config['PAGE_CACHE_PATH'], app.config['PAGE_CACHE_SIZE']),
+    ttl=app.config['PAGE_CACHE_TTL']
+)
+
+chat_service = ChatService(
+    api_url=app.config['CHAT_API_URL'],
+    api_key=os.getenv('OPENROUTER_API_KEY', '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'),
+    model=app.config['CHAT_MODEL'],
+    system_prompt=app.config['CHAT_SYSTEM_PROMPT'],
+    cache=ChatCache(app.config['CHAT_CACHE_SIZE'], app.config['CHAT_CACHE_TTL']),
+    gateway=ChatGateway(
+        max_concurrency=app.config['CHAT_MAX_CONCURRENCY'],
+        max_queue=app.config['CHAT_MAX_QUEUE'],
+        max_waiting=app.config['CHAT_MAX_WAITING'],
+        rate_per_minute=app.config['CHAT_RATE_PER_MINUTE'],
+        burst=app.config['CHAT_RATE_BURST'],
+        max_retries=app.config['CHAT_MAX_RETRIES'],
+        timeout=app.config['CHAT_TIMEOUT'],
+        on_upstream=observe_chat_upstream if instrumentation else None
+    ),
+    headers={
+        'HTTP-Referer': 'http://localhost:5000',
+        'X-Title': 'Oguz AI Academy Chatbot'
+    }
+)
+
+search_index = SearchIndex(app.config['SEARCH_INDEX_PATH'])
+
+# Created by get_recommender() on first use: only the job process fits the
+# model, and importing it (and NumPy) would slow every worker's startup
+recommender = None
+
+quiz_cache = QuizCache()
+
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    max_workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_QUEUE']
+)
+user_cache = UserCache(ttl=app.config['USER_CACHE_TTL'])
+
+if app.config['CHAT_MEMORY_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['CHAT_MEMORY_PATH']), exist_ok=True)
+conversations = create_store(
+    app.config['CHAT_MEMORY_BACKEND'],
+    app.config['CHAT_MEMORY_PATH'],
+    max_turns=app.config['CHAT_MEMORY_TURNS'],
+    max_chars=app.config['CHAT_MEMORY_CHARS'],
+    idle_ttl=app.config['CHAT_SESSION_TTL'],
+    max_sessions=app.config['CHAT_MAX_SESSIONS']
+)
+
 # Database Models
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at'),
+        db.Index('ix_user_is_admin', 'is_admin')
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    progress = db.relationship('Progress', backref='user', lazy=True, cascade='all, delete-orphan')
+    progress = db.relationship('Progress', backref='user', lazy=app.config['USER_PROGRESS_LOADING'], cascade='all, delete-orphan')
+    lesson_progress = db.relationship('LessonProgress', lazy=True, cascade='all, delete-orphan')
     quiz_results = db.relationship('QuizResult', backref='user', lazy=True, cascade='all, delete-orphan')
 
 class Course(db.Model):
+    # Index entries stay in id order within is_published, so paged listings need no sort
+    __table_args__ = (db.Index('ix_course_published', 'is_published'),)
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False)
@@ -36,11 +269,17 @@ class Course(db.Model):
     content = db.Column(db.Text, nullable=False)
     is_published = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Maintained on lesson insert/delete; lesson_slots is the next free bit position
+    lesson_count = db.Column(db.Integer, nullable=False, default=0)
+    lesson_slots = db.Column(db.Integer, nullable=False, default=0)
     lessons = db.relationship('Lesson', backref='course', lazy=True, cascade='all, delete-orphan')
-    progress = db.relationship('Progress', backref='course', lazy=True, cascade='all, delete-orphan')
+    progress = db.relationship('Progress', backref=db.backref('course', lazy=app.config['PROGRESS_COURSE_LOADING']), lazy=True, cascade='all, delete-orphan')
+    lesson_progress = db.relationship('LessonProgress', lazy=True, cascade='all, delete-orphan')
     quiz_results = db.relationship('QuizResult', backref='course', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('CourseStats', backref='course', uselist=False, lazy=True, cascade='all, delete-orphan')
 
 class Lesson(db.Model):
+    __table_args__ = (db.Index('ix_lesson_course_order', 'course_id', 'order'),)
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -49,22 +288,431 @@ class Lesson(db.Model):
     duration = db.Column(db.String(50))
     order = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bit position in LessonProgress.bits; never reused within a course
+    slot = db.Column(db.Integer)
 
 class Progress(db.Model):
+    __table_args__ = (
+        # One enrollment per user and course; also serves lookups by user
+        db.Index('uq_progress_user_course', 'user_id', 'course_id', unique=True),
+        db.Index('ix_progress_course', 'course_id'),
+        db.Index('ix_progress_last_accessed', 'last_accessed'),
+        db.Index('ix_progress_enrolled_at', 'enrolled_at'),
+        db.Index('ix_progress_completed_at', 'completed_at')
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     completed = db.Column(db.Boolean, default=False)
     progress_percentage = db.Column(db.Integer, default=0)
     last_accessed = db.Column(db.DateTime, default=datetime.utcnow)
+    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+class LessonProgress(db.Model):
+    __table_args__ = (
+        db.Index('uq_lesson_progress_user_course', 'user_id', 'course_id', unique=True),
+        db.Index('ix_lesson_progress_course', 'course_id')
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')
+    completed_lessons = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class QuizResult(db.Model):
+    __table_args__ = (
+        db.Index('ix_quiz_result_user_completed', 'user_id', 'completed_at'),
+        db.Index('ix_quiz_result_course', 'course_id'),
+        db.Index('ix_quiz_result_quiz_version', 'quiz_id', 'quiz_version'),
+        db.Index('ix_quiz_result_completed_at', 'completed_at')
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     total_questions = db.Column(db.Integer, nullable=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
+    quiz_version = db.Column(db.Integer)
+    # One bit per question (np.packbits), set when the answer was correct
+    correct_bits = db.Column(db.LargeBinary)
+
+class Quiz(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), unique=True, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    # Bumped whenever the questions change so compiled copies are refreshed
+    version = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    questions = db.relationship('Question', backref='quiz', lazy=True, order_by='Question.position',
+                                cascade='all, delete-orphan')
+    course = db.relationship('Course', backref=db.backref('quiz', uselist=False, cascade='all, delete-orphan'))
+
+class Question(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    options = db.Column(db.Text, nullable=False)  # JSON list of option labels
+    correct = db.Column(db.Integer, nullable=False)
+
+class CourseStats(db.Model):
+    """Per-course rollup counters, maintained by the write handlers."""
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    enrollments = db.Column(db.Integer, nullable=False, default=0)
+    completions = db.Column(db.Integer, nullable=False, default=0)
+    progress_sum = db.Column(db.Integer, nullable=False, default=0)
+    quiz_attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+
+COURSE_STATS_COUNTERS = ('enrollments', 'completions', 'progress_sum', 'quiz_attempts', 'score_sum')
+
+class DailyCourseRollup(db.Model):
+    """Activity per course and day (UTC), rebuilt by refresh_rollups."""
+    __table_args__ = (db.Index('ix_daily_course_rollup_day', 'day'),)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    enrollments = db.Column(db.Integer, nullable=False, default=0)
+    completions = db.Column(db.Integer, nullable=False, default=0)
+    quiz_attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    question_sum = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupState(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    # Activity up to this time is included in the rollups
+    watermark = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SearchIndexChange(db.Model):
+    """A search document (``course:<id>`` or ``lesson:<id>``) edited since the index was last updated."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(40), nullable=False)
+
+class CourseRecommendation(db.Model):
+    """Courses precomputed for a learner by refresh_recommendations; rows without a user are the fallback list."""
+    __table_args__ = (db.Index('uq_course_recommendation_user_rank', 'user_id', 'rank', unique=True),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
+    rank = db.Column(db.Integer, nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+LOADER_OPTIONS = {
+    'joined': db.joinedload,
+    'selectin': db.selectinload,
+    'subquery': db.subqueryload
+}
+
+def eager(attribute, strategy=None):
+    """Build an eager loader option for a relationship, defaulting to DASHBOARD_LOADING."""
+    return LOADER_OPTIONS[strategy or app.config['DASHBOARD_LOADING']](attribute)
+
+# Full-text search (SQLite FTS5), kept in sync by triggers
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS course_fts USING fts5(title, body, tokenize='porter unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lesson_fts USING fts5(course_id UNINDEXED, title, body, tokenize='porter unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS course_fts_insert AFTER INSERT ON course BEGIN
+        INSERT INTO course_fts (rowid, title, body) VALUES (new.id, new.title, new.description || ' ' || new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS course_fts_update AFTER UPDATE OF title, description, content ON course BEGIN
+        DELETE FROM course_fts WHERE rowid = old.id;
+        INSERT INTO course_fts (rowid, title, body) VALUES (new.id, new.title, new.description || ' ' || new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS course_fts_delete AFTER DELETE ON course BEGIN
+        DELETE FROM course_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS lesson_fts_insert AFTER INSERT ON lesson BEGIN
+        INSERT INTO lesson_fts (rowid, course_id, title, body) VALUES (new.id, new.course_id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS lesson_fts_update AFTER UPDATE OF course_id, title, content ON lesson BEGIN
+        DELETE FROM lesson_fts WHERE rowid = old.id;
+        INSERT INTO lesson_fts (rowid, course_id, title, body) VALUES (new.id, new.course_id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS lesson_fts_delete AFTER DELETE ON lesson BEGIN
+        DELETE FROM lesson_fts WHERE rowid = old.id;
+    END""",
+    # Backfill rows that existed before the search tables did
+    """INSERT INTO course_fts (rowid, title, body)
+        SELECT id, title, description || ' ' || content FROM course WHERE id NOT IN (SELECT rowid FROM course_fts)""",
+    """INSERT INTO lesson_fts (rowid, course_id, title, body)
+        SELECT id, course_id, title, content FROM lesson WHERE id NOT IN (SELECT rowid FROM lesson_fts)"""
+]
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS course_fts')
+        connection.exec_driver_sql('DROP TABLE IF EXISTS lesson_fts')
+
+@event.listens_for(db.metadata, 'before_drop')
+@event.listens_for(db.metadata, 'after_create')
+def forget_cached_users(target, connection, **kw):
+    # A reset or reseeded database reuses user ids for different accounts
+    user_cache.clear()
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text.lower()))
+
+def fts_hits(match, lessons=False):
+    """Return a (course_id, rank) subquery of courses whose own text, or with ``lessons`` a lesson, matches."""
+    if lessons:
+        hits = db.text(
+            "SELECT course_id, min(rank) AS rank FROM lesson_fts "
+            "WHERE lesson_fts MATCH :match AND rank MATCH 'bm25(0.0, 5.0, 1.0)' GROUP BY course_id"
+        )
+    else:
+        hits = db.text(
+            "SELECT rowid AS course_id, rank FROM course_fts "
+            "WHERE course_fts MATCH :match AND rank MATCH 'bm25(10.0, 1.0)'"
+        )
+    return hits.bindparams(match=match).columns(course_id=db.Integer, rank=db.Float).subquery()
+
+def search_courses(q=None, category=None, difficulty=None, page=1, per_page=None, method=None):
+    """Return (courses, has_more) for published courses matching text and filters.
+
+    Text matches course titles, descriptions and content as well as lesson
+    titles and bodies. ``method`` is 'fts' (default on SQLite) or 'like' (a
+    plain scan, used on other databases). With FTS, courses whose own text
+    matches come first, best matches first, followed by courses matched only
+    through their lessons.
+    """
+    per_page = per_page or app.config['PAGE_SIZE']
+    method = method or ('fts' if db.engine.dialect.name == 'sqlite' else 'like')
+    query = Course.query.filter_by(is_published=True)
+    if category:
+        query = query.filter(Course.category == category)
+    if difficulty:
+        query = query.filter(db.func.lower(Course.difficulty) == difficulty.lower())
+    
+    match = fts_query(q or '')
+    if match and method == 'fts':
+        # Ranking lessons means scoring every matching lesson, which for a
+        # common word is most of the table; course hits are a few hundred rows
+        # at most, so lessons are only ranked when those don't fill the page.
+        start = (page - 1) * per_page
+        own_hits = fts_hits(match)
+        items = query.join(own_hits, own_hits.c.course_id == Course.id) \
+            .order_by(own_hits.c.rank, Course.id).offset(start).limit(per_page + 1).all()
+        if len(items) <= per_page:
+            # IN keeps the MATCH a single subquery; as a join, SQLite reruns it per course
+            own_ids = db.select(own_hits.c.course_id)
+            own_total = start + len(items) if items else query.filter(Course.id.in_(own_ids)).count()
+            skipped = max(start - own_total, 0)
+            lesson_hits = fts_hits(match, lessons=True)
+            items += query.join(lesson_hits, lesson_hits.c.course_id == Course.id) \
+                .filter(Course.id.notin_(own_ids)) \
+                .order_by(lesson_hits.c.rank, Course.id).offset(skipped).limit(per_page + 1 - len(items)).all()
+        return items[:per_page], len(items) > per_page
+    elif match:
+        # % and _ in the search text match themselves, not any characters
+        like = '%' + re.sub(r'([\\%_])', r'\\\1', q.strip()) + '%'
+        
+        def contains(column):
+            return column.ilike(like, escape='\\')
+        
+        in_lessons = db.exists().where(Lesson.course_id == Course.id,
+                                       db.or_(contains(Lesson.title), contains(Lesson.content)))
+        query = query.filter(db.or_(contains(Course.title), contains(Course.description),
+                                    contains(Course.content), in_lessons)).order_by(Course.id)
+    else:
+        query = query.order_by(Course.id)
+    
+    items = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return items[:per_page], len(items) > per_page
+
+def search_args():
+    return {
+        'q': request.args.get('q', '').strip(),
+        'category': request.args.get('category', '').strip(),
+        'difficulty': request.args.get('difficulty', '').strip()
+    }
+
+def search_tags():
+    return ['catalog', 'search'] if any(search_args().values()) else ['catalog']
+
+# Pagination
+def keyset_page(query, column, after=None, per_page=None, descending=False):
+    """Return one page of a query ordered by a unique column and the cursor of the next page."""
+    per_page = per_page or app.config['PAGE_SIZE']
+    if after is not None:
+        query = query.filter(column < after if descending else column > after)
+    items = query.order_by(column.desc() if descending else column.asc()).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = getattr(items[-1], column.key)
+    return items, next_cursor
+
+def page_args():
+    """Read the keyset cursor and page size from the query string."""
+    after = request.args.get('after', type=int)
+    per_page = request.args.get('per_page', type=int) or app.config['PAGE_SIZE']
+    return after, max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+def get_enrollment_counts(user_ids):
+    """Return {user_id: {'enrolled': n, 'completed': n}} for the given users in one aggregate query."""
+    if not user_ids:
+        return {}
+    rows = db.session.query(
+        Progress.user_id,
+        db.func.count(Progress.id),
+        db.func.coalesce(db.func.sum(db.case((Progress.completed == True, 1), else_=0)), 0)
+    ).filter(Progress.user_id.in_(user_ids)).group_by(Progress.user_id)
+    return {user_id: {'enrolled': enrolled, 'completed': int(completed)} for user_id, enrolled, completed in rows}
+
+def get_lesson_counts(course_ids):
+    """Return {course_id: lesson count} for the given courses in one aggregate query."""
+    if not course_ids:
+        return {}
+    rows = db.session.query(Lesson.course_id, db.func.count(Lesson.id)).filter(
+        Lesson.course_id.in_(course_ids)
+    ).group_by(Lesson.course_id)
+    return dict(rows.all())
+
+def course_to_dict(course):
+    return {
+        'id': course.id,
+        'title': course.title,
+        'slug': course.slug,
+        'description': course.description,
+        'category': course.category,
+        'difficulty': course.difficulty,
+        'duration': course.duration,
+        'image': course.image,
+        'url': url_for('course_detail', slug=course.slug)
+    }
+
+def catalog_page_key(**kwargs):
+    return f"{request.endpoint}:{request.query_string.decode()}"
+
+def invalidate_course_pages(*slugs, catalog=True):
+    """Evict cached pages showing the given courses (and the catalog listings).
+
+    Search results match lesson text too, so they are always evicted.
+    """
+    tags = [f'course:{slug}' for slug in slugs if slug] + ['search']
+    if catalog:
+        tags.append('catalog')
+    page_cache.invalidate(*tags)
+
+# Course material search index
+def index_lesson(lesson, course):
+    search_index.add(f'lesson:{lesson.id}', f'{course.title}: {lesson.title}', f'/course/{course.slug}', lesson.content)
+
+def index_course(course, lessons=None):
+    """Index a published course and ``lessons`` (all of its lessons by default)."""
+    lessons = course.lessons if lessons is None else lessons
+    search_index.add(f'course:{course.id}', course.title, f'/course/{course.slug}',
+                     f'{course.description} {course.content}')
+    for lesson in lessons:
+        index_lesson(lesson, course)
+
+def queue_search_documents(*keys):
+    """Mark search documents as edited, in the caller's transaction."""
+    if keys:
+        db.session.execute(db.insert(SearchIndexChange), [{'key': key} for key in keys])
+
+def queue_course_documents(course, lesson_ids):
+    """Queue a course with its lessons: their entries carry the course's title, URL and visibility."""
+    queue_search_documents(f'course:{course.id}', *(f'lesson:{lesson_id}' for lesson_id in lesson_ids))
+
+def search_documents_queued():
+    """Call after committing queued documents: index them now unless the scheduler does."""
+    if app.config['SEARCH_INDEX_INTERVAL'] <= 0:
+        apply_search_index_changes()
+
+def apply_search_index_changes(chunk_size=500):
+    """Re-index the queued documents from the database and save the index once.
+
+    Returns the number of distinct documents updated.
+    """
+    # updating() always saves, which would make every worker reload the file
+    if db.session.query(SearchIndexChange.id).first() is None:
+        return 0
+    load_search_index()
+    with search_index.updating():
+        changes = db.session.query(SearchIndexChange.id, SearchIndexChange.key).order_by(SearchIndexChange.id).all()
+        keys = list(dict.fromkeys(key for _, key in changes))
+        for start in range(0, len(keys), chunk_size):
+            chunk = [key.split(':') for key in keys[start:start + chunk_size]]
+            courses = {course.id: course for course in Course.query.filter(
+                Course.id.in_([int(doc_id) for kind, doc_id in chunk if kind == 'course']))}
+            lessons = {lesson.id: lesson for lesson in Lesson.query.options(db.joinedload(Lesson.course)).filter(
+                Lesson.id.in_([int(doc_id) for kind, doc_id in chunk if kind == 'lesson']))}
+            for kind, doc_id in chunk:
+                if kind == 'course':
+                    course = courses.get(int(doc_id))
+                    if course is not None and course.is_published:
+                        index_course(course, [])
+                        continue
+                else:
+                    lesson = lessons.get(int(doc_id))
+                    if lesson is not None and lesson.course.is_published:
+                        index_lesson(lesson, lesson.course)
+                        continue
+                search_index.remove(f'{kind}:{doc_id}')
+        if changes:
+            # Another process may have applied the queue since it was checked
+            SearchIndexChange.query.filter(SearchIndexChange.id <= changes[-1].id).delete(synchronize_session=False)
+            db.session.commit()
+    return len(keys)
+
+def run_search_index_job():
+    with app.app_context():
+        apply_search_index_changes()
+
+search_index_job = PeriodicJob(run_search_index_job, app.config['SEARCH_INDEX_INTERVAL'], name='search-index')
+
+def rebuild_search_index():
+    with search_index.updating():
+        search_index.clear()
+        for course in Course.query.options(db.selectinload(Course.lessons)).filter_by(is_published=True):
+            index_course(course)
+
+def load_search_index():
+    """Load the persisted index, building it from the database the first time.
+
+    Once loaded, a newer file saved by another worker is picked up.
+    """
+    if search_index.loaded:
+        search_index.reload_if_changed()
+    elif not search_index.load():
+        rebuild_search_index()
+
+# Current user
+def current_user():
+    """Return a snapshot of the logged-in user, or None.
+
+    Loaded at most once per request (kept in ``g``) and served from
+    ``user_cache`` across requests, so most requests issue no user query.
+    """
+    user_id = session.get('user_id')
+    loaded = g.get('current_user')
+    if loaded is None or loaded[0] != user_id:
+        user = None
+        if user_id is not None:
+            user = user_cache.get(user_id)
+            if user is None:
+                row = db.session.get(User, user_id)
+                user = user_cache.put(row) if row else None
+        loaded = g.current_user = (user_id, user)
+    return loaded[1]
+
+@app.teardown_request
+def forget_current_user(exc):
+    # g outlives the request when the caller already pushed an app context
+    g.pop('current_user', None)
 
 # Admin decorator
 def admin_required(f):
@@ -73,37 +721,786 @@ def admin_required(f):
         if 'user_id' not in session:
             flash('Please login to access this page.', 'error')
             return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
+        user = current_user()
         if not user or not user.is_admin:
             flash('Access denied. Admin privileges required.', 'error')
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
+# Course statistics
+def bump_course_stats(course_id, **deltas):
+    """Apply counter deltas to a course's rollup row inside the current transaction."""
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    updated = CourseStats.query.filter_by(course_id=course_id).update(
+        {getattr(CourseStats, name): getattr(CourseStats, name) + value for name, value in deltas.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(CourseStats(course_id=course_id, **{name: deltas.get(name, 0) for name in COURSE_STATS_COUNTERS}))
+
+def compute_course_stats():
+    """Recompute the rollup counters for every course from the base tables."""
+    totals = {course_id: dict.fromkeys(COURSE_STATS_COUNTERS, 0)
+              for (course_id,) in db.session.query(Course.id)}
+    
+    progress_rows = db.session.query(
+        Progress.course_id,
+        db.func.count(Progress.id),
+        db.func.coalesce(db.func.sum(db.case((Progress.completed == True, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(Progress.progress_percentage), 0)
+    ).group_by(Progress.course_id)
+    for course_id, enrollments, completions, progress_sum in progress_rows:
+        if course_id in totals:
+            totals[course_id].update(enrollments=enrollments, completions=int(completions), progress_sum=int(progress_sum))
+    
+    quiz_rows = db.session.query(
+        QuizResult.course_id,
+        db.func.count(QuizResult.id),
+        db.func.coalesce(db.func.sum(QuizResult.score), 0)
+    ).group_by(QuizResult.course_id)
+    for course_id, attempts, score_sum in quiz_rows:
+        if course_id in totals:
+            totals[course_id].update(quiz_attempts=attempts, score_sum=int(score_sum))
+    
+    return totals
+
+def verify_course_stats():
+    """Compare the stored rollups with the base tables and return the drifted fields."""
+    expected = compute_course_stats()
+    stored = {row.course_id: row for row in CourseStats.query.all()}
+    drift = []
+    for course_id, counters in expected.items():
+        row = stored.get(course_id)
+        for name, value in counters.items():
+            actual = getattr(row, name) if row else 0
+            if actual != value:
+                drift.append((course_id, name, actual, value))
+    return drift
+
+def rebuild_course_stats():
+    """Rewrite every rollup row from the base tables."""
+    CourseStats.query.delete()
+    db.session.add_all([CourseStats(course_id=course_id, **counters)
+                        for course_id, counters in compute_course_stats().items()])
+    db.session.commit()
+
+def get_course_stats():
+    """Return enrollments, completions and average progress for every course.
+
+    Reads the maintained CourseStats rollups, so the cost is one query
+    proportional to the number of courses, not to the number of Progress rows.
+    """
+    rows = db.session.query(Course, CourseStats).outerjoin(
+        CourseStats, CourseStats.course_id == Course.id
+    ).order_by(Course.id).all()
+    
+    course_stats = []
+    for course, stats in rows:
+        enrollments = stats.enrollments if stats else 0
+        course_stats.append({
+            'course': course,
+            'enrollments': enrollments,
+            'completions': stats.completions if stats else 0,
+            'avg_progress': round(stats.progress_sum / enrollments, 2) if enrollments else 0,
+            'quiz_attempts': stats.quiz_attempts if stats else 0,
+            'avg_score': round(stats.score_sum / stats.quiz_attempts, 2) if stats and stats.quiz_attempts else 0
+        })
+    return course_stats
+
+# Quizzes
+def load_question_bank(bank):
+    """Create or replace a course's quiz from a question-bank dict (see question_bank/)."""
+    validate_bank(bank)
+    course = Course.query.filter_by(slug=bank['course']).first()
+    if course is None:
+        raise ValueError(f"No course with slug '{bank['course']}'")
+    quiz = Quiz.query.filter_by(course_id=course.id).first()
+    if quiz is None:
+        quiz = Quiz(course_id=course.id, version=0)
+        db.session.add(quiz)
+    quiz.title = bank.get('title') or f'{course.title} Quiz'
+    quiz.version += 1
+    quiz.questions = [
+        Question(position=position, text=q['question'], options=json.dumps(q['options']), correct=q['correct'])
+        for position, q in enumerate(bank['questions'])
+    ]
+    return quiz
+
+def load_question_banks(path):
+    quizzes = [load_question_bank(bank) for bank in read_banks(path)]
+    db.session.commit()
+    return quizzes
+
+def get_compiled_quiz(course_id):
+    """Return the compiled quiz of a course, or None when the course has no quiz.
+
+    Only the quiz id and version are read per call; questions are loaded and
+    compiled again only after the version changes.
+    """
+    row = db.session.query(Quiz.id, Quiz.version).filter_by(course_id=course_id).first()
+    if row is None:
+        return None
+    return quiz_cache.get(row.id, row.version,
+                          lambda: Quiz.query.options(eager(Quiz.questions, 'selectin')).get(row.id))
+
+def get_item_statistics(course_id):
+    """Share of correct answers per question over all attempts at the current quiz version."""
+    compiled = get_compiled_quiz(course_id)
+    if compiled is None:
+        return None
+    rows = db.session.query(QuizResult.correct_bits).filter_by(
+        quiz_id=compiled.quiz_id, quiz_version=compiled.version
+    )
+    attempts, correct_rate = item_statistics([bits for bits, in rows], len(compiled))
+    return {
+        'quiz_id': compiled.quiz_id,
+        'version': compiled.version,
+        'attempts': attempts,
+        'questions': [{
+            'position': position,
+            'text': question['text'],
+            'correct_rate': round(float(rate), 4)
+        } for position, (question, rate) in enumerate(zip(compiled.public['questions'], correct_rate))]
+    }
+
+# Learner events
+def lesson_percentage(completed_lessons, lesson_count):
+    return completed_lessons * 100 // lesson_count if lesson_count else 0
+
+def rescale_course_progress(course):
+    """Recompute a course's lesson percentages after its lesson count changed.
+
+    One UPDATE derives every percentage from the stored completion counts, so
+    no bitmap is read; learners who completed the course keep 100%.
+    """
+    completed_lessons = db.select(LessonProgress.completed_lessons).where(
+        LessonProgress.user_id == Progress.user_id,
+        LessonProgress.course_id == Progress.course_id
+    ).scalar_subquery()
+    percentage = db.func.coalesce(completed_lessons, 0) * 100 // course.lesson_count if course.lesson_count else 0
+    Progress.query.filter(Progress.course_id == course.id, Progress.completed == False).update(
+        {Progress.progress_percentage: percentage}, synchronize_session=False)
+    if course.lesson_count:
+        Progress.query.filter(Progress.course_id == course.id, Progress.completed == False,
+                              Progress.progress_percentage >= 100).update(
+            {Progress.completed: True, Progress.completed_at: datetime.utcnow()}, synchronize_session=False)
+    
+    completions, progress_sum = db.session.query(
+        db.func.coalesce(db.func.sum(db.case((Progress.completed == True, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(Progress.progress_percentage), 0)
+    ).filter(Progress.course_id == course.id).one()
+    stats = db.session.get(CourseStats, course.id)
+    if stats is not None:
+        stats.completions = completions
+        stats.progress_sum = progress_sum
+
+def add_lesson_slot(course, lesson, rescale=True):
+    """Give a new lesson the next bit position of its course."""
+    lesson.slot = course.lesson_slots or 0
+    course.lesson_slots = lesson.slot + 1
+    course.lesson_count = (course.lesson_count or 0) + 1
+    if rescale:
+        rescale_course_progress(course)
+
+def remove_lesson_slot(course, lesson, rescale=True):
+    """Take a deleted lesson out of the completion counts of learners who finished it.
+
+    On SQLite one UPDATE tests the bit with the ``has_bit`` SQL function, so
+    no bitmap is loaded into Python; other databases scan the course's rows.
+    """
+    if lesson.slot is not None:
+        finished = LessonProgress.query.filter(LessonProgress.course_id == course.id)
+        if db.engine.dialect.name == 'sqlite':
+            finished = finished.filter(db.func.has_bit(LessonProgress.bits, lesson.slot))
+        else:
+            rows = db.session.query(LessonProgress.id, LessonProgress.bits).filter_by(course_id=course.id)
+            finished = finished.filter(LessonProgress.id.in_(
+                [row_id for row_id, bits in rows if has_bit(bits, lesson.slot)]))
+        finished.update({LessonProgress.completed_lessons: LessonProgress.completed_lessons - 1},
+                        synchronize_session=False)
+    course.lesson_count -= 1
+    if rescale:
+        rescale_course_progress(course)
+
+def apply_learner_events(events):
+    """Write a batch of enroll, lesson and quiz events in one transaction.
+
+    Events are coalesced per (user_id, course_id) and each key is written with
+    one INSERT ... ON CONFLICT DO UPDATE per table, so a row another process
+    inserted meanwhile is updated instead of failing the batch. The lessons a
+    learner completed in the batch form one bitmap, which SQLite ORs into the
+    stored one with the ``bits_or`` SQL function and adds the newly set bits
+    to ``completed_lessons`` (a deleted lesson keeps its bit but no longer
+    counts); other databases merge the bitmaps in Python under a row lock. Existing Progress rows are read with
+    one query for the CourseStats deltas, applied once per course.
+    """
+    with app.app_context():
+        try:
+            is_sqlite = db.engine.dialect.name == 'sqlite'
+            if is_sqlite:
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            keys = {(event['user_id'], event['course_id']) for event in events}
+            before = {
+                (progress.user_id, progress.course_id): (bool(progress.completed), progress.progress_percentage or 0)
+                for progress in Progress.query.filter(db.tuple_(Progress.user_id, Progress.course_id).in_(keys))
+            }
+            batch = {}
+            deltas = {}
+            
+            for event in events:
+                key = (event['user_id'], event['course_id'])
+                entry = batch.setdefault(key, {'enrolled_at': event['at'], 'bits': b'', 'lessons_at': None, 'quiz': False})
+                entry['last_accessed'] = event['at']
+                if event['type'] == 'lesson':
+                    entry['bits'], _ = set_bit(entry['bits'], event['slot'])
+                    entry['lessons_at'] = event['at']
+                elif event['type'] == 'quiz':
+                    db.session.add(QuizResult(user_id=key[0], course_id=key[1], completed_at=event['at'],
+                                              **event['result']))
+                    entry['quiz'] = True
+                    course_deltas = deltas.setdefault(key[1], dict.fromkeys(COURSE_STATS_COUNTERS, 0))
+                    course_deltas['quiz_attempts'] += 1
+                    course_deltas['score_sum'] += event['result']['score']
+            
+            completed_lessons = {}
+            lesson_rows = [{'user_id': key[0], 'course_id': key[1], 'bits': entry['bits'],
+                            'completed_lessons': bit_count(entry['bits']), 'updated_at': entry['lessons_at']}
+                           for key, entry in batch.items() if entry['bits']]
+            if lesson_rows:
+                if not is_sqlite:
+                    stored = {
+                        (row.user_id, row.course_id): row
+                        for row in LessonProgress.query.filter(db.tuple_(LessonProgress.user_id, LessonProgress.course_id).in_(
+                            [(row['user_id'], row['course_id']) for row in lesson_rows])).with_for_update()
+                    }
+                    for row in lesson_rows:
+                        old = stored.get((row['user_id'], row['course_id']))
+                        if old is not None:
+                            row['bits'] = bits_or(old.bits, row['bits'])
+                            row['completed_lessons'] = old.completed_lessons + bit_count(row['bits']) - bit_count(old.bits)
+                stmt = insert(LessonProgress).values(lesson_rows)
+                bits = db.func.bits_or(LessonProgress.bits, stmt.excluded.bits) if is_sqlite else stmt.excluded.bits
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[LessonProgress.user_id, LessonProgress.course_id],
+                    set_={
+                        'bits': bits,
+                        'completed_lessons': LessonProgress.completed_lessons + db.func.bit_count(bits)
+                                             - db.func.bit_count(LessonProgress.bits)
+                                             if is_sqlite else stmt.excluded.completed_lessons,
+                        'updated_at': db.case((bits != LessonProgress.bits, stmt.excluded.updated_at),
+                                              else_=LessonProgress.updated_at)
+                    }
+                ).returning(LessonProgress.user_id, LessonProgress.course_id, LessonProgress.completed_lessons)
+                completed_lessons = {(user_id, course_id): count for user_id, course_id, count in db.session.execute(stmt)}
+            lesson_counts = dict(db.session.query(Course.id, Course.lesson_count).filter(
+                Course.id.in_({course_id for _, course_id in completed_lessons}))) if completed_lessons else {}
+            
+            progress_rows = []
+            for key, entry in batch.items():
+                was_completed, was_percentage = before.get(key, (False, 0))
+                completed, percentage = was_completed, was_percentage
+                if entry['quiz']:
+                    completed, percentage = True, 100
+                elif not was_completed and key in completed_lessons:
+                    percentage = lesson_percentage(completed_lessons[key], lesson_counts.get(key[1]))
+                    completed = percentage >= 100
+                progress_rows.append({
+                    'user_id': key[0], 'course_id': key[1], 'enrolled_at': entry['enrolled_at'],
+                    'last_accessed': entry['last_accessed'], 'completed': completed, 'progress_percentage': percentage,
+                    'completed_at': entry['last_accessed'] if completed and not was_completed else None
+                })
+                course_deltas = deltas.setdefault(key[1], dict.fromkeys(COURSE_STATS_COUNTERS, 0))
+                course_deltas['enrollments'] += key not in before
+                course_deltas['completions'] += completed and not was_completed
+                course_deltas['progress_sum'] += percentage - was_percentage
+            stmt = insert(Progress).values(progress_rows)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[Progress.user_id, Progress.course_id],
+                set_={
+                    'last_accessed': stmt.excluded.last_accessed,
+                    'completed': db.or_(Progress.completed, stmt.excluded.completed),
+                    'progress_percentage': stmt.excluded.progress_percentage,
+                    'completed_at': db.func.coalesce(Progress.completed_at, stmt.excluded.completed_at)
+                }
+            ))
+            for course_id, course_deltas in deltas.items():
+                bump_course_stats(course_id, **course_deltas)
+            
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def submit_learner_event(event):
+    # Give the request's pooled connection back first: a durable submit waits
+    # for the writer thread, which needs a connection of its own to commit.
+    db.session.close()
+    learner_events.submit(event)
+
+learner_events = EventWriter(
+    apply_learner_events,
+    max_queue=app.config['INGEST_MAX_QUEUE'],
+    batch_size=app.config['INGEST_BATCH_SIZE'],
+    flush_interval=app.config['INGEST_FLUSH_INTERVAL'],
+    durable=app.config['INGEST_DURABLE'],
+    timeout=app.config['INGEST_TIMEOUT']
+)
+
+def add_missing_columns():
+    """Add model columns missing from tables that predate them (as nullable columns)."""
+    inspector = db.inspect(db.engine)
+    # Quoted, since model names such as Lesson.order are SQL keywords
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {preparer.format_table(table)} '
+                                               f'ADD COLUMN {preparer.format_column(column)} {column_type}')
+
+def backfill_lesson_slots():
+    """Number the lessons of courses created before lesson progress tracking existed."""
+    course_ids = {course_id for course_id, in db.session.query(Lesson.course_id).filter(Lesson.slot == None)}
+    course_ids.update(course_id for course_id, in db.session.query(Course.id).filter(
+        db.or_(Course.lesson_count == None, Course.lesson_slots == None)))
+    for course in Course.query.filter(Course.id.in_(course_ids)):
+        lessons = Lesson.query.filter_by(course_id=course.id).order_by(Lesson.order, Lesson.id).all()
+        next_slot = max((lesson.slot for lesson in lessons if lesson.slot is not None), default=-1) + 1
+        for lesson in lessons:
+            if lesson.slot is None:
+                lesson.slot = next_slot
+                next_slot += 1
+        course.lesson_count = len(lessons)
+        course.lesson_slots = next_slot
+    db.session.commit()
+
+def dedupe_progress():
+    """Merge duplicate (user_id, course_id) Progress rows into one; returns the number removed."""
+    duplicates = db.session.query(Progress.user_id, Progress.course_id).group_by(
+        Progress.user_id, Progress.course_id
+    ).having(db.func.count(Progress.id) > 1).all()
+    removed = 0
+    for user_id, course_id in duplicates:
+        rows = Progress.query.filter_by(user_id=user_id, course_id=course_id).order_by(
+            Progress.progress_percentage.desc(), Progress.id
+        ).all()
+        keep = rows[0]
+        keep.completed = any(row.completed for row in rows)
+        keep.last_accessed = max((row.last_accessed for row in rows if row.last_accessed), default=keep.last_accessed)
+        keep.enrolled_at = min((row.enrolled_at for row in rows if row.enrolled_at), default=keep.enrolled_at)
+        for row in rows[1:]:
+            db.session.delete(row)
+            removed += 1
+    db.session.commit()
+    return removed
+
+def backfill_progress_dates():
+    """Date enrollments made before enrolled_at existed by their last access, the closest record kept."""
+    Progress.query.filter(Progress.enrolled_at == None).update(
+        {Progress.enrolled_at: Progress.last_accessed}, synchronize_session=False)
+    Progress.query.filter(Progress.completed == True, Progress.completed_at == None).update(
+        {Progress.completed_at: Progress.last_accessed}, synchronize_session=False)
+    db.session.commit()
+
+def create_missing_indexes():
+    """Create model indexes missing from tables that predate them; returns their names."""
+    inspector = db.inspect(db.engine)
+    created = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created.append(index.name)
+    return created
+
+def migrate_schema():
+    """Bring a database created by an older version up to the current models."""
+    add_missing_columns()
+    backfill_lesson_slots()
+    backfill_progress_dates()
+    if dedupe_progress():
+        # Enrollment counters were counting the duplicates
+        rebuild_course_stats()
+    return create_missing_indexes()
+
+# Analytics rollups
+def refresh_rollups(full=False, now=None):
+    """Recompute the daily rollups from the watermark (or from scratch) up to ``now``.
+
+    Returns the first day recomputed, or None for a full rebuild.
+    """
+    now = now or datetime.utcnow()
+    state = db.session.get(RollupState, 'daily_course') or RollupState(name='daily_course')
+    first_day = None
+    if not full and state.watermark is not None:
+        first_day = (state.watermark - timedelta(seconds=app.config['ROLLUP_LATE_SECONDS'])).date()
+    since = datetime.combine(first_day, datetime.min.time()) if first_day else None
+    
+    def per_day(column, *aggregates):
+        day = db.func.date(column, type_=db.Date)
+        query = db.session.query(column.class_.course_id, day, *aggregates).filter(column != None)
+        if since is not None:
+            query = query.filter(column >= since)
+        return query.group_by(column.class_.course_id, day)
+    
+    totals = {}
+    def add(rows, *names):
+        for course_id, day, *values in rows:
+            row = totals.setdefault((course_id, day), dict.fromkeys(ROLLUP_METRICS, 0))
+            row.update(zip(names, values))
+    add(per_day(Progress.enrolled_at, db.func.count(Progress.id)), 'enrollments')
+    add(per_day(Progress.completed_at, db.func.count(Progress.id)), 'completions')
+    add(per_day(QuizResult.completed_at, db.func.count(QuizResult.id), db.func.sum(QuizResult.score),
+                db.func.sum(QuizResult.total_questions)), 'quiz_attempts', 'score_sum', 'question_sum')
+    
+    stale = DailyCourseRollup.query
+    if first_day is not None:
+        stale = stale.filter(DailyCourseRollup.day >= first_day)
+    stale.delete(synchronize_session=False)
+    course_ids = {course_id for (course_id,) in db.session.query(Course.id)}
+    rows = [dict(values, course_id=course_id, day=day)
+            for (course_id, day), values in totals.items() if course_id in course_ids]
+    if rows:
+        db.session.execute(DailyCourseRollup.__table__.insert(), rows)
+    state.watermark = now
+    state.updated_at = datetime.utcnow()
+    db.session.add(state)
+    db.session.commit()
+    return first_day
+
+def run_rollup_job():
+    with app.app_context():
+        refresh_rollups()
+
+rollup_job = PeriodicJob(run_rollup_job, app.config['ROLLUP_INTERVAL'], name='analytics-rollup')
+
+def rollup_series(period, group, since, until, course_id=None, category=None):
+    """Read rollup rows for the filters and merge them into series (see rollups.build_series)."""
+    if group == 'category':
+        columns = (Course.category, Course.category)
+    else:
+        columns = (Course.id, Course.title)
+    query = db.session.query(
+        *columns, DailyCourseRollup.day,
+        *(db.func.sum(getattr(DailyCourseRollup, name)) for name in ROLLUP_METRICS)
+    ).join(Course, Course.id == DailyCourseRollup.course_id).filter(
+        DailyCourseRollup.day >= since, DailyCourseRollup.day <= until
+    )
+    if course_id is not None:
+        query = query.filter(Course.id == course_id)
+    if category:
+        query = query.filter(Course.category == category)
+    return build_series(query.group_by(columns[0], DailyCourseRollup.day).order_by(columns[0]), period)
+
+def analytics_args():
+    """Parse the series filters shared by the JSON and CSV endpoints; raises ValueError."""
+    period = request.args.get('period', 'day')
+    group = request.args.get('group', 'course')
+    if period not in PERIODS or group not in ('course', 'category'):
+        raise ValueError('period must be day or week and group course or category')
+    until = parse_day(request.args.get('until'), datetime.utcnow().date())
+    since = parse_day(request.args.get('since'), until - timedelta(days=app.config['ANALYTICS_DEFAULT_DAYS'] - 1))
+    return {'period': period, 'group': group, 'since': since, 'until': until,
+            'course_id': request.args.get('course_id', type=int), 'category': request.args.get('category')}
+
+def rollup_watermark():
+    state = db.session.get(RollupState, 'daily_course')
+    return state.watermark if state else None
+
+def cacheable(response, watermark):
+    """Let browsers and proxies reuse a rollup response until the next refresh."""
+    response.cache_control.private = True
+    response.cache_control.max_age = max(app.config['ROLLUP_INTERVAL'], 0)
+    if watermark is not None:
+        response.last_modified = watermark
+        response.set_etag(f'{watermark.isoformat()}:{request.query_string.decode()}')
+    return response.make_conditional(request)
+
+# Course recommendations
+def interaction_weights(user_ids=None):
+    """Return parallel lists of user ids, course ids and weights of learner activity (see recommendations.py)."""
+    best = db.session.query(
+        QuizResult.user_id, QuizResult.course_id,
+        db.func.max(QuizResult.score * 1.0 / QuizResult.total_questions).label('score')
+    ).filter(QuizResult.total_questions > 0)
+    query = db.session.query(Progress.user_id, Progress.course_id, Progress.completed)
+    if user_ids is None:
+        batches = [None]
+    else:
+        user_ids = sorted(user_ids)
+        batches = [user_ids[i:i + 500] for i in range(0, len(user_ids), 500)]
+    rows = []
+    for batch in batches:
+        scores, enrollments = best, query
+        if batch is not None:
+            scores = scores.filter(QuizResult.user_id.in_(batch))
+            enrollments = enrollments.filter(Progress.user_id.in_(batch))
+        scores = scores.group_by(QuizResult.user_id, QuizResult.course_id).subquery()
+        rows.extend(enrollments.add_columns(scores.c.score).outerjoin(scores, db.and_(
+            scores.c.user_id == Progress.user_id, scores.c.course_id == Progress.course_id
+        )))
+    weights = [1 + bool(completed) + (score or 0) for _, _, completed, score in rows]
+    return [row[0] for row in rows], [row[1] for row in rows], weights
+
+def changed_learners(since):
+    """Ids of learners who enrolled, progressed or took a quiz at or after ``since``."""
+    queries = [
+        db.select(Progress.user_id).where(Progress.enrolled_at >= since),
+        db.select(Progress.user_id).where(Progress.last_accessed >= since),
+        db.select(QuizResult.user_id).where(QuizResult.completed_at >= since)
+    ]
+    return {user_id for query in queries for user_id, in db.session.execute(query.distinct())}
+
+def get_recommender():
+    global recommender
+    if recommender is None:
+        from recommendations import Recommender
+        recommender = Recommender(app.config['RECOMMENDATION_MODEL_PATH'],
+                                  neighbours=app.config['RECOMMENDATION_NEIGHBOURS'])
+    return recommender
+
+def refresh_recommendations(full=False, now=None):
+    """Refit the model if stale, then rescore learners with activity since the last run.
+
+    A refit (or ``full``) rescores every learner and rewrites the fallback
+    list. Returns the number of learners rescored.
+    """
+    now = now or datetime.utcnow()
+    recommender = get_recommender()
+    state = db.session.get(RollupState, 'recommendations') or RollupState(name='recommendations')
+    # Another process may have refitted since this one last looked
+    recommender.reload_if_changed()
+    refit = full or not recommender.fitted or \
+        time.time() - recommender.built_at > app.config['RECOMMENDATION_REFIT_SECONDS']
+    if refit:
+        users, courses, weights = interaction_weights()
+        recommender.fit(users, courses, weights)
+        recommender.save()
+        learners = None
+    elif state.watermark is None:
+        learners = None
+        users, courses, weights = interaction_weights()
+    else:
+        # Same lateness window as the rollups, for events committed after the time they carry
+        learners = changed_learners(state.watermark - timedelta(seconds=app.config['ROLLUP_LATE_SECONDS']))
+        users, courses, weights = interaction_weights(learners)
+    
+    count = app.config['RECOMMENDATION_COUNT']
+    published = [course_id for course_id, in db.session.query(Course.id).filter_by(is_published=True)]
+    picks = recommender.recommend(users, courses, weights, count, published)
+    
+    stale = CourseRecommendation.query
+    if learners is not None:
+        stale = stale.filter(CourseRecommendation.user_id.in_(learners))
+    elif not refit:
+        stale = stale.filter(CourseRecommendation.user_id != None)
+    stale.delete(synchronize_session=False)
+    rows = [{'user_id': user_id, 'rank': rank, 'course_id': course_id, 'score': score}
+            for user_id, courses in picks.items() for rank, (course_id, score) in enumerate(courses)]
+    if refit:
+        rows.extend({'user_id': None, 'rank': rank, 'course_id': course_id, 'score': 0}
+                    for rank, course_id in enumerate(recommender.popular(count, published).tolist()))
+    if rows:
+        db.session.execute(CourseRecommendation.__table__.insert(), rows)
+    state.watermark = now
+    state.updated_at = datetime.utcnow()
+    db.session.add(state)
+    db.session.commit()
+    return len(picks)
+
+def run_recommendation_job():
+    with app.app_context():
+        refresh_recommendations()
+
+recommendation_job = PeriodicJob(run_recommendation_job, app.config['RECOMMENDATION_INTERVAL'], name='recommendations')
+
+def get_recommendations(user_id, exclude=()):
+    """Published courses precomputed for a learner, or the fallback list, minus ``exclude``."""
+    rows = db.session.query(CourseRecommendation.user_id, Course).join(
+        Course, Course.id == CourseRecommendation.course_id
+    ).filter(
+        db.or_(CourseRecommendation.user_id == user_id, CourseRecommendation.user_id == None),
+        Course.is_published == True
+    ).order_by(CourseRecommendation.rank).all()
+    courses = [course for owner, course in rows if owner is not None] or [course for _, course in rows]
+    return [course for course in courses if course.id not in exclude][:app.config['RECOMMENDATION_COUNT']]
+
+# Course import and export
+def upsert_course(data, course=None):
+    """Create or update a course from a validated import record; returns (course, lesson counts).
+
+    Lessons are matched by their order: matching lessons are updated in
+    place, so their completion bits stay valid, new orders are added and
+    lessons missing from the record are deleted.
+    """
+    fields = {name: value for name, value in data.items() if name != 'lessons'}
+    if course is None:
+        course = Course(lesson_count=0, lesson_slots=0, **fields)
+        course.stats = CourseStats()
+        db.session.add(course)
+    else:
+        for name, value in fields.items():
+            setattr(course, name, value)
+    
+    current, stale = {}, []
+    for lesson in sorted(course.lessons, key=lambda lesson: lesson.id):
+        if lesson.order in current:
+            stale.append(lesson)
+        else:
+            current[lesson.order] = lesson
+    counts = Counter()
+    for lesson_data in data['lessons']:
+        lesson = current.pop(lesson_data['order'], None)
+        if lesson is None:
+            lesson = Lesson(**lesson_data)
+            course.lessons.append(lesson)
+            add_lesson_slot(course, lesson, rescale=False)
+            counts['lessons_added'] += 1
+        else:
+            for name, value in lesson_data.items():
+                setattr(lesson, name, value)
+            counts['lessons_updated'] += 1
+    for lesson in stale + list(current.values()):
+        remove_lesson_slot(course, lesson, rescale=False)
+        course.lessons.remove(lesson)
+        queue_search_documents(f'lesson:{lesson.id}')
+        counts['lessons_removed'] += 1
+    if course.id is not None and (counts['lessons_added'] or counts['lessons_removed']):
+        rescale_course_progress(course)
+    return course, counts
+
+def import_courses(rows, batch_size=100, max_errors=100):
+    """Upsert courses by slug from ``read_courses`` rows, one transaction per batch.
+
+    Yields a progress dict after every committed batch; the last one also
+    lists the rejected lines (up to ``max_errors``). Each batch queues its
+    courses and lessons for the search index. Only one batch of courses is
+    held at a time.
+    """
+    progress = dict.fromkeys(('line', 'created', 'updated', 'lessons_added', 'lessons_updated',
+                              'lessons_removed', 'rejected'), 0)
+    errors = []
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        records = {}
+        for line, data, error in batch:
+            progress['line'] = line
+            if error is not None:
+                progress['rejected'] += 1
+                if len(errors) < max_errors:
+                    errors.append({'line': line, 'error': error})
+            else:
+                records[data['slug']] = data
+        existing = {course.slug: course for course in Course.query.filter(Course.slug.in_(records))
+                    .options(db.selectinload(Course.lessons))}
+        courses = []
+        for slug, data in records.items():
+            course, counts = upsert_course(data, existing.get(slug))
+            progress['updated' if slug in existing else 'created'] += 1
+            progress.update({name: progress[name] + value for name, value in counts.items()})
+            courses.append(course)
+        db.session.flush()
+        for course in courses:
+            queue_course_documents(course, [lesson.id for lesson in course.lessons])
+        db.session.commit()
+        db.session.expunge_all()
+        invalidate_course_pages(*records)
+        search_documents_queued()
+        yield dict(progress)
+    yield dict(progress, done=True, errors=errors)
+
+def export_courses(batch_size=200):
+    """Yield export records for every course, loading ``batch_size`` courses at a time."""
+    query = Course.query.order_by(Course.id).options(db.selectinload(Course.lessons))
+    for course in query.yield_per(batch_size):
+        yield course_record(course, course.lessons)
+
 # Routes
 @app.route('/')
+@page_cache.cached(key=catalog_page_key, tags=lambda: ['catalog'])
 def index():
     courses = Course.query.filter_by(is_published=True).all()
-    return render_template('index.html', courses=courses)
+    # Only anonymous pages are cached, so a signed-in learner's list is never shared
+    recommended = get_recommendations(session['user_id']) if 'user_id' in session else []
+    return render_template('index.html', courses=courses, recommended=recommended)
 
 @app.route('/courses')
+@page_cache.cached(key=catalog_page_key, tags=search_tags)
 def courses():
-    all_courses = Course.query.filter_by(is_published=True).all()
-    return render_template('courses.html', courses=all_courses)
+    after, per_page = page_args()
+    filters = search_args()
+    if any(filters.values()):
+        page = max(1, request.args.get('page', 1, type=int))
+        results, has_more = search_courses(page=page, per_page=per_page, **filters)
+        next_url = url_for('api_search', page=page + 1, per_page=per_page, **filters) if has_more else None
+        return render_template('courses.html', courses=results, next_url=next_url, filters=filters)
+    
+    results, next_cursor = keyset_page(Course.query.filter_by(is_published=True), Course.id, after, per_page)
+    next_url = url_for('api_courses', after=next_cursor, per_page=per_page) if next_cursor else None
+    return render_template('courses.html', courses=results, next_url=next_url, filters=filters)
+
+@app.route('/api/courses')
+@page_cache.cached(key=catalog_page_key, tags=lambda: ['catalog'])
+def api_courses():
+    after, per_page = page_args()
+    page, next_cursor = keyset_page(Course.query.filter_by(is_published=True), Course.id, after, per_page)
+    return jsonify({
+        'courses': [course_to_dict(course) for course in page],
+        'next_cursor': next_cursor,
+        'next_url': url_for('api_courses', after=next_cursor, per_page=per_page) if next_cursor else None
+    })
+
+@app.route('/api/search')
+@page_cache.cached(key=catalog_page_key, tags=lambda: ['catalog', 'search'])
+def api_search():
+    _, per_page = page_args()
+    page = max(1, request.args.get('page', 1, type=int))
+    filters = search_args()
+    results, has_more = search_courses(page=page, per_page=per_page, **filters)
+    return jsonify({
+        'courses': [course_to_dict(course) for course in results],
+        'page': page,
+        'next_url': url_for('api_search', page=page + 1, per_page=per_page, **filters) if has_more else None
+    })
 
 @app.route('/course/<slug>')
+@page_cache.cached(key=lambda slug: f'course:{slug}', tags=lambda slug: [f'course:{slug}'])
 def course_detail(slug):
     course = Course.query.filter_by(slug=slug, is_published=True).first_or_404()
     lessons = Lesson.query.filter_by(course_id=course.id).order_by(Lesson.order).all()
     
     user_progress = None
+    done_lessons = set()
     if 'user_id' in session:
         user_progress = Progress.query.filter_by(
             user_id=session['user_id'],
             course_id=course.id
         ).first()
+        bits = db.session.query(LessonProgress.bits).filter_by(
+            user_id=session['user_id'],
+            course_id=course.id
+        ).scalar()
+        if bits:
+            done_lessons = {lesson.id for lesson in lessons if lesson.slot is not None and has_bit(bits, lesson.slot)}
     
-    return render_template('course_detail.html', course=course, lessons=lessons, progress=user_progress)
+    return render_template('course_detail.html', course=course, lessons=lessons, progress=user_progress,
+                           done_lessons=done_lessons)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -120,7 +1517,11 @@ def register():
             flash('Email already registered!', 'error')
             return redirect(url_for('register'))
         
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HashingBusy as e:
+            flash(str(e), 'error')
+            return redirect(url_for('register'))
         new_user = User(username=username, email=email, password=hashed_password)
         
         db.session.add(new_user)
@@ -139,7 +1540,20 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = password_hasher.verify(user.password if user else None, password) and user is not None
+        except HashingBusy as e:
+            flash(str(e), 'error')
+            return render_template('login.html'), e.status
+        if valid and password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+            except HashingBusy:
+                # The old hash still verifies; upgrade it on a later login
+                pass
+        
+        if valid:
             session['user_id'] = user.id
             session['username'] = user.username
             session['is_admin'] = user.is_admin
@@ -165,43 +1579,36 @@ def dashboard():
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
-    progress_data = Progress.query.filter_by(user_id=user.id).all()
-    quiz_results = QuizResult.query.filter_by(user_id=user.id).order_by(QuizResult.completed_at.desc()).limit(5).all()
+    progress_data = Progress.query.options(eager(Progress.course)).filter_by(user_id=user.id).all()
+    quiz_results = QuizResult.query.options(eager(QuizResult.course)).filter_by(user_id=user.id).order_by(QuizResult.completed_at.desc()).limit(5).all()
     
-    enrolled_courses = []
-    for prog in progress_data:
-        course = Course.query.get(prog.course_id)
-        enrolled_courses.append({
-            'course': course,
-            'progress': prog
-        })
+    enrolled_courses = [{
+        'course': prog.course,
+        'progress': prog
+    } for prog in progress_data]
+    # Precomputed; enrollments made since the last refresh are dropped here
+    recommended = get_recommendations(user.id, exclude={prog.course_id for prog in progress_data})
     
-    return render_template('dashboard.html', user=user, enrolled_courses=enrolled_courses, quiz_results=quiz_results)
+    return render_template('dashboard.html', user=user, enrolled_courses=enrolled_courses, quiz_results=quiz_results,
+                           recommended=recommended)
 
 # ============ ADMIN ROUTES ============
 
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
+    course_stats = get_course_stats()
+    
     total_users = User.query.count()
-    total_courses = Course.query.count()
+    total_courses = len(course_stats)
     total_lessons = Lesson.query.count()
-    total_enrollments = Progress.query.count()
+    total_enrollments = sum(stat['enrollments'] for stat in course_stats)
     
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    recent_enrollments = Progress.query.order_by(Progress.last_accessed.desc()).limit(10).all()
-    
-    # Course statistics
-    course_stats = []
-    courses = Course.query.all()
-    for course in courses:
-        enrollments = Progress.query.filter_by(course_id=course.id).count()
-        completions = Progress.query.filter_by(course_id=course.id, completed=True).count()
-        course_stats.append({
-            'course': course,
-            'enrollments': enrollments,
-            'completions': completions
-        })
+    recent_enrollments = Progress.query.options(
+        db.joinedload(Progress.user),
+        db.joinedload(Progress.course)
+    ).order_by(Progress.last_accessed.desc()).limit(10).all()
     
     return render_template('admin/dashboard.html',
                          total_users=total_users,
@@ -215,8 +1622,23 @@ def admin_dashboard():
 @app.route('/admin/courses')
 @admin_required
 def admin_courses():
-    courses = Course.query.order_by(Course.created_at.desc()).all()
-    return render_template('admin/courses.html', courses=courses)
+    after, per_page = page_args()
+    courses, next_cursor = keyset_page(Course.query, Course.id, after, per_page, descending=True)
+    lesson_counts = get_lesson_counts([course.id for course in courses])
+    return render_template('admin/courses.html', courses=courses, lesson_counts=lesson_counts, next_cursor=next_cursor)
+
+@app.route('/api/admin/courses')
+@admin_required
+def api_admin_courses():
+    after, per_page = page_args()
+    courses, next_cursor = keyset_page(Course.query, Course.id, after, per_page, descending=True)
+    lesson_counts = get_lesson_counts([course.id for course in courses])
+    return jsonify({
+        'courses': [dict(course_to_dict(course),
+                         is_published=course.is_published,
+                         lessons=lesson_counts.get(course.id, 0)) for course in courses],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/admin/course/add', methods=['GET', 'POST'])
 @admin_required
@@ -244,20 +1666,59 @@ def admin_add_course():
             is_published=is_published
         )
         
+        new_course.stats = CourseStats()
         db.session.add(new_course)
+        db.session.flush()
+        queue_course_documents(new_course, [])
         db.session.commit()
+        invalidate_course_pages(new_course.slug)
+        search_documents_queued()
         
         flash('Course created successfully!', 'success')
         return redirect(url_for('admin_courses'))
     
     return render_template('admin/course_form.html', course=None)
 
+@app.route('/admin/courses/export')
+@admin_required
+def admin_export_courses():
+    chunks = jsonl_chunks(export_courses())
+    filename = 'courses.jsonl'
+    if request.args.get('format') == 'zip':
+        chunks, filename = zip_chunks(chunks), 'courses.zip'
+    return Response(stream_with_context(chunks),
+                    mimetype='application/zip' if filename.endswith('.zip') else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/admin/courses/import', methods=['POST'])
+@admin_required
+def admin_import_courses():
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Upload a .jsonl file or a .zip bundle as "file"'}), 400
+    try:
+        lines = open_lines(upload.stream)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def progress():
+        try:
+            for report in import_courses(read_courses(lines), batch_size=app.config['IMPORT_BATCH_SIZE']):
+                yield json.dumps(report) + '\n'
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Course import failed')
+            yield json.dumps({'error': f'Import stopped: {e}'}) + '\n'
+    
+    return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
+
 @app.route('/admin/course/edit/<int:course_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_edit_course(course_id):
     course = Course.query.get_or_404(course_id)
     
     if request.method == 'POST':
+        old_slug = course.slug
         course.title = request.form.get('title')
         course.slug = request.form.get('slug')
         course.description = request.form.get('description')
@@ -267,8 +1728,11 @@ def admin_edit_course(course_id):
         course.image = request.form.get('image')
         course.content = request.form.get('content')
         course.is_published = request.form.get('is_published') == 'on'
+        queue_course_documents(course, [lesson.id for lesson in course.lessons])
         
         db.session.commit()
+        invalidate_course_pages(old_slug, course.slug)
+        search_documents_queued()
         
         flash('Course updated successfully!', 'success')
         return redirect(url_for('admin_courses'))
@@ -279,8 +1743,12 @@ def admin_edit_course(course_id):
 @admin_required
 def admin_delete_course(course_id):
     course = Course.query.get_or_404(course_id)
+    slug = course.slug
+    queue_course_documents(course, [lesson.id for lesson in course.lessons])
     db.session.delete(course)
     db.session.commit()
+    invalidate_course_pages(slug)
+    search_documents_queued()
     
     flash('Course deleted successfully!', 'success')
     return redirect(url_for('admin_courses'))
@@ -314,7 +1782,12 @@ def admin_add_lesson(course_id):
         )
         
         db.session.add(new_lesson)
+        add_lesson_slot(course, new_lesson)
+        db.session.flush()
+        queue_search_documents(f'lesson:{new_lesson.id}')
         db.session.commit()
+        invalidate_course_pages(course.slug, catalog=False)
+        search_documents_queued()
         
         flash('Lesson added successfully!', 'success')
         return redirect(url_for('admin_course_lessons', course_id=course_id))
@@ -335,8 +1808,11 @@ def admin_edit_lesson(lesson_id):
         lesson.video_url = request.form.get('video_url')
         lesson.duration = request.form.get('duration')
         lesson.order = request.form.get('order', type=int)
+        queue_search_documents(f'lesson:{lesson.id}')
         
         db.session.commit()
+        invalidate_course_pages(course.slug, catalog=False)
+        search_documents_queued()
         
         flash('Lesson updated successfully!', 'success')
         return redirect(url_for('admin_course_lessons', course_id=lesson.course_id))
@@ -348,8 +1824,13 @@ def admin_edit_lesson(lesson_id):
 def admin_delete_lesson(lesson_id):
     lesson = Lesson.query.get_or_404(lesson_id)
     course_id = lesson.course_id
+    slug = lesson.course.slug
+    remove_lesson_slot(lesson.course, lesson)
+    queue_search_documents(f'lesson:{lesson_id}')
     db.session.delete(lesson)
     db.session.commit()
+    invalidate_course_pages(slug, catalog=False)
+    search_documents_queued()
     
     flash('Lesson deleted successfully!', 'success')
     return redirect(url_for('admin_course_lessons', course_id=course_id))
@@ -357,32 +1838,72 @@ def admin_delete_lesson(lesson_id):
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin/users.html', users=users)
+    after, per_page = page_args()
+    users, next_cursor = keyset_page(User.query, User.id, after, per_page, descending=True)
+    enrollment_counts = get_enrollment_counts([user.id for user in users])
+    
+    total_users = User.query.count()
+    total_admins = User.query.filter_by(is_admin=True).count()
+    active_learners = db.session.query(db.func.count(db.distinct(Progress.user_id))).scalar()
+    
+    return render_template('admin/users.html',
+                         users=users,
+                         enrollment_counts=enrollment_counts,
+                         next_cursor=next_cursor,
+                         total_users=total_users,
+                         total_admins=total_admins,
+                         active_learners=active_learners)
+
+@app.route('/admin/user/<int:user_id>/role', methods=['POST'])
+@admin_required
+def admin_set_user_role(user_id):
+    user = User.query.get_or_404(user_id)
+    make_admin = request.form.get('is_admin') == '1'
+    if user.id == session['user_id'] and not make_admin:
+        flash('You cannot remove your own admin role.', 'error')
+    else:
+        user.is_admin = make_admin
+        db.session.commit()
+        user_cache.invalidate(user.id)
+        flash(f"{user.username} is now {'an admin' if make_admin else 'a regular user'}.", 'success')
+    return redirect(request.referrer or url_for('admin_users'))
+
+@app.route('/api/admin/users')
+@admin_required
+def api_admin_users():
+    after, per_page = page_args()
+    users, next_cursor = keyset_page(User.query, User.id, after, per_page, descending=True)
+    enrollment_counts = get_enrollment_counts([user.id for user in users])
+    empty = {'enrolled': 0, 'completed': 0}
+    return jsonify({
+        'users': [dict({
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'is_admin': user.is_admin,
+            'created_at': user.created_at.isoformat() if user.created_at else None
+        }, **enrollment_counts.get(user.id, empty)) for user in users],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/admin/statistics')
 @admin_required
 def admin_statistics():
+    course_stats = get_course_stats()
+    
     # Overall statistics
     total_users = User.query.count()
-    total_courses = Course.query.count()
-    total_enrollments = Progress.query.count()
-    total_completions = Progress.query.filter_by(completed=True).count()
+    total_courses = len(course_stats)
+    total_enrollments = sum(stat['enrollments'] for stat in course_stats)
+    total_completions = sum(stat['completions'] for stat in course_stats)
     
     # Course enrollment data
-    course_data = []
-    courses = Course.query.all()
-    for course in courses:
-        enrollments = Progress.query.filter_by(course_id=course.id).count()
-        completions = Progress.query.filter_by(course_id=course.id, completed=True).count()
-        avg_progress = db.session.query(db.func.avg(Progress.progress_percentage)).filter_by(course_id=course.id).scalar() or 0
-        
-        course_data.append({
-            'title': course.title,
-            'enrollments': enrollments,
-            'completions': completions,
-            'avg_progress': round(avg_progress, 2)
-        })
+    course_data = [{
+        'title': stat['course'].title,
+        'enrollments': stat['enrollments'],
+        'completions': stat['completions'],
+        'avg_progress': stat['avg_progress']
+    } for stat in course_stats]
     
     return render_template('admin/statistics.html',
                          total_users=total_users,
@@ -391,6 +1912,96 @@ def admin_statistics():
                          total_completions=total_completions,
                          course_data=course_data)
 
+@app.route('/admin/cache-stats')
+@admin_required
+def admin_cache_stats():
+    return jsonify(page_cache.stats())
+
+@app.route('/admin/chat-stats')
+@admin_required
+def admin_chat_stats():
+    return jsonify(dict(chat_service.stats(), memory=conversations.stats()))
+
+@app.route('/admin/db-stats')
+@admin_required
+def admin_db_stats():
+    with db.engine.connect() as connection:
+        pragmas = current_pragmas(connection)
+    return jsonify({'dialect': db.engine.dialect.name, 'pool': db.engine.pool.status(), 'pragmas': pragmas})
+
+@app.route('/admin/auth-stats')
+@admin_required
+def admin_auth_stats():
+    return jsonify({'passwords': password_hasher.stats(), 'user_cache': user_cache.stats()})
+
+@app.route('/admin/ingest-stats')
+@admin_required
+def admin_ingest_stats():
+    return jsonify(learner_events.stats())
+
+def collect_component_stats():
+    components = {
+        'page_cache': page_cache.stats(),
+        'chat': chat_service.stats(),
+        'ingest': learner_events.stats(),
+        'passwords': password_hasher.stats(),
+        'user_cache': user_cache.stats(),
+        'rollups': rollup_job.stats(),
+        'recommendations': dict(recommendation_job.stats(), model=recommender.stats() if recommender else {}),
+        'search_index': search_index_job.stats()
+    }
+    for component, stats in components.items():
+        for key, value in stats.items():
+            for name, number in (value.items() if isinstance(value, dict) else [(None, value)]):
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    yield '_'.join(filter(None, (component, key, name))), {}, number
+
+metrics.add_collector(collect_component_stats)
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    if instrumentation is None:
+        return jsonify({'error': 'Instrumentation is disabled; set INSTRUMENTATION=1'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/analytics/series')
+@admin_required
+def admin_analytics_series():
+    try:
+        args = analytics_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    watermark = rollup_watermark()
+    response = jsonify(dict(
+        args,
+        since=args['since'].isoformat(),
+        until=args['until'].isoformat(),
+        watermark=watermark.isoformat() if watermark else None,
+        series=rollup_series(**args)
+    ))
+    return cacheable(response, watermark)
+
+@app.route('/admin/analytics/export.csv')
+@admin_required
+def admin_analytics_csv():
+    try:
+        args = analytics_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = Response(csv_chunks(rollup_series(**args)), mimetype='text/csv', headers={
+        'Content-Disposition': f"attachment; filename=analytics-{args['group']}-{args['period']}.csv"
+    })
+    return cacheable(response, rollup_watermark())
+
+@app.route('/admin/quiz/<int:course_id>/items')
+@admin_required
+def admin_quiz_items(course_id):
+    items = get_item_statistics(course_id)
+    if items is None:
+        return jsonify({'error': 'This course has no quiz'}), 404
+    return jsonify(items)
+
 # Regular user routes
 @app.route('/quiz/<int:course_id>')
 def quiz(course_id):
@@ -400,69 +2011,130 @@ def quiz(course_id):
     course = Course.query.get_or_404(course_id)
     return render_template('quiz.html', course=course)
 
+@app.route('/api/quiz/<int:course_id>')
+def api_quiz(course_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    compiled = get_compiled_quiz(course_id)
+    if compiled is None:
+        return jsonify({'error': 'This course has no quiz yet'}), 404
+    return jsonify(compiled.public)
+
 @app.route('/submit_quiz', methods=['POST'])
 def submit_quiz():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    data = request.json
+    data = request.get_json(silent=True) or {}
     course_id = data.get('course_id')
-    score = data.get('score')
-    total = data.get('total')
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return jsonify({'error': 'answers must be a list of option indexes'}), 400
     
-    quiz_result = QuizResult(
-        user_id=session['user_id'],
-        course_id=course_id,
-        score=score,
-        total_questions=total
-    )
+    compiled = get_compiled_quiz(course_id)
+    if compiled is None:
+        return jsonify({'error': 'This course has no quiz yet'}), 404
+    # Answers are graded against the questions the learner was shown
+    if data.get('version') != compiled.version:
+        return jsonify({'error': 'This quiz was updated while you were taking it. Please take the new version.',
+                        'version': compiled.version}), 409
+    score, correct = grade(compiled, answers)
+    total = len(compiled)
     
-    db.session.add(quiz_result)
-    
-    progress = Progress.query.filter_by(
-        user_id=session['user_id'],
-        course_id=course_id
-    ).first()
-    
-    if not progress:
-        progress = Progress(
-            user_id=session['user_id'],
-            course_id=course_id,
-            progress_percentage=100,
-            completed=True
-        )
-        db.session.add(progress)
-    else:
-        progress.progress_percentage = 100
-        progress.completed = True
-    
-    db.session.commit()
+    try:
+        submit_learner_event({
+            'type': 'quiz',
+            'user_id': session['user_id'],
+            'course_id': compiled.course_id,
+            'at': datetime.utcnow(),
+            'result': {
+                'score': score,
+                'total_questions': total,
+                'quiz_id': compiled.quiz_id,
+                'quiz_version': compiled.version,
+                'correct_bits': pack_correct(correct)
+            }
+        })
+    except IngestBusy as e:
+        return jsonify({'error': str(e)}), e.status
     
-    return jsonify({'success': True, 'message': 'Quiz submitted successfully!'})
+    return jsonify({
+        'success': True,
+        'message': 'Quiz submitted successfully!',
+        'score': score,
+        'total': total,
+        'correct': correct.tolist()
+    })
 
 @app.route('/enroll/<int:course_id>')
 def enroll(course_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    existing = Progress.query.filter_by(
+    course = Course.query.get_or_404(course_id)
+    existing = db.session.query(Progress.id).filter_by(
         user_id=session['user_id'],
         course_id=course_id
     ).first()
     
     if not existing:
-        progress = Progress(
-            user_id=session['user_id'],
-            course_id=course_id,
-            progress_percentage=0
-        )
-        db.session.add(progress)
-        db.session.commit()
-        flash('Successfully enrolled in the course!', 'success')
+        try:
+            submit_learner_event({
+                'type': 'enroll',
+                'user_id': session['user_id'],
+                'course_id': course_id,
+                'at': datetime.utcnow()
+            })
+            flash('Successfully enrolled in the course!', 'success')
+        except IngestBusy as e:
+            flash(str(e), 'error')
     else:
         flash('You are already enrolled in this course!', 'info')
     
-    return redirect(url_for('course_detail', slug=Course.query.get(course_id).slug))
+    return redirect(url_for('course_detail', slug=course.slug))
+
+@app.route('/lesson/<int:lesson_id>/complete', methods=['POST'])
+def complete_lesson(lesson_id):
+    if 'user_id' not in session:
+        if request.is_json:
+            return jsonify({'error': 'Not authenticated'}), 401
+        return redirect(url_for('login'))
+    
+    lesson = Lesson.query.get_or_404(lesson_id)
+    course_id = lesson.course_id
+    slug = lesson.course.slug
+    if lesson.slot is None:
+        # Lessons get their bit position from flask migrate-db; without one
+        # the completion cannot be recorded
+        app.logger.warning('Lesson %s has no progress slot; run flask migrate-db', lesson_id)
+        message = 'Progress for this lesson cannot be saved right now.'
+        if request.is_json:
+            return jsonify({'error': message}), 409
+        flash(message, 'error')
+        return redirect(url_for('course_detail', slug=slug))
+    try:
+        submit_learner_event({
+            'type': 'lesson',
+            'user_id': session['user_id'],
+            'course_id': course_id,
+            'slot': lesson.slot,
+            'at': datetime.utcnow()
+        })
+    except IngestBusy as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), e.status
+        flash(str(e), 'error')
+        return redirect(url_for('course_detail', slug=slug))
+    
+    if request.is_json:
+        progress = Progress.query.filter_by(user_id=session['user_id'], course_id=course_id).first()
+        return jsonify({
+            'success': True,
+            'progress_percentage': progress.progress_percentage if progress else 0,
+            'completed': bool(progress and progress.completed)
+        })
+    return redirect(url_for('course_detail', slug=slug))
 
 @app.route('/about')
 def about():
@@ -476,6 +2148,44 @@ def contact():
 def chatbot():
     return render_template('chatbot.html')
 
+def chat_user_key():
+    """Rate-limit key for the chat gateway: the user id, or the client address for guests."""
+    return session.get('user_id') or request.remote_addr
+
+def chat_session_id():
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    return session['chat_id']
+
+def chat_context(chat_id):
+    return build_context(conversations.history(chat_id),
+                         app.config['CHAT_CONTEXT_TOKENS'],
+                         app.config['CHAT_RECENT_TURNS'])
+
+def course_material(message):
+    load_search_index()
+    return search_index.search(message, k=app.config['CHAT_GROUNDING_PASSAGES'])
+
+def grounding_text(hits):
+    if not hits:
+        return None
+    passages = '\n'.join(f'[{i}] {hit.title} ({hit.url}): {hit.text}' for i, hit in enumerate(hits, 1))
+    return f'Relevant Oguz AI Academy course material (use it and point students to it when it helps):\n{passages}'
+
+def direct_answer(hits):
+    """Answer from course material alone when the best passage matches the question closely."""
+    if hits and hits[0].confidence >= app.config['CHAT_DIRECT_ANSWER_CONFIDENCE'] \
+            and hits[0].coverage >= app.config['CHAT_DIRECT_ANSWER_COVERAGE']:
+        return f'{hits[0].text}\n\n📖 From **{hits[0].title}**: {hits[0].url}'
+    return None
+
+def hit_sources(hits):
+    return [{'title': hit.title, 'url': hit.url} for hit in hits]
+
+def remember_exchange(chat_id, user_message, bot_message):
+    conversations.append(chat_id, USER, user_message)
+    conversations.append(chat_id, ASSISTANT, bot_message)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
@@ -485,52 +2195,139 @@ def chat():
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
         
-        # OpenRouter API call with DeepSeek
-        import requests
-        
-        api_key = os.getenv('OPENROUTER_API_KEY', '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')
-        
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'http://localhost:5000',
-            'X-Title': 'Oguz AI Academy Chatbot'
-        }
-        
-        payload = {
-            'model': 'deepseek/deepseek-chat',
-            'messages': [
-                {
-                    'role': 'system',
-                    'content': 'You are a helpful AI learning assistant for Oguz AI Academy. Help students with questions about AI, machine learning, deep learning, and programming. Be friendly, educational, and encourage learning.'
-                },
-                {
-                    'role': 'user',
-                    'content': user_message
-                }
-            ]
-        }
-        
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            bot_message = result['choices'][0]['message']['content']
-            return jsonify({'message': bot_message})
-        else:
-            return jsonify({'error': 'API request failed', 'details': response.text}), 500
-            
+        chat_id = chat_session_id()
+        hits = course_material(user_message)
+        bot_message = direct_answer(hits)
+        if bot_message is None:
+            bot_message = chat_service.complete(user_message, user_key=chat_user_key(),
+                                                context=chat_context(chat_id), grounding=grounding_text(hits))
+        remember_exchange(chat_id, user_message, bot_message)
+        return jsonify({'message': bot_message, 'sources': hit_sources(hits)})
+    
+    except ChatError as e:
+        return jsonify({'error': str(e), 'details': e.details}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json or {}
+    user_message = data.get('message')
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    chat_id = chat_session_id()
+    hits = course_material(user_message)
+    answer = direct_answer(hits)
+    if answer is not None:
+        tokens = iter([answer])
+    else:
+        tokens = chat_service.stream(user_message, user_key=chat_user_key(),
+                                     context=chat_context(chat_id), grounding=grounding_text(hits))
+    
+    # Wait for the first token so admission and upstream errors still get a
+    # proper status code instead of an error event.
+    try:
+        first = next(tokens, None)
+    except ChatError as e:
+        return jsonify({'error': str(e), 'details': e.details}), e.status
+    
+    def events():
+        # The WSGI server closes this generator when the client goes away,
+        # which in turn closes the upstream stream.
+        parts = []
+        try:
+            if first is not None:
+                parts.append(first)
+                yield sse_event({'token': first})
+            for token in tokens:
+                parts.append(token)
+                yield sse_event({'token': token})
+            remember_exchange(chat_id, user_message, ''.join(parts))
+            yield sse_event({'sources': hit_sources(hits)}, event='done')
+        except ChatError as e:
+            yield sse_event({'error': str(e), 'details': e.details}, event='error')
+        except Exception as e:
+            yield sse_event({'error': str(e)}, event='error')
+        finally:
+            if hasattr(tokens, 'close'):
+                tokens.close()
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/chat/reset', methods=['POST'])
+def chat_reset():
+    if 'chat_id' in session:
+        conversations.clear(session['chat_id'])
+    return jsonify({'success': True})
+
+# Health checks for load balancers and orchestrators
+@app.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and answering; touches nothing else."""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the database answers with the current schema and writes are being accepted."""
+    checks = {}
+    try:
+        # The newest table, so a worker running ahead of `flask init-db` reports not ready
+        db.session.execute(db.select(CourseRecommendation.id).limit(1))
+        checks['database'] = 'ok'
+    except Exception as e:
+        db.session.rollback()
+        checks['database'] = f'error: {e.__class__.__name__}'
+    ingest = learner_events.stats()
+    checks['ingest'] = 'ok' if ingest['queued'] < app.config['INGEST_MAX_QUEUE'] * 0.9 else 'saturated'
+    ready = all(value == 'ok' for value in checks.values())
+    response = jsonify({'status': 'ready' if ready else 'unavailable', 'checks': checks})
+    response.cache_control.no_store = True
+    return response, 200 if ready else 503
+
+def generate_synthetic_data(scale, seed=42, batch_size=5000, password='password'):
+    """Bulk-insert a synthetic catalog and learners at ``scale`` (see synthetic.py).
+
+    Rows are buffered per table and written with executemany INSERTs, one
+    transaction per batch. Before a table is flushed, the tables it
+    references are flushed, so foreign keys always point at written rows.
+    """
+    tables = {name: db.metadata.tables[name] for name in SYNTHETIC_TABLES}
+    start_ids = {name: (db.session.query(db.func.max(table.c.id)).scalar() or 0) + 1
+                 for name, table in tables.items()}
+    buffers = {name: [] for name in SYNTHETIC_TABLES}
+    counts = Counter()
+    
+    def flush(upto):
+        for name in SYNTHETIC_TABLES[:SYNTHETIC_TABLES.index(upto) + 1]:
+            if buffers[name]:
+                db.session.execute(tables[name].insert(), buffers[name])
+                counts[name] += len(buffers[name])
+                buffers[name] = []
+        db.session.commit()
+    
+    rows = synthetic_rows(scale, seed, start_ids, password_hasher.hash(password), datetime.utcnow())
+    for name, row in rows:
+        buffers[name].append(row)
+        if len(buffers[name]) >= batch_size:
+            flush(name)
+    flush(SYNTHETIC_TABLES[-1])
+    
+    rebuild_course_stats()
+    refresh_rollups(full=True)
+    refresh_recommendations(full=True)
+    rebuild_search_index()
+    invalidate_course_pages()
+    return counts
+
 def init_db():
     with app.app_context():
         db.create_all()
+        migrate_schema()
         
         # Create admin user if not exists
         admin = User.query.filter_by(username='admin').first()
@@ -538,7 +2335,7 @@ def init_db():
             admin = User(
                 username='admin',
                 email='admin@oguzai.com',
-                password=generate_password_hash('admin123', method='pbkdf2:sha256'),
+                password=generate_password_hash('admin123', method=app.config['PASSWORD_HASH_METHOD']),
                 is_admin=True
             )
             db.session.add(admin)
@@ -566,7 +2363,135 @@ def init_db():
             
             db.session.commit()
             print("Database initialized with sample courses!")
+        
+        if CourseStats.query.count() == 0:
+            rebuild_course_stats()
+        
+        if Quiz.query.count() == 0 and os.path.isdir(app.config['QUESTION_BANK_PATH']):
+            load_question_banks(app.config['QUESTION_BANK_PATH'])
+        
+        load_search_index()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create and migrate the schema and seed an empty database; run once per deploy."""
+    init_db()
+    print("Database ready.")
+
+@app.cli.command('rebuild-course-stats')
+def rebuild_course_stats_command():
+    """Recompute the per-course rollup counters from the base tables."""
+    drift = verify_course_stats()
+    rebuild_course_stats()
+    print(f"Course stats rebuilt ({len(drift)} drifted counters corrected).")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the course material search index from the database."""
+    rebuild_search_index()
+    print(f"Search index rebuilt with {len(search_index)} documents.")
+
+@app.cli.command('load-question-bank')
+@click.argument('paths', nargs=-1, required=True)
+def load_question_bank_command(paths):
+    """Load quiz question banks from JSON files or directories."""
+    for path in paths:
+        for quiz in load_question_banks(path):
+            print(f"{quiz.course.slug}: {len(quiz.questions)} questions (version {quiz.version})")
+
+@app.cli.command('generate-data')
+@click.option('--scale', type=click.Choice(list(SCALES)), default='small', show_default=True)
+@click.option('--users', type=int, help='Override the number of learners.')
+@click.option('--courses', type=int, help='Override the number of courses.')
+@click.option('--lessons-per-course', type=int)
+@click.option('--enrollments-per-user', type=int)
+@click.option('--quiz-attempts-per-user', type=int)
+@click.option('--seed', type=int, default=42, show_default=True)
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+@click.option('--password', default='password', show_default=True, help='Password of every generated learner.')
+def generate_data_command(scale, seed, batch_size, password, **overrides):
+    """Add synthetic courses, learners, progress and quiz results."""
+    scale = SCALES[scale]._replace(**{name: value for name, value in overrides.items() if value is not None})
+    init_db()
+    start = time.perf_counter()
+    counts = generate_synthetic_data(scale, seed, batch_size, password)
+    for name in SYNTHETIC_TABLES:
+        print(f"{name}: {counts[name]} rows")
+    print(f"Generated in {time.perf_counter() - start:.1f}s; learners log in as learner<id> / {password}.")
+
+@app.cli.command('import-courses')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=None, help='Courses per transaction.')
+def import_courses_command(path, batch_size):
+    """Upsert courses and lessons from a .jsonl file or a .zip bundle."""
+    with open(path, 'rb') as f:
+        for report in import_courses(read_courses(open_lines(f)), batch_size or app.config['IMPORT_BATCH_SIZE']):
+            print(f"line {report['line']}: {report['created']} created, {report['updated']} updated, "
+                  f"{report['rejected']} rejected")
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    if report['rejected']:
+        raise SystemExit(1)
+
+@app.cli.command('export-courses')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_courses_command(path):
+    """Write every course and its lessons to a .jsonl file (or a .zip bundle)."""
+    chunks = jsonl_chunks(export_courses())
+    with open(path, 'wb') as f:
+        for chunk in zip_chunks(chunks) if path.endswith('.zip') else chunks:
+            f.write(chunk)
+    print(f"Courses exported to {path}.")
+
+@app.cli.command('refresh-rollups')
+@click.option('--full', is_flag=True, help='Rebuild every day instead of starting from the watermark.')
+def refresh_rollups_command(full):
+    """Fold new enrollments, completions and quiz results into the daily rollups."""
+    first_day = refresh_rollups(full=full)
+    print(f"Rollups refreshed from {first_day.isoformat() if first_day else 'the beginning'}.")
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Run the periodic background jobs until interrupted; run one per deployment."""
+    jobs = [job for job in (rollup_job, recommendation_job, search_index_job) if job.interval > 0]
+    if not jobs:
+        print("No background jobs enabled.")
+        return
+    for job in jobs:
+        job.ensure_started()
+        print(f"{job.name}: every {job.interval}s")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command('refresh-recommendations')
+@click.option('--full', is_flag=True, help='Refit the co-enrollment model and rescore every learner.')
+def refresh_recommendations_command(full):
+    """Rescore learners with new activity, refitting the model when it is stale."""
+    learners = refresh_recommendations(full=full)
+    stats = get_recommender().stats()
+    print(f"Recommendations refreshed for {learners} learners "
+          f"({stats['items']} courses, {stats['similarities']} similarities).")
+
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Add missing columns and indexes and merge duplicate enrollments."""
+    created = migrate_schema()
+    print(f"Schema up to date ({len(created)} indexes created).")
+
+@app.cli.command('verify-course-stats')
+def verify_course_stats_command():
+    """Report rollup counters that disagree with the base tables."""
+    drift = verify_course_stats()
+    for course_id, name, actual, expected in drift:
+        print(f"course {course_id}: {name} is {actual}, expected {expected}")
+    if drift:
+        raise SystemExit(1)
+    print("Course stats are consistent.")
 
 if __name__ == '__main__':
+    # Development server (one process); use serve.py in production
     init_db()
     app.run(debug=False, host='0.0.0.0',port=8030)
\ No newline at end of file
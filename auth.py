@@ -0,0 +1,132 @@
+"""Login and session helpers: password hashing off the request path, cached users.
+
+``PasswordHasher`` runs Werkzeug's hash checks in a bounded thread pool.
+The key derivation functions release the GIL, so at most ``max_workers``
+checks use CPU at once, and no more than ``max_queue`` wait behind them.
+Past that, ``HashingBusy`` (HTTP 503) is raised instead of piling up login
+requests during a storm. Hashes made with other parameters than the
+configured method are reported by ``needs_rehash`` so they can be upgraded
+on the next successful login.
+
+``UserCache`` keeps a small snapshot of recently seen users for ``ttl``
+seconds. It is per process, so a role change made in another worker shows
+up here at most ``ttl`` seconds later; the worker making the change
+invalidates its entry immediately.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    status = 503
+
+
+class PasswordHasher:
+    def __init__(self, method='pbkdf2:sha256:600000', max_workers=4, max_queue=32):
+        self.method = method
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.counters = dict.fromkeys(('verified', 'hashed', 'rejected'), 0)
+
+    @cached_property
+    def prefix(self):
+        return self._prefix(self.dummy_hash)
+
+    @cached_property
+    def dummy_hash(self):
+        # Checked against when the user does not exist, so the response time
+        # does not reveal which usernames are registered
+        return generate_password_hash(os.urandom(16).hex(), method=self.method)
+
+    @staticmethod
+    def _prefix(pwhash):
+        # "pbkdf2:sha256:600000$salt$hash" -> "pbkdf2:sha256:600000"
+        return pwhash.split('$', 1)[0]
+
+    def verify(self, pwhash, password):
+        self._count('verified')
+        return self._run(check_password_hash, pwhash or self.dummy_hash, password or '')
+
+    def hash(self, password):
+        self._count('hashed')
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def needs_rehash(self, pwhash):
+        return self._prefix(pwhash) != self.prefix
+
+    def stats(self):
+        return dict(self.counters, method=self.method, max_workers=self.max_workers, max_queue=self.max_queue)
+
+    def _run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingBusy('Too many logins at once, please try again in a moment')
+        try:
+            return self._pool().submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _pool(self):
+        # Created lazily and again after a fork, so each worker owns its threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='password-hash')
+            return self._executor
+
+
+CachedUser = namedtuple('CachedUser', 'id username is_admin')
+
+
+class UserCache:
+    def __init__(self, ttl=30, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._users.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user):
+        snapshot = CachedUser(user.id, user.username, bool(user.is_admin))
+        with self._lock:
+            self._users[user.id] = (time.monotonic() + self.ttl, snapshot)
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        return {'size': len(self._users), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
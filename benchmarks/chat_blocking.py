@@ -0,0 +1,111 @@
+"""Catalog throughput while chat requests wait on a slow upstream.
+
+A chat request holds its WSGI thread until the upstream answers. This starts
+serve.py with one worker and --threads threads, pointed at the local mock
+LLM answering after --delay seconds. It loads /courses and /course/<slug>
+for --duration seconds in three runs:
+
+1. no chat traffic;
+2. --chatters clients posting /chat back to back, with CHAT_MAX_WAITING=0
+   (every thread may wait on the upstream);
+3. the same chat load with serve.py's default CHAT_MAX_WAITING (half the
+   threads); chats beyond it are answered 503 at once.
+
+    python benchmarks/chat_blocking.py --threads 4 --chatters 8 --delay 2
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from worker_scaling import ROOT, client_process, free_port, prepare, wait_ready
+from mock_llm import MockLLMServer
+
+
+def chat_loop(base_url, index, deadline, statuses):
+    import httpx
+
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        i = 0
+        while time.monotonic() < deadline:
+            try:
+                status = client.post('/chat', json={'message': f'tell me a story number {index}-{i}'}).status_code
+            except httpx.TransportError:
+                status = 'error'
+            statuses.append(status)
+            if status != 200:
+                time.sleep(0.05)
+            i += 1
+
+
+def measure(args, paths, chatters, env):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--skip-init', '--no-jobs', '--workers', '1',
+         '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=dict(os.environ, **env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(base_url, server)
+        client_process(base_url, paths, args.concurrency, 1.0, multiprocessing.SimpleQueue())
+
+        deadline = time.monotonic() + args.duration + args.delay
+        statuses = []
+        chats = [threading.Thread(target=chat_loop, args=(base_url, i, deadline, statuses))
+                 for i in range(chatters)]
+        for chat in chats:
+            chat.start()
+        # Let the chat requests occupy their threads before measuring
+        time.sleep(min(args.delay, 1.0) if chatters else 0)
+
+        results = multiprocessing.SimpleQueue()
+        start = time.perf_counter()
+        client_process(base_url, paths, args.concurrency, args.duration, results)
+        elapsed = time.perf_counter() - start
+        served, errors = results.get()
+        for chat in chats:
+            chat.join()
+        return served / elapsed, errors, statuses
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=args.timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4, help='threads of the single worker')
+    parser.add_argument('--chatters', type=int, default=8, help='clients posting /chat back to back')
+    parser.add_argument('--delay', type=float, default=2.0, help='upstream answer time in seconds')
+    parser.add_argument('--concurrency', type=int, default=8, help='catalog connections')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=int, default=40)
+    args = parser.parse_args()
+
+    upstream = MockLLMServer(('127.0.0.1', 0), delay=args.delay).start()
+    paths = prepare(args.scale, args.seed)
+    env = {'CHAT_API_URL': upstream.url, 'CHAT_RATE_PER_MINUTE': '0', 'CHAT_CACHE_SIZE': '0'}
+    runs = [
+        ('no chat', 0, {}),
+        ('chat, no limit', args.chatters, {'CHAT_MAX_WAITING': '0'}),
+        ('chat, default limit', args.chatters, {}),
+    ]
+    print(f'1 worker x {args.threads} threads, upstream answers in {args.delay:.1f}s, '
+          f'{args.chatters} chat clients, {args.concurrency} catalog connections')
+    print(f'{"run":<20} {"catalog req/s":>14} {"errors":>7} {"chats ok":>9} {"chats 503":>10}')
+    for label, chatters, overrides in runs:
+        rate, errors, statuses = measure(args, paths, chatters, dict(env, **overrides))
+        print(f'{label:<20} {rate:14.0f} {errors:7d} {statuses.count(200):9d} {statuses.count(503):10d}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
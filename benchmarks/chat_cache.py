@@ -0,0 +1,62 @@
+"""Chat cache and request-coalescing benchmark against a local mock LLM.
+
+Sends a burst of concurrent, trivially different phrasings of the same
+question to /chat and checks that only one upstream call was made, then
+repeats the burst to measure cached latency. The app runs on a temporary
+database holding the sample catalog, which /chat searches for course
+material.
+
+    python benchmarks/chat_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_llm import MockLLMServer
+
+server = MockLLMServer(('127.0.0.1', 0), delay=0.5).start()
+os.environ['CHAT_API_URL'] = server.url
+# /chat grounds answers in the course catalog, so it needs a real schema
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'chat.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+
+from app import app, chat_service, init_db
+
+CONCURRENCY = 32
+PHRASINGS = ['What is overfitting?', 'what is overfitting', '  What  is OVERFITTING ?  ']
+
+
+def ask(i):
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.post('/chat', json={'message': PHRASINGS[i % len(PHRASINGS)]})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return time.perf_counter() - start
+
+
+def burst(label):
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        latencies = sorted(pool.map(ask, range(CONCURRENCY)))
+    print(f'{label:<6} requests={CONCURRENCY} p50={latencies[len(latencies) // 2] * 1000:.1f} ms '
+          f'max={latencies[-1] * 1000:.1f} ms upstream={server.requests_served}')
+
+
+def main():
+    init_db()
+    burst('cold')
+    burst('warm')
+    print(chat_service.stats())
+    if server.requests_served != 1:
+        print(f'FAIL: expected 1 upstream call, got {server.requests_served}')
+        return 1
+    print('OK: identical questions were served by a single upstream call')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Load test for the async chat gateway against a local mock LLM.
+
+The same number of request threads (standing in for WSGI worker threads)
+sends unique questions while the gateway concurrency limit is varied.
+Throughput should follow the gateway limit, not the thread count. A second
+run injects 429 responses to exercise the jittered retries. The app runs on a
+temporary database holding the sample catalog, which /chat searches for
+course material.
+
+    python benchmarks/chat_gateway_load.py
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_llm import MockLLMServer
+
+UPSTREAM_DELAY = 0.25
+server = MockLLMServer(('127.0.0.1', 0), delay=UPSTREAM_DELAY).start()
+os.environ['CHAT_API_URL'] = server.url
+# /chat grounds answers in the course catalog, so it needs a real schema
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'chat.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+
+from app import app, chat_service, init_db
+from chat_gateway import ChatGateway
+from chatbot import ChatCache
+
+REQUESTS = 64
+THREADS = 64
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+
+def run(concurrency, label):
+    chat_service.cache = ChatCache(max_entries=0)
+    chat_service.gateway = ChatGateway(max_concurrency=concurrency, max_queue=REQUESTS,
+                                       rate_per_minute=0, backoff_base=0.05)
+
+    def ask(i):
+        response = app.test_client().post('/chat', json={'message': f'{label} question {i}'})
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        statuses = list(pool.map(ask, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    stats = chat_service.gateway.stats()
+    chat_service.gateway.close()
+    ok = statuses.count(200)
+    print(f'{label:<8} concurrency={concurrency:<3} ok={ok}/{REQUESTS} '
+          f'throughput={ok / elapsed:6.1f} req/s retries={stats["retries"]}')
+    return ok, ok / elapsed
+
+
+def main():
+    init_db()
+    results = [run(c, 'steady') for c in CONCURRENCY_LEVELS]
+    server.fail_rate = 0.2
+    flaky_ok, _ = run(16, 'flaky')
+
+    if any(ok < REQUESTS for ok, _ in results):
+        print('FAIL: not every chat request was answered')
+        return 1
+    # A request fails only if all its attempts get a 429 (0.2 ** 4 each)
+    if flaky_ok < REQUESTS * 0.9:
+        print(f'FAIL: retries recovered only {flaky_ok}/{REQUESTS} requests')
+        return 1
+    throughput = [rate for _, rate in results]
+    ideal = CONCURRENCY_LEVELS[1] / CONCURRENCY_LEVELS[0]
+    if throughput[1] < throughput[0] * ideal * 0.6:
+        print('FAIL: throughput does not scale with gateway concurrency')
+        return 1
+    print('OK: throughput scales with gateway concurrency')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Check which chat questions are answered straight from course material.
+
+Seeds a temporary database with the sample catalog and runs each question
+through the same retrieval and ``direct_answer`` decision as /chat. A
+question is only answered from the index when its best passage both scores
+close to a full match and contains most of the question's terms. Questions
+that share a common word or two with a course, but are mostly about things
+the catalog does not cover, must go to the model.
+
+    python benchmarks/chat_grounding.py
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'grounding.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+os.environ.setdefault('ROLLUP_INTERVAL', '0')
+os.environ.setdefault('RECOMMENDATION_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db, course_material, direct_answer
+
+# (question, answered from the index?)
+CASES = [
+    ('What is overfitting in machine learning models?', False),
+    ('how do I learn deep learning with python?', False),
+    ('How do I deploy kubernetes clusters for machine learning?', False),
+    ('machine learning fundamentals supervised unsupervised', True),
+]
+
+
+def main():
+    init_db()
+    failures = 0
+    with app.app_context():
+        for question, expected in CASES:
+            hits = course_material(question)
+            direct = direct_answer(hits) is not None
+            best = hits[0] if hits else None
+            detail = f'confidence {best.confidence:.2f} coverage {best.coverage:.2f}' if best else 'no hits'
+            status = 'ok  ' if direct == expected else 'FAIL'
+            failures += direct != expected
+            print(f'{status} {"index" if direct else "model"}  {question!r} ({detail})')
+    print(f'{failures} routing failures')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
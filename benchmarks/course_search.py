@@ -0,0 +1,94 @@
+"""FTS5 versus LIKE benchmark for the course search API.
+
+Bulk-loads a file-backed SQLite database with synthetic courses and lessons
+(the FTS triggers index them on insert), then times the same text queries
+through search_courses() with method='fts' and method='like'. Exits 1 if FTS
+is slower than LIKE for any query by more than --slack milliseconds: for a
+word in nearly every course LIKE stops at the first page in id order, while
+FTS has to rank every match.
+
+    python benchmarks/course_search.py --lessons 100000
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, Course, Lesson, search_courses
+
+# A Zipf-distributed vocabulary: a few very common words and a long tail
+WORDS = ('model data network layer training loss gradient tensor vision language agent reward '
+         'policy token embedding kernel feature cluster tree forest boosting bias variance '
+         'regularization dropout attention transformer encoder decoder sequence pixel image').split()
+WORDS += [f'term{i}' for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(WORDS))))
+QUERIES = ['model', 'attention transformer', 'dropout', 'term150', 'term4000 term90', 'xylophone']
+
+
+def paragraph(rng, n):
+    return '<p>' + ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=n)) + '</p>'
+
+
+def seed(num_courses, num_lessons, rng):
+    db.create_all()
+    db.session.execute(db.insert(Course), [{
+        'title': f'Course {c}', 'slug': f'course-{c}', 'description': paragraph(rng, 20),
+        'category': rng.choice(['ML', 'DL', 'NLP', 'CV']), 'difficulty': rng.choice(['Beginner', 'Intermediate', 'Advanced']),
+        'duration': '4 weeks', 'image': '📘', 'content': paragraph(rng, 60), 'is_published': True
+    } for c in range(num_courses)])
+    batch = []
+    for i in range(num_lessons):
+        batch.append({'course_id': i % num_courses + 1, 'title': f'Lesson {i}', 'content': paragraph(rng, 150), 'order': i})
+        if len(batch) == 5000:
+            db.session.execute(db.insert(Lesson), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Lesson), batch)
+    db.session.execute(db.update(Lesson).where(Lesson.id == num_lessons // 2).values(content='<p>xylophone</p>'))
+    db.session.commit()
+
+
+def time_query(method, query, repeat):
+    search_courses(query, per_page=20, method=method)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results, _ = search_courses(query, per_page=20, method=method)
+    return (time.perf_counter() - start) / repeat * 1000, len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courses', type=int, default=500)
+    parser.add_argument('--lessons', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--slack', type=float, default=2.0, help='milliseconds FTS may trail LIKE by')
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(args.courses, args.lessons, random.Random(7))
+        print(f'seeded {args.courses} courses / {args.lessons} lessons in {time.perf_counter() - start:.1f} s')
+        slower = []
+        for query in QUERIES:
+            fts_ms, fts_n = time_query('fts', query, args.repeat)
+            like_ms, like_n = time_query('like', query, args.repeat)
+            print(f'{query!r:<25} fts={fts_ms:8.1f} ms ({fts_n:>2} hits)   like={like_ms:8.1f} ms ({like_n:>2} hits)   '
+                  f'speedup={like_ms / fts_ms:5.1f}x')
+            if fts_ms > like_ms + args.slack:
+                slower.append(query)
+    os.remove(DB_PATH)
+    if slower:
+        print(f'FAIL: FTS is slower than LIKE for {", ".join(map(repr, slower))}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Query-count benchmark for the admin course statistics.
+
+Seeds an in-memory database with a growing number of courses and
+enrollments, then counts the SQL statements issued by /admin and
+/admin/statistics. The count must stay the same as the catalog grows.
+
+    python benchmarks/course_stats.py
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db, User, Course, Progress, rebuild_course_stats
+
+SCALES = [10, 100, 500]
+ENROLLMENTS_PER_COURSE = 20
+
+
+def seed(num_courses):
+    db.drop_all()
+    db.create_all()
+    admin = User(username='admin', email='admin@example.com',
+                 password=generate_password_hash('admin'), is_admin=True)
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', password='x')
+                for i in range(ENROLLMENTS_PER_COURSE)]
+    db.session.add(admin)
+    db.session.add_all(students)
+    db.session.flush()
+    for c in range(num_courses):
+        course = Course(title=f'Course {c}', slug=f'course-{c}', description='d',
+                        category='Bench', difficulty='Beginner', duration='1 week',
+                        image='📘', content='<p>c</p>')
+        db.session.add(course)
+        db.session.flush()
+        db.session.add_all([Progress(user_id=s.id, course_id=course.id,
+                                     completed=(i % 3 == 0),
+                                     progress_percentage=100 if i % 3 == 0 else 40)
+                            for i, s in enumerate(students)])
+    db.session.commit()
+    rebuild_course_stats()
+    return admin.id
+
+
+def measure(client, path):
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        start = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200, (path, response.status_code)
+    return len(statements), elapsed
+
+
+def main():
+    results = {}
+    with app.app_context():
+        for num_courses in SCALES:
+            admin_id = seed(num_courses)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = admin_id
+                sess['is_admin'] = True
+            for path in ('/admin', '/admin/statistics'):
+                queries, elapsed = measure(client, path)
+                results.setdefault(path, []).append(queries)
+                print(f'{path:<20} courses={num_courses:<5} queries={queries:<3} time={elapsed * 1000:.1f} ms')
+
+    for path, counts in results.items():
+        if len(set(counts)) != 1:
+            print(f'FAIL: {path} query count grows with course count: {counts}')
+            return 1
+    print('OK: query count is constant across scales')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""SQL statement count check for the user dashboard.
+
+Enrolls a student in a growing number of courses and asserts that /dashboard
+issues the same, bounded number of statements for every loading strategy.
+
+    python benchmarks/dashboard_queries.py
+"""
+import os
+import sys
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, User, Course, Progress, QuizResult
+
+SCALES = [1, 10, 100]
+# One more than the enrollments and quiz results need: the precomputed
+# recommendations are read with a single statement
+MAX_STATEMENTS = {'joined': 4, 'selectin': 6, 'subquery': 6}
+
+
+def seed(num_courses):
+    db.drop_all()
+    db.create_all()
+    student = User(username='student', email='student@example.com', password='x')
+    db.session.add(student)
+    db.session.flush()
+    for c in range(num_courses):
+        course = Course(title=f'Course {c}', slug=f'course-{c}', description='d',
+                        category='Bench', difficulty='Beginner', duration='1 week',
+                        image='📘', content='<p>c</p>')
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(Progress(user_id=student.id, course_id=course.id, progress_percentage=50))
+        db.session.add(QuizResult(user_id=student.id, course_id=course.id, score=5, total_questions=10))
+    db.session.commit()
+    return student.id
+
+
+def count_statements(client, path):
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200, response.status_code
+    return len(statements)
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        for strategy, limit in MAX_STATEMENTS.items():
+            app.config['DASHBOARD_LOADING'] = strategy
+            for num_courses in SCALES:
+                student_id = seed(num_courses)
+                client = app.test_client()
+                with client.session_transaction() as sess:
+                    sess['user_id'] = student_id
+                statements = count_statements(client, '/dashboard')
+                ok = statements <= limit
+                failures += not ok
+                print(f'{strategy:<9} enrollments={num_courses:<4} statements={statements:<3} {"ok" if ok else "FAIL"}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Load test for quiz submission: per-request commits vs batched write-behind.
+
+Many client threads post /submit_quiz at once against a file-backed SQLite
+database (a whole class submitting together). The run is repeated with each
+submission committed on its own, as before, and through the batched event
+writer. For each mode it reports accepted submissions per second, commits
+per second and failed requests.
+
+    python benchmarks/ingest_load.py --threads 32 --submissions 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'ingest.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import app as academy
+from app import app, db, User, Progress, QuizResult, init_db, verify_course_stats
+
+ANSWERS = [1, 1, 0, 1, 2, 1, 0, 1, 1, 1]
+
+
+class DirectWriter:
+    """Commit every event in its own transaction, like the routes used to."""
+
+    durable = True
+
+    def submit(self, event):
+        academy.apply_learner_events([event])
+
+    def flush(self):
+        pass
+
+
+def seed(num_users):
+    db.session.query(QuizResult).delete()
+    db.session.query(Progress).delete()
+    db.session.query(User).filter(User.username.like('student%')).delete(synchronize_session=False)
+    db.session.commit()
+    users = [User(username=f'student{i}', email=f'student{i}@example.com', password='x')
+             for i in range(num_users)]
+    db.session.add_all(users)
+    db.session.commit()
+    academy.rebuild_course_stats()
+    return [user.id for user in users]
+
+
+def run(user_ids, submissions):
+    version = academy.get_compiled_quiz(1).version
+    commits = []
+    failures = []
+    record_commit = lambda conn: commits.append(1)
+    event.listen(db.engine, 'commit', record_commit)
+
+    def student(user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        for _ in range(submissions):
+            try:
+                response = client.post('/submit_quiz', json={'course_id': 1, 'version': version, 'answers': ANSWERS})
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+            except Exception as e:
+                failures.append(type(e).__name__)
+
+    threads = [threading.Thread(target=student, args=(user_id,)) for user_id in user_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    academy.learner_events.flush()
+    elapsed = time.perf_counter() - start
+    event.remove(db.engine, 'commit', record_commit)
+    return elapsed, len(commits), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--submissions', type=int, default=20, help='quiz submissions per thread')
+    args = parser.parse_args()
+
+    init_db()
+    batched = academy.learner_events
+    total = args.threads * args.submissions
+    results = {}
+    with app.app_context():
+        for mode, writer in (('per-request', DirectWriter()), ('batched', batched)):
+            academy.learner_events = writer
+            user_ids = seed(args.threads)
+            elapsed, commits, failures = run(user_ids, args.submissions)
+            accepted = total - len(failures)
+            results[mode] = accepted / elapsed
+            print(f'{mode:<12} accepted={accepted / elapsed:7.0f}/s commits={commits / elapsed:6.0f}/s '
+                  f'({commits} commits for {accepted} submissions) failed={len(failures)}')
+            db.session.expire_all()
+            assert not verify_course_stats(), 'course stats drifted'
+        academy.learner_events = batched
+
+    return 0 if results['batched'] > results['per-request'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
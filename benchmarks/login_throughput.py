@@ -0,0 +1,139 @@
+"""Login-storm and admin-path benchmark.
+
+1. Cost of one password check for a few hashing methods, to choose
+   PASSWORD_HASH_METHOD for the hardware.
+2. Many threads logging in at once: hashing in the request thread (as
+   before) vs the bounded pool. The pool bounds waiting time by rejecting
+   overflow with 503 instead of queueing every login behind the CPU.
+3. SQL statements per admin request with the user cache warm.
+4. A stored hash with old parameters is upgraded on login.
+
+    python benchmarks/login_throughput.py --threads 16 --logins 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import app as academy
+from app import app, db, User, init_db
+from auth import PasswordHasher
+
+METHODS = ['pbkdf2:sha256:600000', 'pbkdf2:sha256:260000', 'scrypt:32768:8:1']
+PASSWORD = 'correct horse battery staple'
+
+
+class InlineHasher(PasswordHasher):
+    """Hash in the calling thread with no admission limit, like the old login route."""
+
+    def _run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def hash_costs():
+    for method in METHODS:
+        pwhash = generate_password_hash(PASSWORD, method=method)
+        start = time.perf_counter()
+        for _ in range(3):
+            check_password_hash(pwhash, PASSWORD)
+        print(f'verify  {method:<24} {(time.perf_counter() - start) / 3 * 1000:7.1f} ms')
+
+
+def seed_students(count, pwhash):
+    User.query.filter(User.username.like('student%')).delete(synchronize_session=False)
+    db.session.add_all([User(username=f'student{i}', email=f'student{i}@example.com', password=pwhash)
+                        for i in range(count)])
+    db.session.commit()
+
+
+def login_storm(hasher, threads, logins):
+    academy.password_hasher = hasher
+    latencies = []
+    statuses = []
+
+    def student(i):
+        client = app.test_client()
+        for _ in range(logins):
+            start = time.perf_counter()
+            response = client.post('/login', data={'username': f'student{i}', 'password': PASSWORD})
+            if response.status_code == 302:
+                latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=student, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), statuses.count(503)
+
+
+def admin_statements(client):
+    statements = []
+    record = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.get('/admin/cache-stats')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return [s for s in statements if 'FROM "user"' in s or 'FROM user' in s]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=3, help='logins per thread')
+    args = parser.parse_args()
+
+    hash_costs()
+    init_db()
+    method = app.config['PASSWORD_HASH_METHOD']
+    workers = app.config['PASSWORD_HASH_WORKERS']
+    pooled = academy.password_hasher
+    with app.app_context():
+        seed_students(args.threads, generate_password_hash(PASSWORD, method=method))
+        for name, hasher in (('inline', InlineHasher(method)),
+                             (f'pool({workers}+{workers * 2})', PasswordHasher(method, workers, workers * 2))):
+            rate, p50, p99, rejected = login_storm(hasher, args.threads, args.logins)
+            print(f'login   {name:<14} {rate:6.1f} logins/s  p50={p50 * 1000:6.0f} ms  '
+                  f'p99={p99 * 1000:6.0f} ms (successful logins)  rejected={rejected}')
+        academy.password_hasher = pooled
+
+        admin = User.query.filter_by(username='admin').first()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin.id
+        academy.user_cache.invalidate(admin.id)
+        db.session.expunge_all()
+        cold = admin_statements(client)
+        warm = admin_statements(client)
+        print(f'admin   user queries per request: cold={len(cold)} warm={len(warm)}')
+
+        legacy = User(username='legacy', email='legacy@example.com',
+                      password=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000'))
+        db.session.add(legacy)
+        db.session.commit()
+        app.test_client().post('/login', data={'username': 'legacy', 'password': PASSWORD})
+        db.session.expire_all()
+        upgraded = db.session.get(User, legacy.id).password.split('$', 1)[0]
+        print(f'rehash  pbkdf2:sha256:1000 -> {upgraded}')
+
+    return 0 if not warm and upgraded == pooled.prefix else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
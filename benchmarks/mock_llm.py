@@ -0,0 +1,114 @@
+"""Local stand-in for the OpenRouter chat completions endpoint.
+
+Answers every POST after a configurable delay and counts the requests it
+served, so the chat benchmarks can run without network access. Requests
+with ``"stream": true`` are answered word by word as server-sent events, and
+``fail_rate`` makes a fraction of requests answer 429 to exercise retries.
+
+    python benchmarks/mock_llm.py --port 8099 --delay 0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, delay=0.2, token_delay=0.05, fail_rate=0.0):
+        super().__init__(address, MockLLMHandler)
+        self.delay = delay
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.requests_served = 0
+        self.streams_cancelled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1/chat/completions'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.requests_served += 1
+        if random.random() < self.server.fail_rate:
+            body = b'{"error": "rate limited"}'
+            self.send_response(429)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        time.sleep(self.server.delay)
+
+        question = payload['messages'][-1]['content']
+        answer = f'Mock answer to: {question}'
+        if payload.get('stream'):
+            return self.stream(answer)
+
+        body = json.dumps({
+            'choices': [{'message': {'role': 'assistant', 'content': answer}}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def stream(self, answer):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for word in answer.split(' '):
+                chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+                self.write_chunk(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+                time.sleep(self.server.token_delay)
+            self.write_chunk(b'data: [DONE]\n\n')
+            self.write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            with self.server.lock:
+                self.server.streams_cancelled += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.05)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockLLMServer((args.host, args.port), delay=args.delay, token_delay=args.token_delay,
+                           fail_rate=args.fail_rate)
+    print(f'Mock LLM listening on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
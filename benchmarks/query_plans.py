@@ -0,0 +1,147 @@
+"""Check that the queries behind the app's routes are served by indexes.
+
+Seeds a SQLite database, requests every main route as an anonymous visitor,
+a student and an admin, and records each SQL statement issued. It then runs
+EXPLAIN QUERY PLAN on every distinct statement and fails when a filtered
+query scans a table without an index, or when a query sorts a whole table to
+return a page. A scan is accepted only for unfiltered reads: whole-table
+listings, and pages walked in primary-key order.
+
+    python benchmarks/query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+os.environ['PAGE_CACHE_BACKEND'] = 'none'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import (app, db, init_db, User, Course, Lesson, Progress, learner_events, backfill_lesson_slots,
+                 Quiz, rebuild_course_stats)
+
+NUM_COURSES = 200
+NUM_STUDENTS = 500
+ANSWERS = [1, 1, 0, 1, 2, 1, 0, 1, 1, 1]
+
+# Tables that stay tiny (one row per course at most)
+ALLOWED_SCANS = {'quiz', 'course_stats'}
+
+
+def seed():
+    init_db()
+    courses = [Course(title=f'Course {c}', slug=f'course-{c}', description='Neural networks and learning',
+                      category='Deep Learning' if c % 2 else 'Machine Learning', difficulty='Beginner',
+                      duration='4 weeks', image='📘', content='<p>Gradient descent</p>')
+               for c in range(NUM_COURSES)]
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', password='x')
+                for i in range(NUM_STUDENTS)]
+    db.session.add_all(courses + students)
+    db.session.flush()
+    db.session.add_all([Lesson(course_id=course.id, title=f'Lesson {n}', content='<p>Backpropagation</p>', order=n)
+                        for course in courses for n in range(5)])
+    db.session.add_all([Progress(user_id=student.id, course_id=courses[(i + k) % NUM_COURSES].id,
+                                 progress_percentage=40)
+                        for i, student in enumerate(students) for k in range(3)])
+    db.session.commit()
+    backfill_lesson_slots()
+    rebuild_course_stats()
+    return students[0].id, User.query.filter_by(username='admin').first().id
+
+
+def client_for(user_id=None):
+    client = app.test_client()
+    if user_id:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['is_admin'] = db.session.get(User, user_id).is_admin
+    return client
+
+
+def capture(requests):
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            statements.setdefault(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for client, method, path, body in requests:
+            response = client.open(path, method=method, json=body)
+            assert response.status_code < 400, (path, response.status_code)
+        learner_events.flush()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def problems(statement, plan):
+    details = [row[-1] for row in plan]
+    filtered = ' WHERE ' in statement
+    paged = ' LIMIT ' in statement
+    found = []
+    for detail in details:
+        if not detail.startswith('SCAN ') or ' USING ' in detail or 'VIRTUAL TABLE' in detail \
+                or 'CONSTANT ROW' in detail:
+            continue
+        table = detail.split()[1]
+        if table in ALLOWED_SCANS or table.startswith(('anon_', '(')):
+            continue
+        if filtered:
+            found.append(detail)
+    # Ranked full-text results are sorted after matching, which is expected
+    if paged and ' MATCH ' not in statement and any(detail.startswith('USE TEMP B-TREE FOR ORDER BY') for detail in details):
+        found.append('sorts the whole result to return one page')
+    return found
+
+
+def main():
+    with app.app_context():
+        student_id, admin_id = seed()
+        visitor, student, admin = client_for(), client_for(student_id), client_for(admin_id)
+        # Read directly, so the requests below still compile the quiz
+        quiz_version = db.session.query(Quiz.version).filter_by(course_id=1).scalar()
+        requests = [
+            (visitor, 'GET', '/', None),
+            (visitor, 'GET', '/courses', None),
+            (visitor, 'GET', '/courses?category=Deep+Learning', None),
+            (visitor, 'GET', '/api/courses?per_page=10', None),
+            (visitor, 'GET', '/api/search?q=neural', None),
+            (visitor, 'GET', '/course/course-5', None),
+            (student, 'GET', '/course/course-5', None),
+            (student, 'GET', '/enroll/10', None),
+            (student, 'POST', '/lesson/3/complete', {}),
+            (student, 'GET', '/dashboard', None),
+            (student, 'GET', '/quiz/1', None),
+            (student, 'GET', '/api/quiz/1', None),
+            (student, 'POST', '/submit_quiz', {'course_id': 1, 'version': quiz_version, 'answers': ANSWERS}),
+            (admin, 'GET', '/admin', None),
+            (admin, 'GET', '/admin/statistics', None),
+            (admin, 'GET', '/admin/courses', None),
+            (admin, 'GET', '/api/admin/courses', None),
+            (admin, 'GET', '/admin/users', None),
+            (admin, 'GET', '/api/admin/users', None),
+            (admin, 'GET', '/admin/course/3/lessons', None),
+            (admin, 'GET', '/admin/quiz/1/items', None),
+        ]
+        statements = capture(requests)
+
+        failures = 0
+        with db.engine.connect() as connection:
+            for statement, parameters in statements.items():
+                plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                found = problems(statement, plan)
+                if found:
+                    failures += 1
+                    print('NO INDEX: ' + '; '.join(found))
+                    print('    ' + ' '.join(statement.split())[-300:])
+        print(f'{len(statements)} distinct statements checked, {failures} not served by an index')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Offline evaluation of course recommendations: hit rate and latency.
+
+1. Hit rate. For every learner with at least two enrollments, the latest one
+   is held out and the model is fitted on everything else. A hit is counted
+   when the held-out course is in the learner's top --count. The
+   most-enrolled list, minus the learner's own courses, is scored the same
+   way as a baseline.
+2. Time to fit the model, to score every learner, and to run a full refresh.
+   Also an incremental refresh after --new-enrollments enrollments. Both
+   refreshes include the database writes.
+3. /dashboard and / for a signed-in learner: p50 and p99 latency and SQL
+   statements per request, served from the precomputed rows.
+
+A temporary database is seeded with the synthetic data generator. Learners
+there favour one category, so co-enrollment carries signal beyond
+popularity. To evaluate on real enrollments, point DATABASE_URL at a copy
+of the production database and pass --existing.
+
+    python benchmarks/recommendations.py --scale medium --count 6
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'recommendations.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+os.environ.setdefault('RECOMMENDATION_MODEL_PATH', os.path.join(tempfile.mkdtemp(), 'recommendations.npz'))
+os.environ.setdefault('PAGE_CACHE_BACKEND', 'none')
+os.environ.setdefault('ROLLUP_INTERVAL', '0')
+os.environ.setdefault('RECOMMENDATION_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import (app, db, init_db, generate_synthetic_data, get_recommender, interaction_weights,
+                 refresh_recommendations, Course, Progress, SCALES)
+from recommendations import Recommender
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def held_out_enrollments():
+    """Return {user_id: course_id} of each learner's latest enrollment, for learners with two or more."""
+    latest, counts = {}, {}
+    rows = db.session.query(Progress.user_id, Progress.course_id, Progress.enrolled_at, Progress.id)
+    for user_id, course_id, enrolled_at, row_id in rows:
+        counts[user_id] = counts.get(user_id, 0) + 1
+        key = (enrolled_at or datetime.min, row_id)
+        if user_id not in latest or key > latest[user_id][0]:
+            latest[user_id] = (key, course_id)
+    return {user_id: course_id for user_id, (_, course_id) in latest.items() if counts[user_id] > 1}
+
+
+def hit_rate(args):
+    users, courses, weights = interaction_weights()
+    held = held_out_enrollments()
+    train = [(user, course, weight) for user, course, weight in zip(users, courses, weights)
+             if held.get(user) != course]
+    train_users, train_courses, train_weights = (list(column) for column in zip(*train))
+
+    model = Recommender(neighbours=args.neighbours).fit(train_users, train_courses, train_weights)
+    start = time.perf_counter()
+    picks = model.recommend(train_users, train_courses, train_weights, args.count)
+    scored = time.perf_counter() - start
+
+    taken = {}
+    for user, course in zip(train_users, train_courses):
+        taken.setdefault(user, set()).add(course)
+    popular = model.popular(len(model.items)).tolist()
+    hits = baseline = 0
+    recommended = set()
+    for user, course in held.items():
+        mine = [item for item, _ in picks.get(user, [])]
+        recommended.update(mine)
+        hits += course in mine
+        baseline += course in [item for item in popular if item not in taken[user]][:args.count]
+    total = len(held) or 1
+    print(f'{len(held)} learners held out, {len(model.items)} courses, {model.similarity.nnz} similarities')
+    print(f'hit rate @{args.count}: co-enrollment {hits / total:.1%}, most enrolled {baseline / total:.1%}')
+    print(f'catalog coverage: {len(recommended) / (len(model.items) or 1):.1%} of courses recommended to someone')
+    print(f'fit {model.fit_seconds * 1000:.0f} ms, scored {len(picks)} learners in {scored * 1000:.0f} ms '
+          f'({len(picks) / scored:.0f}/s)')
+
+
+def refresh_latency(args):
+    start = time.perf_counter()
+    learners = refresh_recommendations(full=True)
+    print(f'full refresh: {learners} learners in {(time.perf_counter() - start) * 1000:.0f} ms '
+          f'(fit {get_recommender().fit_seconds * 1000:.0f} ms)')
+
+    rng = random.Random(args.seed)
+    course_ids = [course_id for course_id, in db.session.query(Course.id).filter_by(is_published=True)]
+    taken = set(db.session.query(Progress.user_id, Progress.course_id))
+    learner_ids = sorted({user_id for user_id, _ in taken})
+    added = set()
+    while len(added) < min(args.new_enrollments, len(learner_ids)):
+        pair = (rng.choice(learner_ids), rng.choice(course_ids))
+        if pair not in taken:
+            added.add(pair)
+    db.session.add_all(Progress(user_id=user_id, course_id=course_id) for user_id, course_id in added)
+    db.session.commit()
+
+    start = time.perf_counter()
+    learners = refresh_recommendations()
+    print(f'incremental refresh after {len(added)} enrollments: {learners} learners rescored '
+          f'in {(time.perf_counter() - start) * 1000:.0f} ms')
+    return sorted(user_id for user_id, _ in added)[0]
+
+
+def route_latency(args, learner_id):
+    with app.app_context():
+        engine = db.engine
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = learner_id
+    gc.collect()
+    gc.freeze()
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for path in ('/dashboard', '/'):
+            latencies, counts = [], []
+            for i in range(args.warmup + args.requests):
+                statements[0] = 0
+                start = time.perf_counter()
+                response = client.get(path)
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 200, (path, response.status_code)
+                assert b'Recommended for You' in response.data, path
+                if i >= args.warmup:
+                    latencies.append(elapsed)
+                    counts.append(statements[0])
+            print(f'{path:<12} p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  '
+                  f'p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  {max(counts)} statements')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='medium', help='synthetic data scale')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--existing', action='store_true', help='evaluate the data already in DATABASE_URL')
+    parser.add_argument('--count', type=int, default=app.config['RECOMMENDATION_COUNT'])
+    parser.add_argument('--neighbours', type=int, default=app.config['RECOMMENDATION_NEIGHBOURS'])
+    parser.add_argument('--new-enrollments', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    args = parser.parse_args()
+
+    init_db()
+    with app.app_context():
+        if not args.existing:
+            generate_synthetic_data(SCALES[args.scale], seed=args.seed)
+        hit_rate(args)
+        learner_id = refresh_latency(args)
+    route_latency(args, learner_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
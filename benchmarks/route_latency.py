@@ -0,0 +1,287 @@
+"""Latency and SQL statements per request for the main routes, checked against a baseline.
+
+Client mode (default) seeds a temporary SQLite database with the synthetic
+data generator and drives the routes in-process with Flask's test client,
+one request at a time. It counts every SQL statement issued while a request
+is served, including the ingest writer's commit for /submit_quiz. With the
+default durable ingestion, /submit_quiz latency includes the writer's
+batching window (INGEST_FLUSH_INTERVAL).
+
+HTTP mode (--url) drives a running server with --concurrency threads, each
+with its own keep-alive connection and login. Queries per request are read
+from /admin/metrics when the server runs with INSTRUMENTATION=1.
+
+The results are compared with benchmarks/baseline.json. The run fails when a
+route issues more statements than its baseline, or when its p99 exceeds the
+baseline by more than --tolerance plus --slack-ms. Latency baselines depend
+on the machine, so record your own with --update-baseline before comparing.
+Statement counts should match on any machine.
+
+    python benchmarks/route_latency.py --scale small --requests 200
+    python benchmarks/route_latency.py --update-baseline
+    flask generate-data --scale medium && flask run --port 5000 &
+    python benchmarks/route_latency.py --url http://127.0.0.1:5000 --concurrency 16
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'routes.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.pkl'))
+os.environ.setdefault('RECOMMENDATION_MODEL_PATH', os.path.join(tempfile.mkdtemp(), 'recommendations.npz'))
+os.environ.setdefault('PAGE_CACHE_BACKEND', 'none')
+os.environ.setdefault('ROLLUP_INTERVAL', '0')
+os.environ.setdefault('RECOMMENDATION_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ANSWERS = [1, 1, 0, 1, 2, 1, 0, 1, 1, 1]
+
+# (name, role, method, endpoint) - paths are filled in once the course is known
+ROUTES = [
+    ('home', 'visitor', 'GET', 'index'),
+    ('catalog', 'visitor', 'GET', 'courses'),
+    ('course', 'visitor', 'GET', 'course_detail'),
+    ('dashboard', 'student', 'GET', 'dashboard'),
+    ('admin', 'admin', 'GET', 'admin_dashboard'),
+    ('admin_statistics', 'admin', 'GET', 'admin_statistics'),
+    ('submit_quiz', 'student', 'POST', 'submit_quiz'),
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def paths(slug, course_id, quiz_version):
+    return {
+        'home': ('/', None),
+        'catalog': ('/courses', None),
+        'course': (f'/course/{slug}', None),
+        'dashboard': ('/dashboard', None),
+        'admin': ('/admin', None),
+        'admin_statistics': ('/admin/statistics', None),
+        'submit_quiz': ('/submit_quiz', {'course_id': course_id, 'version': quiz_version, 'answers': ANSWERS}),
+    }
+
+
+def summarize(latencies, queries):
+    return {
+        name: {
+            'p50_ms': round(percentile(latencies[name], 0.5) * 1000, 2),
+            'p99_ms': round(percentile(latencies[name], 0.99) * 1000, 2),
+            'queries': queries.get(name)
+        } for name, *_ in ROUTES
+    }
+
+
+# -- in-process, Flask test client ---------------------------------------
+
+def run_client(args):
+    from sqlalchemy import event
+
+    from app import (app, db, init_db, generate_synthetic_data, get_compiled_quiz, learner_events, User,
+                     Progress, Course, SCALES)
+
+    init_db()
+    with app.app_context():
+        generate_synthetic_data(SCALES[args.scale], seed=args.seed)
+        student = User.query.filter(User.username.like('learner%')).order_by(User.id).first()
+        enrolled = Progress.query.filter_by(user_id=student.id).order_by(Progress.id).first()
+        course = db.session.get(Course, enrolled.course_id)
+        admin_id = User.query.filter_by(username='admin').first().id
+        targets = paths(course.slug, course.id, get_compiled_quiz(course.id).version)
+        student_id = student.id
+        engine = db.engine
+
+    clients = {'visitor': app.test_client(), 'student': app.test_client(), 'admin': app.test_client()}
+    for role, user_id in (('student', student_id), ('admin', admin_id)):
+        with clients[role].session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    # Seeding leaves a large heap behind; without this, a full collection of it
+    # lands in whichever route happens to cross the threshold and sets its p99
+    gc.collect()
+    gc.freeze()
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    latencies, queries = defaultdict(list), {}
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for name, role, method, _ in ROUTES:
+            path, body = targets[name]
+            counts = []
+            for i in range(args.warmup + args.requests):
+                statements[0] = 0
+                start = time.perf_counter()
+                response = clients[role].open(path, method=method, json=body)
+                elapsed = time.perf_counter() - start
+                # Count the writer's statements too when requests do not wait for it
+                learner_events.flush()
+                assert response.status_code == 200, (path, response.status_code)
+                if i >= args.warmup:
+                    latencies[name].append(elapsed)
+                    counts.append(statements[0])
+            queries[name] = statistics.median_low(counts)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return summarize(latencies, queries), None
+
+
+# -- over HTTP against a running server -----------------------------------
+
+def http_client(base_url, username=None, password=None):
+    import httpx
+
+    client = httpx.Client(base_url=base_url, timeout=60)
+    if username is None:
+        return client
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise SystemExit(f'Login as {username} failed with HTTP {response.status_code}')
+    return client
+
+
+def sql_counters(admin):
+    """Return {endpoint: (sum, count)} of http_request_sql_queries, or None without instrumentation."""
+    response = admin.get('/admin/metrics')
+    if response.status_code != 200:
+        return None
+    totals = defaultdict(lambda: [0.0, 0])
+    for match in re.finditer(r'^http_request_sql_queries_(sum|count)\{endpoint="([^"]+)"\} (\S+)$',
+                             response.text, re.MULTILINE):
+        kind, endpoint, value = match.groups()
+        totals[endpoint][kind == 'count'] = float(value)
+    return totals
+
+
+def run_http(args):
+    admin = http_client(args.url, args.admin, args.admin_password)
+    course = admin.get('/api/courses', params={'per_page': 1}).json()['courses'][0]
+    quiz = admin.get(f"/api/quiz/{course['id']}").json()
+    targets = paths(course['slug'], course['id'], quiz['version'])
+    before = sql_counters(admin)
+
+    latencies, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def worker():
+        clients = {'visitor': http_client(args.url),
+                   'student': http_client(args.url, args.student, args.password),
+                   'admin': http_client(args.url, args.admin, args.admin_password)}
+        for _ in range(args.requests):
+            for name, role, method, _ in ROUTES:
+                path, body = targets[name]
+                start = time.perf_counter()
+                response = clients[role].request(method, path, json=body)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if response.status_code == 200:
+                        latencies[name].append(elapsed)
+                    else:
+                        errors[name] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    queries = {}
+    after = sql_counters(admin)
+    if before is not None and after is not None:
+        for name, _, _, endpoint in ROUTES:
+            total = after[endpoint][0] - before[endpoint][0]
+            requests = after[endpoint][1] - before[endpoint][1]
+            queries[name] = round(total / requests, 1) if requests else None
+    served = sum(len(values) for values in latencies.values())
+    print(f'{served} requests in {elapsed:.1f}s ({served / elapsed:.0f} req/s), '
+          f'{sum(errors.values())} errors {dict(errors) if errors else ""}')
+    return summarize(latencies, queries), errors
+
+
+# -- baseline ------------------------------------------------------------
+
+def regressions(results, baseline, tolerance, slack_ms):
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] is not None and base['queries'] is not None and result['queries'] > base['queries']:
+            found.append(f"{name}: {result['queries']} queries per request, baseline {base['queries']}")
+        limit = base['p99_ms'] * (1 + tolerance) + slack_ms
+        if result['p99_ms'] > limit:
+            found.append(f"{name}: p99 {result['p99_ms']:.1f} ms, baseline {base['p99_ms']:.1f} ms (limit {limit:.1f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='small', help='synthetic data scale in client mode')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=100, help='requests per route (per thread over HTTP)')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--student', default='learner2')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--admin', default='admin')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative p99 increase')
+    parser.add_argument('--slack-ms', type=float, default=5.0, help='allowed absolute p99 increase')
+    args = parser.parse_args()
+
+    if args.url:
+        key = f'http:c{args.concurrency}'
+        results, errors = run_http(args)
+    else:
+        key = f'client:{args.scale}'
+        results, errors = run_client(args)
+
+    print(f'{"route":<18} {"p50 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for name, result in results.items():
+        queries = '-' if result['queries'] is None else result['queries']
+        print(f'{name:<18} {result["p50_ms"]:8.1f} {result["p99_ms"]:8.1f} {queries:>8}')
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    if args.update_baseline:
+        baselines[key] = results
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline {key} written to {args.baseline}')
+        return 0
+    if key not in baselines:
+        print(f'No baseline for {key}; record one with --update-baseline')
+        return 0
+
+    found = regressions(results, baselines[key], args.tolerance, args.slack_ms)
+    for problem in found:
+        print('REGRESSION ' + problem)
+    print(f'{len(found)} regressions against baseline {key}')
+    return 1 if found or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
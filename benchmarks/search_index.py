@@ -0,0 +1,73 @@
+"""Latency benchmark for the BM25 course material index.
+
+Builds an index over synthetic lessons with a Zipf-distributed vocabulary,
+then times save/load and a batch of short chat-style queries.
+
+    python benchmarks/search_index.py --lessons 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex
+
+VOCABULARY = np.array([f'term{i}' for i in range(20000)])
+PROBABILITIES = 1 / np.arange(1, len(VOCABULARY) + 1)
+PROBABILITIES /= PROBABILITIES.sum()
+
+
+def words(rng, n):
+    return VOCABULARY[rng.choice(len(VOCABULARY), size=n, p=PROBABILITIES)].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lessons', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=80)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, default=5.0, help='fail if p50 query latency exceeds this')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    path = os.path.join(tempfile.mkdtemp(), 'search_index.pkl')
+    index = SearchIndex(path)
+
+    start = time.perf_counter()
+    for i in range(args.lessons):
+        index.add(f'lesson:{i}', ' '.join(words(rng, 4)), f'/course/c{i % 500}',
+                  '<p>' + ' '.join(words(rng, args.words)) + '</p>')
+    print(f'build   {args.lessons} lessons in {time.perf_counter() - start:.1f} s')
+
+    start = time.perf_counter()
+    index.save()
+    print(f'save    {time.perf_counter() - start:.2f} s ({os.path.getsize(path) / 1e6:.1f} MB)')
+    start = time.perf_counter()
+    index = SearchIndex(path)
+    index.load()
+    print(f'load    {time.perf_counter() - start:.2f} s')
+
+    latencies = []
+    for _ in range(args.queries):
+        query = ' '.join(words(rng, int(rng.integers(2, 7))))
+        start = time.perf_counter()
+        index.search(query, k=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f'query   p50={p50:.2f} ms p99={p99:.2f} ms')
+
+    if p50 > args.budget_ms:
+        print(f'FAIL: p50 above {args.budget_ms} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Requests per second on the course pages against serve.py with 1, 2, 4... workers.
+
+A temporary SQLite database is seeded once with the synthetic data generator.
+For each worker count, serve.py is started with --skip-init and --no-jobs on
+a free port. The benchmark waits for /readyz, then several client processes
+load /courses and /course/<slug> over keep-alive connections for --duration
+seconds. The server is then stopped with SIGTERM. The page cache is off, so
+every request renders.
+
+Throughput can only grow up to the number of CPUs, and the load generator
+competes with the server for them, so the run is skipped on a machine with
+fewer CPUs than the largest worker count. Otherwise it exits 1 unless every
+larger worker count serves more requests per second than the one before,
+without errors.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --threads 4 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORY = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(DIRECTORY, 'scaling.db'))
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(DIRECTORY, 'search_index.pkl'))
+os.environ.setdefault('RECOMMENDATION_MODEL_PATH', os.path.join(DIRECTORY, 'recommendations.npz'))
+os.environ.setdefault('CHAT_MEMORY_PATH', os.path.join(DIRECTORY, 'conversations.sqlite'))
+os.environ.setdefault('PAGE_CACHE_BACKEND', 'none')
+os.environ.setdefault('ROLLUP_INTERVAL', '0')
+os.environ.setdefault('RECOMMENDATION_INTERVAL', '0')
+sys.path.insert(0, ROOT)
+
+
+def prepare(scale, seed):
+    from app import app, db, init_db, generate_synthetic_data, Course, SCALES
+
+    init_db()
+    with app.app_context():
+        generate_synthetic_data(SCALES[scale], seed=seed)
+        slugs = [slug for slug, in db.session.query(Course.slug).filter_by(is_published=True)
+                 .order_by(Course.id).limit(20)]
+        db.engine.dispose()
+    return ['/courses'] + [f'/course/{slug}' for slug in slugs]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url, server, timeout=60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'serve.py exited with {server.returncode}')
+        try:
+            if httpx.get(base_url + '/readyz', timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'{base_url} was not ready after {timeout}s')
+
+
+def client_process(base_url, paths, threads, duration, results):
+    import httpx
+
+    counts = [0, 0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(offset):
+        served = errors = 0
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            i = offset
+            while time.monotonic() < deadline:
+                try:
+                    ok = client.get(paths[i % len(paths)]).status_code == 200
+                except httpx.TransportError:
+                    ok = False
+                served += ok
+                errors += not ok
+                i += 1
+        with lock:
+            counts[0] += served
+            counts[1] += errors
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(counts)
+
+
+def measure(workers, args, paths):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--skip-init', '--no-jobs', '--workers', str(workers),
+         '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(base_url, server)
+        # Warm every worker's connection pool and template cache
+        client_process(base_url, paths, args.concurrency, 1.0, multiprocessing.SimpleQueue())
+
+        results = multiprocessing.SimpleQueue()
+        clients = [multiprocessing.Process(target=client_process,
+                                           args=(base_url, paths, args.concurrency, args.duration, results))
+                   for _ in range(args.clients)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        served = errors = 0
+        for _ in clients:
+            ok, failed = results.get()
+            served += ok
+            errors += failed
+        return served / elapsed, errors
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=args.timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--clients', type=int, default=2, help='load generator processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='connections per client process')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per worker count')
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=int, default=40, help='seconds to wait for a clean shutdown')
+    args = parser.parse_args()
+
+    if (os.cpu_count() or 1) < max(args.workers):
+        print(f'SKIP: {os.cpu_count()} CPUs cannot show scaling up to {max(args.workers)} workers')
+        return 0
+    paths = prepare(args.scale, args.seed)
+    print(f'{os.cpu_count()} CPUs, {len(paths)} course pages, {args.clients}x{args.concurrency} connections, '
+          f'{args.threads} threads per worker')
+    print(f'{"workers":>8} {"req/s":>8} {"speedup":>8} {"errors":>7}')
+    rates = []
+    failed = 0
+    for workers in args.workers:
+        rate, errors = measure(workers, args, paths)
+        rates.append(rate)
+        failed += errors
+        print(f'{workers:8d} {rate:8.0f} {rate / rates[0]:7.2f}x {errors:7d}')
+
+    if failed:
+        print(f'FAIL: {failed} requests failed')
+        return 1
+    flat = [workers for workers, before, after in zip(args.workers[1:], rates, rates[1:]) if after <= before]
+    if flat:
+        print(f'FAIL: throughput did not go up at {", ".join(map(str, flat))} workers')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
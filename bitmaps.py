@@ -0,0 +1,39 @@
+"""Helpers for completion bitmaps stored as ``bytes``.
+
+Bit ``slot`` lives in byte ``slot // 8``, most significant bit first, the
+same layout as ``np.packbits``. A bitmap only grows as far as its highest set
+bit, so a learner who completed the first lessons of a course stores a
+byte or two.
+
+``bits_or`` and ``bit_count`` are also registered as SQLite functions so an
+upsert can merge a batch's bits into the stored bitmap without reading it.
+"""
+
+
+def has_bit(bits, slot):
+    index = slot // 8
+    return index < len(bits) and bool(bits[index] & (0x80 >> slot % 8))
+
+
+def set_bit(bits, slot):
+    """Return ``(bitmap, changed)`` with ``slot`` set."""
+    if has_bit(bits, slot):
+        return bits, False
+    index = slot // 8
+    grown = bytearray(bits)
+    if index >= len(grown):
+        grown.extend(bytes(index + 1 - len(grown)))
+    grown[index] |= 0x80 >> slot % 8
+    return bytes(grown), True
+
+
+
+def bits_or(a, b):
+    """Return the union of two bitmaps, as long as the longer one."""
+    if len(a) < len(b):
+        a, b = b, a
+    return bytes(x | y for x, y in zip(a, b)) + bytes(a[len(b):])
+
+
+def bit_count(bits):
+    return bin(int.from_bytes(bits, 'big')).count('1')
@@ -0,0 +1,272 @@
+"""Asynchronous gateway for upstream LLM requests.
+
+All upstream traffic from a process goes through one asyncio event loop
+running in a background thread, with a pooled keep-alive ``httpx`` client.
+Request threads hand work to the loop and wait on a future, so the number of
+concurrent upstream calls is bounded by the gateway's semaphore, not by the
+number of WSGI workers.
+
+Admission control happens before anything is queued:
+
+* a per-user token bucket rejects bursts with ``RateLimited`` (HTTP 429);
+* a bounded queue rejects work with ``GatewayBusy`` (HTTP 503) once
+  ``max_concurrency + max_queue`` requests are already pending;
+* ``max_waiting``, when set, rejects work with ``GatewayBusy`` once that many
+  request threads of this process are already waiting on the gateway.
+
+A request thread still blocks until its answer arrives (or, for a stream,
+until the last line), because a WSGI worker cannot hand the thread back
+while the upstream call is in flight. ``max_waiting`` keeps some of a
+worker's threads free for other pages when the upstream is slow.
+
+429 and 5xx answers and connection errors are retried with full-jitter
+exponential backoff, honouring ``Retry-After`` when the upstream sends one.
+
+``on_upstream(seconds, status, stream)``, when given, is called on the loop
+thread after every upstream attempt with its latency: the whole response for
+completions, the time to the response headers for streams. ``status`` is the
+HTTP status code, or ``'error'`` for a connection failure.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class ChatError(Exception):
+    """Raised when the upstream completion request fails."""
+
+    status = 500
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class RateLimited(ChatError):
+    status = 429
+
+
+class GatewayBusy(ChatError):
+    status = 503
+
+
+class RateLimiter:
+    """Per-key token buckets refilled at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute, burst, idle_seconds=600):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def allow(self, key):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if now - self._last_prune > self.idle_seconds:
+                self._prune(now)
+            return allowed
+
+    def _prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if now - bucket[1] < self.idle_seconds}
+        self._last_prune = now
+
+
+class ChatGateway:
+    def __init__(self, max_concurrency=16, max_queue=64, rate_per_minute=20, burst=5,
+                 max_retries=3, backoff_base=0.5, backoff_cap=8.0, timeout=30, on_upstream=None, max_waiting=0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_waiting = max_waiting
+        self.limiter = RateLimiter(rate_per_minute, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.on_upstream = on_upstream
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._pid = None
+        self.pending = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys(
+            ('requests', 'upstream_requests', 'retries', 'rate_limited', 'rejected', 'failed'), 0)
+
+    # -- public, called from request threads ---------------------------
+
+    def complete(self, url, headers, payload, user_key=None):
+        """POST ``payload`` and return the decoded JSON body."""
+        future = self._submit(self._complete(url, headers, payload), user_key)
+        try:
+            return future.result()
+        finally:
+            self._stop_waiting()
+
+    def stream(self, url, headers, payload, user_key=None):
+        """POST ``payload`` with a streamed response and yield its lines.
+
+        Closing the generator cancels the upstream request.
+        """
+        lines = queue.Queue()
+        future = self._submit(self._stream(url, headers, payload, lines), user_key)
+        try:
+            while True:
+                kind, value = lines.get()
+                if kind == 'line':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+            self._stop_waiting()
+
+    def stats(self):
+        return dict(self.counters, pending=self.pending, waiting=self.waiting,
+                    max_concurrency=self.max_concurrency, max_queue=self.max_queue,
+                    max_waiting=self.max_waiting)
+
+    def close(self):
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop = self._client = None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+    # -- admission -----------------------------------------------------
+
+    def _submit(self, coro, user_key):
+        """Schedule ``coro`` on the loop; the caller waits on it, then calls ``_stop_waiting``."""
+        with self._lock:
+            self.counters['requests'] += 1
+            if not self.limiter.allow(user_key):
+                self.counters['rate_limited'] += 1
+                coro.close()
+                raise RateLimited('Too many chat requests, please slow down')
+            if (self.pending >= self.max_concurrency + self.max_queue
+                    or 0 < self.max_waiting <= self.waiting):
+                self.counters['rejected'] += 1
+                coro.close()
+                raise GatewayBusy('The assistant is busy, please try again shortly')
+            self.pending += 1
+            self.waiting += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        future.add_done_callback(self._release)
+        return future
+
+    def _stop_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled() and future.exception() is not None:
+                self.counters['failed'] += 1
+
+    def _ensure_loop(self):
+        # The loop is started lazily and restarted after a fork, so each
+        # worker process owns its own loop and connection pool.
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                started = threading.Event()
+                threading.Thread(target=self._run_loop, args=(self._loop, started),
+                                 name='chat-gateway', daemon=True).start()
+                started.wait()
+            return self._loop
+
+    def _run_loop(self, loop, started):
+        # httpx is imported here, on first use, to keep it out of worker startup
+        import httpx
+
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=10),
+            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                max_keepalive_connections=self.max_concurrency)
+        )
+        started.set()
+        loop.run_forever()
+
+    # -- event loop side -----------------------------------------------
+
+    async def _complete(self, url, headers, payload):
+        async with self._semaphore:
+            response = await self._send(url, headers, payload)
+            return response.json()
+
+    async def _stream(self, url, headers, payload, lines):
+        try:
+            async with self._semaphore:
+                response = await self._send(url, headers, payload, stream=True)
+                try:
+                    async for line in response.aiter_lines():
+                        lines.put(('line', line))
+                finally:
+                    await response.aclose()
+            lines.put(('end', None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            lines.put(('error', e))
+
+    async def _send(self, url, headers, payload, stream=False):
+        import httpx
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.counters['upstream_requests'] += 1
+            start = time.perf_counter()
+            try:
+                request = self._client.build_request('POST', url, headers=headers, json=payload)
+                response = await self._client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                self._observe(start, 'error', stream)
+                if last_attempt:
+                    raise ChatError('Upstream connection failed', str(e))
+                await self._backoff(attempt)
+                continue
+            self._observe(start, response.status_code, stream)
+
+            if response.status_code == 200:
+                return response
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                await response.aclose()
+                await self._backoff(attempt, response.headers.get('Retry-After'))
+                continue
+
+            details = (await response.aread()).decode('utf-8', errors='replace')
+            await response.aclose()
+            raise ChatError('API request failed', details)
+
+    def _observe(self, start, status, stream):
+        if self.on_upstream is not None:
+            self.on_upstream(time.perf_counter() - start, status, stream)
+
+    async def _backoff(self, attempt, retry_after=None):
+        self.counters['retries'] += 1
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.backoff_cap, float(retry_after)))
+        await asyncio.sleep(delay)
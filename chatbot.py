@@ -0,0 +1,214 @@
+"""Client for the upstream LLM used by the /chat assistant.
+
+Answers are cached under a key built from the normalized prompt, the model
+and the system prompt, and concurrent identical questions share a single
+upstream request. Completions can also be streamed token by token. The HTTP
+traffic itself goes through ``chat_gateway.ChatGateway``.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from chat_gateway import ChatError, ChatGateway
+
+
+def sse_event(data, event=None):
+    """Encode one server-sent event."""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+
+def normalize_prompt(text):
+    """Fold case, whitespace and trailing punctuation so trivially different questions share a key."""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    return text.rstrip(' ?!.')
+
+
+class ChatCache:
+    """Size-bounded LRU of completions with a time-to-live."""
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, system_prompt, message):
+        raw = '\0'.join((model, system_prompt, normalize_prompt(message)))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[0] < time.time():
+                del self._entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = fn()
+            except BaseException as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+
+class ChatService:
+    """Sends completion requests upstream behind the cache and the coalescer."""
+
+    def __init__(self, api_url, api_key, model, system_prompt, cache=None, gateway=None, headers=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.cache = cache if cache is not None else ChatCache(max_entries=0)
+        self.gateway = gateway if gateway is not None else ChatGateway()
+        self.extra_headers = headers or {}
+        self.inflight = SingleFlight()
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, message, user_key=None, context=(), grounding=None):
+        """Return the answer to ``message``.
+
+        ``context`` holds earlier conversation messages; answers that depend
+        on it are neither cached nor coalesced. ``grounding`` is extra
+        reference text appended to the system prompt.
+        """
+        system_prompt = self.system_prompt_with(grounding)
+        if context:
+            return self._request(message, user_key, context, system_prompt)
+        key = self.cache.make_key(self.model, system_prompt, message)
+        answer = self.cache.get(key)
+        if answer is not None:
+            return answer
+        return self.inflight.do(key, lambda: self._fetch_and_store(key, message, user_key, system_prompt))
+
+    def stream(self, message, user_key=None, context=(), grounding=None):
+        """Yield the completion in pieces as the upstream produces them.
+
+        Closing the generator early (e.g. when the browser disconnects) closes
+        the upstream connection, which cancels the generation.
+        """
+        system_prompt = self.system_prompt_with(grounding)
+        key = None
+        if not context:
+            key = self.cache.make_key(self.model, system_prompt, message)
+            answer = self.cache.get(key)
+            if answer is not None:
+                yield answer
+                return
+
+        with self._lock:
+            self.upstream_calls += 1
+        payload = dict(self.payload(message, context, system_prompt), stream=True)
+        lines = self.gateway.stream(self.api_url, self.headers(), payload, user_key)
+        try:
+            parts = []
+            for line in lines:
+                # Skip blank separators and keep-alive comments
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                token = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if token:
+                    parts.append(token)
+                    yield token
+            if key is not None:
+                self.cache.set(key, ''.join(parts))
+        finally:
+            lines.close()
+
+    def _fetch_and_store(self, key, message, user_key, system_prompt):
+        answer = self._request(message, user_key, system_prompt=system_prompt)
+        self.cache.set(key, answer)
+        return answer
+
+    def headers(self):
+        return dict({
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }, **self.extra_headers)
+
+    def system_prompt_with(self, grounding):
+        return f'{self.system_prompt}\n\n{grounding}' if grounding else self.system_prompt
+
+    def payload(self, message, context=(), system_prompt=None):
+        return {
+            'model': self.model,
+            'messages': [{'role': 'system', 'content': system_prompt or self.system_prompt}]
+                        + list(context)
+                        + [{'role': 'user', 'content': message}]
+        }
+
+    def _request(self, message, user_key, context=(), system_prompt=None):
+        with self._lock:
+            self.upstream_calls += 1
+        result = self.gateway.complete(self.api_url, self.headers(), self.payload(message, context, system_prompt),
+                                       user_key)
+        return result['choices'][0]['message']['content']
+
+    def stats(self):
+        return {
+            'entries': len(self.cache),
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'evictions': self.cache.evictions,
+            'coalesced': self.inflight.coalesced,
+            'upstream_calls': self.upstream_calls,
+            'gateway': self.gateway.stats()
+        }
@@ -0,0 +1,253 @@
+"""Per-session conversation memory for the chat assistant.
+
+Each conversation is a bounded list of ``(role, text)`` turns. Idle
+conversations expire and the store as a whole is capped, evicting the least
+recently used conversation first. Two stores are available:
+
+* ``ConversationStore`` - per-process memory; with several workers a
+  conversation only continues if the session keeps reaching the same one.
+* ``SQLiteConversationStore`` - a SQLite file shared by every worker on the
+  host.
+
+``build_context`` turns a history into upstream messages under a token
+budget: the latest turns are sent verbatim, older ones are shortened into a
+single recap message, and whatever still does not fit is dropped.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+USER = 'user'
+ASSISTANT = 'assistant'
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def shorten(text, limit=160):
+    """Keep the first sentence of a turn, cut to ``limit`` characters."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 1].rstrip() + '…'
+
+
+class Conversation:
+    __slots__ = ('turns', 'chars', 'touched')
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.chars = 0
+        self.touched = time.monotonic()
+
+
+class ConversationStore:
+    def __init__(self, max_turns=40, max_chars=16000, idle_ttl=1800, max_sessions=10000):
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def history(self, session_id):
+        """Return the stored turns of a conversation, oldest first."""
+        with self._lock:
+            conversation = self._get(session_id)
+            return list(conversation.turns) if conversation else []
+
+    def append(self, session_id, role, text):
+        with self._lock:
+            conversation = self._get(session_id)
+            if conversation is None:
+                conversation = self._conversations[session_id] = Conversation(self.max_turns)
+                self._evict()
+            if len(conversation.turns) == conversation.turns.maxlen:
+                conversation.chars -= len(conversation.turns[0][1])
+            conversation.turns.append((role, text))
+            conversation.chars += len(text)
+            while conversation.chars > self.max_chars and len(conversation.turns) > 1:
+                conversation.chars -= len(conversation.turns.popleft()[1])
+
+    def clear(self, session_id):
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def stats(self):
+        return {'conversations': len(self._conversations), 'evictions': self.evictions}
+
+    def _get(self, session_id):
+        conversation = self._conversations.get(session_id)
+        if conversation is None:
+            return None
+        now = time.monotonic()
+        if now - conversation.touched > self.idle_ttl:
+            del self._conversations[session_id]
+            self.evictions += 1
+            return None
+        conversation.touched = now
+        self._conversations.move_to_end(session_id)
+        return conversation
+
+    def _evict(self):
+        now = time.monotonic()
+        # Oldest-touched conversations sit at the front of the ordered dict
+        while self._conversations:
+            session_id, conversation = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_sessions and now - conversation.touched <= self.idle_ttl:
+                break
+            del self._conversations[session_id]
+            self.evictions += 1
+
+
+class SQLiteConversationStore:
+    """``ConversationStore`` kept in a SQLite file so several worker processes share it."""
+
+    def __init__(self, path, max_turns=40, max_chars=16000, idle_ttl=1800, max_sessions=10000):
+        self.path = path
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        self.evictions = 0
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS conversation ('
+                         'session_id TEXT PRIMARY KEY, touched REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_conversation_touched ON conversation (touched)')
+            conn.execute('CREATE TABLE IF NOT EXISTS conversation_turn ('
+                         'id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_conversation_turn_session ON conversation_turn (session_id, id)')
+
+    def history(self, session_id):
+        """Return the stored turns of a conversation, oldest first."""
+        with self._transaction() as conn:
+            if not self._touch(conn, session_id, time.time()):
+                return []
+            return conn.execute('SELECT role, text FROM conversation_turn WHERE session_id = ? ORDER BY id',
+                                (session_id,)).fetchall()
+
+    def append(self, session_id, role, text):
+        now = time.time()
+        with self._transaction() as conn:
+            if not self._touch(conn, session_id, now):
+                conn.execute('INSERT INTO conversation (session_id, touched) VALUES (?, ?)', (session_id, now))
+                self._evict(conn, now)
+            conn.execute('INSERT INTO conversation_turn (session_id, role, text) VALUES (?, ?, ?)',
+                         (session_id, role, text))
+            # Keep the newest turns within max_turns and max_chars, and always the last one
+            rows = conn.execute('SELECT id, length(text) FROM conversation_turn WHERE session_id = ? '
+                                'ORDER BY id DESC', (session_id,)).fetchall()
+            chars = 0
+            for kept, (turn_id, length) in enumerate(rows):
+                chars += length
+                if kept and (kept >= self.max_turns or chars > self.max_chars):
+                    conn.execute('DELETE FROM conversation_turn WHERE session_id = ? AND id <= ?',
+                                 (session_id, turn_id))
+                    break
+
+    def clear(self, session_id):
+        with self._transaction() as conn:
+            self._delete(conn, [session_id])
+
+    def stats(self):
+        with self._transaction() as conn:
+            (count,) = conn.execute('SELECT COUNT(*) FROM conversation').fetchone()
+        return {'conversations': count, 'evictions': self.evictions}
+
+    def _touch(self, conn, session_id, now):
+        row = conn.execute('SELECT touched FROM conversation WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return False
+        if now - row[0] > self.idle_ttl:
+            self._delete(conn, [session_id])
+            self.evictions += 1
+            return False
+        conn.execute('UPDATE conversation SET touched = ? WHERE session_id = ?', (now, session_id))
+        return True
+
+    def _evict(self, conn, now):
+        expired = [session_id for (session_id,) in conn.execute(
+            'SELECT session_id FROM conversation WHERE touched < ?', (now - self.idle_ttl,))]
+        (count,) = conn.execute('SELECT COUNT(*) FROM conversation').fetchone()
+        count -= len(expired)
+        if count > self.max_sessions:
+            expired += [session_id for (session_id,) in conn.execute(
+                'SELECT session_id FROM conversation WHERE touched >= ? ORDER BY touched LIMIT ?',
+                (now - self.idle_ttl, count - self.max_sessions))]
+        self._delete(conn, expired)
+        self.evictions += len(expired)
+
+    @staticmethod
+    def _delete(conn, session_ids):
+        conn.executemany('DELETE FROM conversation WHERE session_id = ?', [(s,) for s in session_ids])
+        conn.executemany('DELETE FROM conversation_turn WHERE session_id = ?', [(s,) for s in session_ids])
+
+    def _transaction(self):
+        # A connection opened before a fork must not be used by the child
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaction(conn)
+
+
+class _Transaction:
+    """Run a block of statements in one IMMEDIATE transaction on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def create_store(name, path=None, **limits):
+    if name == 'memory':
+        return ConversationStore(**limits)
+    if name == 'sqlite':
+        return SQLiteConversationStore(path, **limits)
+    raise ValueError(f'Unknown conversation store: {name}')
+
+
+def build_context(history, budget, recent_turns=6):
+    """Select the history messages to send upstream within ``budget`` tokens."""
+    recent = []
+    used = 0
+    older = list(history)
+    while older and len(recent) < recent_turns:
+        role, text = older[-1]
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            break
+        recent.append({'role': role, 'content': text})
+        used += cost
+        older.pop()
+    recent.reverse()
+
+    recap = []
+    for role, text in reversed(older):
+        line = f"{'Student' if role == USER else 'Assistant'}: {shorten(text)}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        recap.append(line)
+        used += cost
+
+    if not recap:
+        return recent
+    recap.reverse()
+    summary = 'Earlier in this conversation:\n' + '\n'.join(recap)
+    return [{'role': 'system', 'content': summary}] + recent
@@ -0,0 +1,135 @@
+"""Streaming course import and export in JSON Lines.
+
+One course per line, with its lessons embedded::
+
+    {"slug": "ml-101", "title": "...", "description": "...", "category": "...",
+     "difficulty": "...", "duration": "...", "image": "...", "content": "...",
+     "is_published": true,
+     "lessons": [{"order": 1, "title": "...", "content": "...",
+                  "video_url": null, "duration": "10 min"}]}
+
+A bundle is the same file zipped as ``courses.jsonl``. Reading goes line by
+line, and zip members are decompressed as they are read, so only one course
+is in memory at a time whatever the file size. Writing yields the file in
+chunks. A zip is written to a non-seekable stream, with sizes in data
+descriptors, so nothing has to be buffered to fill in its headers.
+"""
+import io
+import json
+import zipfile
+
+BUNDLE_MEMBER = 'courses.jsonl'
+COURSE_FIELDS = ('slug', 'title', 'description', 'category', 'difficulty', 'duration', 'image', 'content')
+LESSON_FIELDS = ('title', 'content')
+OPTIONAL_LESSON_FIELDS = ('video_url', 'duration')
+
+
+def open_lines(stream):
+    """Return a text line iterator over a JSONL file or a zipped bundle (binary, seekable ``stream``)."""
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        bundle = zipfile.ZipFile(stream)
+        names = [name for name in bundle.namelist() if name.endswith('.jsonl')]
+        if not names:
+            raise ValueError('The zip bundle has no .jsonl file')
+        member = BUNDLE_MEMBER if BUNDLE_MEMBER in names else names[0]
+        stream = bundle.open(member)
+    else:
+        stream.seek(0)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def read_courses(lines):
+    """Yield ``(line_number, course, error)``, exactly one of ``course`` and ``error`` being set."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        try:
+            yield number, validate_course(record), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+
+def validate_course(record):
+    """Check a decoded line and return the course with normalised lessons."""
+    if not isinstance(record, dict):
+        raise ValueError('Expected a JSON object')
+    for field in COURSE_FIELDS:
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            raise ValueError(f"Course field '{field}' must be a non-empty string")
+    course = {field: record[field] for field in COURSE_FIELDS}
+    course['is_published'] = bool(record.get('is_published', True))
+
+    lessons = record.get('lessons') or []
+    if not isinstance(lessons, list):
+        raise ValueError("'lessons' must be a list")
+    course['lessons'] = []
+    orders = set()
+    for position, lesson in enumerate(lessons, 1):
+        if not isinstance(lesson, dict):
+            raise ValueError(f'Lesson {position} must be an object')
+        for field in LESSON_FIELDS:
+            if not isinstance(lesson.get(field), str) or not lesson[field].strip():
+                raise ValueError(f"Lesson {position} field '{field}' must be a non-empty string")
+        order = lesson.get('order', position)
+        if not isinstance(order, int) or order in orders:
+            raise ValueError(f'Lesson {position} has a missing or duplicate order')
+        orders.add(order)
+        course['lessons'].append(dict(
+            {field: lesson[field] for field in LESSON_FIELDS},
+            order=order,
+            **{field: lesson.get(field) for field in OPTIONAL_LESSON_FIELDS}
+        ))
+    return course
+
+
+def course_record(course, lessons):
+    """Return the export dict of a course and its lessons (model instances)."""
+    record = {field: getattr(course, field) for field in COURSE_FIELDS}
+    record['is_published'] = bool(course.is_published)
+    record['lessons'] = [dict({field: getattr(lesson, field) for field in LESSON_FIELDS + OPTIONAL_LESSON_FIELDS},
+                              order=lesson.order)
+                         for lesson in sorted(lessons, key=lambda lesson: lesson.order)]
+    return record
+
+
+def jsonl_chunks(records):
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class _Chunks:
+    """Write-only file object that hands back whatever was written since the last ``take``."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def zip_chunks(chunks, name=BUNDLE_MEMBER):
+    """Compress ``chunks`` into a single-member zip, yielding the archive as it is produced."""
+    out = _Chunks()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        with bundle.open(name, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = out.take()
+                if data:
+                    yield data
+    yield out.take()
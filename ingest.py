@@ -0,0 +1,193 @@
+"""Write-behind ingestion for learner events (enrollments, quiz results).
+
+Request threads put events on a bounded in-process queue and return; one
+background writer thread drains the queue and hands each batch to an
+``apply`` callback, which writes the whole batch in a single transaction.
+Many concurrent submissions therefore turn into a few commits instead of
+one commit each, so SQLite's single writer lock is not fought over.
+
+Durability is chosen per writer:
+
+* ``durable=True`` (group commit): ``submit`` blocks until the batch holding
+  the event has been committed, and re-raises the error if it failed;
+* ``durable=False`` (write-behind): ``submit`` returns once the event is
+  queued. Queued events are flushed on interpreter shutdown, but are lost if
+  the process is killed.
+
+When the queue is full ``submit`` raises ``IngestBusy`` (HTTP 503) instead of
+letting the backlog grow without bound. A durable ``submit`` that waits longer
+than ``timeout`` raises ``IngestTimeout`` (also 503); its event stays queued
+and is still written.
+
+A batch that keeps failing is split in halves and each half is written on
+its own, down to single events, so one bad event does not take the rest of
+its batch down. Events that fail alone are logged and kept in
+``dead_letters``, and only their own submitter sees the error.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestBusy(Exception):
+    status = 503
+
+
+class IngestTimeout(IngestBusy):
+    pass
+
+
+class Ticket:
+    """Completion handle for one queued event or flush request."""
+
+    __slots__ = ('done', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise IngestTimeout('Your update is taking longer than usual; it will be saved shortly')
+        if self.error is not None:
+            raise self.error
+
+
+class EventWriter:
+    def __init__(self, apply, max_queue=10000, batch_size=500, flush_interval=0.05, durable=True,
+                 max_retries=3, backoff_base=0.05, timeout=None, max_dead_letters=1000):
+        self.apply = apply
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durable = durable
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.dead_letters = deque(maxlen=max_dead_letters)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.counters = dict.fromkeys(('accepted', 'rejected', 'written', 'failed', 'batches', 'retries'), 0)
+        atexit.register(self.close)
+
+    # -- public, called from request threads ---------------------------
+
+    def submit(self, event, timeout=None):
+        """Queue ``event``; with a durable writer, wait until it is committed.
+
+        The wait is bounded by ``timeout``, or by the writer's own timeout.
+        """
+        self._ensure_thread()
+        ticket = Ticket() if self.durable else None
+        try:
+            self._queue.put_nowait((event, ticket))
+        except queue.Full:
+            with self._lock:
+                self.counters['rejected'] += 1
+            raise IngestBusy('Too many pending updates, please try again shortly')
+        with self._lock:
+            self.counters['accepted'] += 1
+        if ticket is not None:
+            ticket.wait(self.timeout if timeout is None else timeout)
+
+    def flush(self, timeout=None):
+        """Block until every event queued before this call has been written."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        ticket = Ticket()
+        self._queue.put((None, ticket))
+        ticket.wait(timeout)
+
+    def close(self, timeout=10):
+        """Write out the queue and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or self._pid != os.getpid():
+            return
+        self._queue.put((_STOP, None))
+        thread.join(timeout)
+
+    def stats(self):
+        return dict(self.counters, queued=self._queue.qsize(), durable=self.durable,
+                    batch_size=self.batch_size, dead_letters=len(self.dead_letters))
+
+    # -- writer thread -------------------------------------------------
+
+    def _ensure_thread(self):
+        # Started lazily and again after a fork, so each worker has its own writer
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                if self._thread is not None:
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1][0] is not _STOP:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1][0] is _STOP
+            self._write(batch[:-1] if stop else batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        items = [(event, ticket) for event, ticket in batch if event is not None]
+        if items:
+            self._write_items(items, self.max_retries)
+        # Flush requests complete once everything queued before them is written
+        for event, ticket in batch:
+            if event is None and ticket is not None:
+                ticket.done.set()
+
+    def _write_items(self, items, retries=0):
+        error = self._apply([event for event, _ in items], retries)
+        if error is not None and len(items) > 1:
+            middle = len(items) // 2
+            self._write_items(items[:middle])
+            self._write_items(items[middle:])
+            return
+        with self._lock:
+            self.counters['batches'] += 1
+            self.counters['failed' if error else 'written'] += len(items)
+        if error is not None:
+            event = items[0][0]
+            self.dead_letters.append((event, error))
+            log.error('Dropped event %r: %s', event, error)
+        for _, ticket in items:
+            if ticket is not None:
+                ticket.error = error
+                ticket.done.set()
+
+    def _apply(self, events, retries):
+        """Apply ``events`` in one transaction; returns the last error, or None once it succeeds."""
+        for attempt in range(retries + 1):
+            try:
+                self.apply(events)
+                return None
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    with self._lock:
+                        self.counters['retries'] += 1
+                    time.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+        return error
@@ -0,0 +1,275 @@
+"""Opt-in request instrumentation with Prometheus text output.
+
+``Instrumentation`` hooks into a Flask app and a SQLAlchemy engine and
+records into a ``Metrics`` registry:
+
+* ``http_request_duration_seconds{endpoint,method,status}``, a histogram;
+* ``http_request_sql_queries{endpoint}`` and
+  ``http_request_sql_seconds{endpoint}``, SQL statements and SQL time
+  per request;
+* ``sql_query_duration_seconds``, every statement, plus
+  ``sql_slow_queries_total``; slow statements are also logged;
+* ``template_render_seconds{template}``.
+
+Other components record into the same registry, such as the chat gateway's
+upstream latency, or publish gauges through ``add_collector``.
+
+With ``profile_slow_ms`` set, a ``SamplingProfiler`` samples the stacks of
+threads that are serving requests. When a request takes longer than the
+threshold, its samples are written to ``profile_dir`` in the collapsed
+"frame;frame;frame count" format read by flamegraph.pl and speedscope.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label_key(labels):
+    # Values are stored as text, so series keys stay sortable when a label
+    # holds an int in one series and a string in another (status=200, status='error')
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collect):
+        """Register ``collect()`` yielding ``(name, labels, value)`` gauges at render time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = [(name, labels, list(h.counts), h.buckets, h.sum, h.count)
+                          for (name, labels), h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for name, labels, counts, buckets, total, count in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels, ("le", bound))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                header(name, 'gauge')
+                lines.append(f'{name}{_labels(tuple(labels.items()))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of registered threads every ``interval`` seconds."""
+
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._samples:
+                    self._wake.clear()
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def _collapse(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    @staticmethod
+    def dump(path, samples):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class Instrumentation:
+    def __init__(self, app, engine, metrics, slow_query_ms=100, profile_slow_ms=0,
+                 profile_interval=0.005, profile_dir=None):
+        self.metrics = metrics
+        self.slow_query = slow_query_ms / 1000
+        self.profile_slow = profile_slow_ms / 1000
+        self.profile_dir = profile_dir
+        self.profiler = SamplingProfiler(profile_interval) if profile_slow_ms else None
+        if self.profiler and profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+        metrics.describe('http_request_duration_seconds', 'Time to build the response, by endpoint.')
+        metrics.describe('http_request_sql_queries', 'SQL statements issued per request.')
+        metrics.describe('http_request_sql_seconds', 'Time spent in SQL per request.')
+        metrics.describe('sql_query_duration_seconds', 'Duration of each SQL statement.')
+        metrics.describe('sql_slow_queries_total', f'SQL statements slower than {slow_query_ms:g} ms.')
+        metrics.describe('template_render_seconds', 'Jinja template render time.')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # -- requests ------------------------------------------------------
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        g.render_starts = []
+        if self.profiler:
+            self.profiler.start(threading.get_ident())
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        self.metrics.observe('http_request_duration_seconds', elapsed, endpoint=endpoint,
+                             method=request.method, status=response.status_code)
+        self.metrics.observe('http_request_sql_queries', g.sql_queries, buckets=COUNT_BUCKETS, endpoint=endpoint)
+        self.metrics.observe('http_request_sql_seconds', g.sql_seconds, endpoint=endpoint)
+        return response
+
+    def _teardown_request(self, exc):
+        # Runs even when the view raised, so the thread is never left being sampled
+        start = g.get('metrics_start')
+        if not self.profiler or start is None:
+            return
+        samples = self.profiler.stop(threading.get_ident())
+        elapsed = time.perf_counter() - start
+        if elapsed >= self.profile_slow and samples and self.profile_dir:
+            endpoint = request.endpoint or 'unmatched'
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{int(elapsed * 1000)}ms.folded'
+            self.profiler.dump(os.path.join(self.profile_dir, name), samples)
+
+    # -- templates -----------------------------------------------------
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context() and 'render_starts' in g:
+            g.render_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        if has_request_context() and g.get('render_starts'):
+            self.metrics.observe('template_render_seconds', time.perf_counter() - g.render_starts.pop(),
+                                 template=template.name or 'string')
+
+    # -- SQL -----------------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_starts', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_starts')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.metrics.observe('sql_query_duration_seconds', elapsed)
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+        if elapsed >= self.slow_query:
+            self.metrics.inc('sql_slow_queries_total')
+            log.warning('Slow query (%.1f ms): %s', elapsed * 1000, ' '.join(statement.split())[:500])
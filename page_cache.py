@@ -0,0 +1,273 @@
+"""Rendered-page cache for the public catalog routes.
+
+Entries are whole responses (body, mimetype, ETag, Last-Modified) stored under
+a key and a set of tags. Admin write handlers evict by tag, so editing one
+course only drops the pages that show it.
+
+Two backends are available:
+
+* ``MemoryBackend`` - per-process LRU with TTL.
+* ``SQLiteBackend`` - a small SQLite file shared by every worker on the host.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response
+
+
+class CacheEntry:
+    __slots__ = ('body', 'mimetype', 'status', 'etag', 'last_modified')
+
+    def __init__(self, body, mimetype, status, etag, last_modified):
+        self.body = body
+        self.mimetype = mimetype
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class MemoryBackend:
+    """In-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, tags, entry = item
+            if expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, tags, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, tuple(tags), entry)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_tags(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SQLiteBackend:
+    """Cache stored in a SQLite file so several worker processes share it."""
+
+    def __init__(self, path, max_entries=4096):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.evictions = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS page_cache ('
+                         'key TEXT PRIMARY KEY, expires REAL NOT NULL, '
+                         'accessed REAL NOT NULL, entry BLOB NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS page_cache_tag ('
+                         'tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_page_cache_tag_key ON page_cache_tag (key)')
+
+    def _connect(self):
+        # A connection opened before a fork must not be used by the child
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaction(conn)
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT expires, entry FROM page_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] < now:
+                self._delete_keys(conn, [key])
+                return None
+            conn.execute('UPDATE page_cache SET accessed = ? WHERE key = ?', (now, key))
+            return pickle.loads(row[1])
+
+    def set(self, key, entry, tags, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            self._delete_keys(conn, [key])
+            conn.execute('INSERT INTO page_cache (key, expires, accessed, entry) VALUES (?, ?, ?, ?)',
+                         (key, now + ttl, now, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)))
+            conn.executemany('INSERT OR IGNORE INTO page_cache_tag (tag, key) VALUES (?, ?)',
+                             [(tag, key) for tag in tags])
+            (count,) = conn.execute('SELECT COUNT(*) FROM page_cache').fetchone()
+            if count > self.max_entries:
+                stale = [k for (k,) in conn.execute(
+                    'SELECT key FROM page_cache ORDER BY expires < ? DESC, accessed LIMIT ?',
+                    (now, count - self.max_entries))]
+                self._delete_keys(conn, stale)
+                self.evictions += len(stale)
+
+    def delete_tags(self, tags):
+        tags = list(tags)
+        if not tags:
+            return 0
+        with self._connect() as conn:
+            placeholders = ','.join('?' * len(tags))
+            keys = [k for (k,) in conn.execute(
+                f'SELECT DISTINCT key FROM page_cache_tag WHERE tag IN ({placeholders})', tags)]
+            self._delete_keys(conn, keys)
+            return len(keys)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM page_cache')
+            conn.execute('DELETE FROM page_cache_tag')
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM page_cache').fetchone()[0]
+
+    @staticmethod
+    def _delete_keys(conn, keys):
+        conn.executemany('DELETE FROM page_cache WHERE key = ?', [(k,) for k in keys])
+        conn.executemany('DELETE FROM page_cache_tag WHERE key = ?', [(k,) for k in keys])
+
+
+class _Transaction:
+    """Run a block of statements in one IMMEDIATE transaction on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class PageCache:
+    """Caches anonymous GET responses and answers conditional requests from them."""
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def cached(self, key, tags):
+        """Decorate a view; ``key`` and ``tags`` are callables receiving the view kwargs."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or not self._cacheable():
+                    return view(*args, **kwargs)
+
+                cache_key = key(**kwargs)
+                entry = self.backend.get(cache_key)
+                self._count('hits' if entry is not None else 'misses')
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = CacheEntry(body, response.mimetype, response.status_code,
+                                       hashlib.sha1(body).hexdigest(), int(time.time()))
+                    self.backend.set(cache_key, entry, tags(**kwargs), self.ttl)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return 0
+        removed = self.backend.delete_tags(tags)
+        self._count('invalidations', removed)
+        return removed
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.enabled else None,
+            'entries': len(self.backend) if self.enabled else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'evictions': getattr(self.backend, 'evictions', 0)
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    @staticmethod
+    def _cacheable():
+        # Pages render the navbar and flashes from the session, so only
+        # anonymous requests without pending messages share an entry.
+        return request.method == 'GET' and 'user_id' not in session and '_flashes' not in session
+
+    @staticmethod
+    def _respond(entry):
+        response = make_response(entry.body, entry.status)
+        response.mimetype = entry.mimetype
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+def create_backend(name, path=None, max_entries=512):
+    if name == 'memory':
+        return MemoryBackend(max_entries)
+    if name == 'sqlite':
+        return SQLiteBackend(path, max_entries)
+    if name in (None, '', 'none'):
+        return None
+    raise ValueError(f'Unknown page cache backend: {name}')
@@ -0,0 +1,126 @@
+"""Question banks, compiled quizzes and server-side grading.
+
+A quiz is compiled once per (quiz id, version) into the JSON sent to the
+browser, which carries no answers, plus an ``int8`` NumPy answer key.
+Grading compares a whole submission against the key in one vectorized
+operation. Per-question correctness is stored as a packed bit string, one
+bit per question, so item statistics over many attempts can be computed by
+unpacking a single byte matrix.
+"""
+import glob
+import json
+import os
+import threading
+
+
+def read_banks(path):
+    """Yield question-bank dicts from a JSON file or a directory of JSON files."""
+    paths = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+    for bank_path in paths:
+        with open(bank_path, encoding='utf-8') as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+
+
+def validate_bank(bank):
+    if not bank.get('course'):
+        raise ValueError('Question bank is missing the course slug')
+    questions = bank.get('questions') or []
+    if not questions:
+        raise ValueError(f"Question bank for '{bank['course']}' has no questions")
+    for number, question in enumerate(questions, 1):
+        options = question.get('options') or []
+        if not question.get('question') or len(options) < 2:
+            raise ValueError(f"Question {number} for '{bank['course']}' needs a text and at least two options")
+        if not isinstance(question.get('correct'), int) or not 0 <= question['correct'] < len(options):
+            raise ValueError(f"Question {number} for '{bank['course']}' has an invalid correct option")
+
+
+class CompiledQuiz:
+    __slots__ = ('quiz_id', 'course_id', 'version', 'public', 'answer_key')
+
+    def __init__(self, quiz_id, course_id, version, public, answer_key):
+        self.quiz_id = quiz_id
+        self.course_id = course_id
+        self.version = version
+        self.public = public
+        self.answer_key = answer_key
+
+    def __len__(self):
+        return len(self.answer_key)
+
+
+def compile_quiz(quiz):
+    # NumPy is imported by the functions that grade, so reading banks and
+    # starting a worker do not pay for it
+    import numpy as np
+
+    questions = sorted(quiz.questions, key=lambda q: q.position)
+    public = {
+        'quiz_id': quiz.id,
+        'version': quiz.version,
+        'title': quiz.title,
+        'questions': [{'text': q.text, 'options': json.loads(q.options)} for q in questions]
+    }
+    answer_key = np.array([q.correct for q in questions], dtype=np.int8)
+    return CompiledQuiz(quiz.id, quiz.course_id, quiz.version, public, answer_key)
+
+
+class QuizCache:
+    """Compiled quizzes keyed by quiz id; an entry is replaced when the version moves on."""
+
+    def __init__(self):
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id, version, load):
+        compiled = self._compiled.get(quiz_id)
+        if compiled is None or compiled.version != version:
+            compiled = compile_quiz(load())
+            with self._lock:
+                self._compiled[quiz_id] = compiled
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+
+
+def grade(compiled, answers):
+    """Return (score, correct) where ``correct`` is a boolean array, one entry per question.
+
+    Missing or malformed answers count as wrong.
+    """
+    import numpy as np
+
+    submitted = np.full(len(compiled), -1, dtype=np.int8)
+    for i, answer in enumerate((answers or [])[:len(compiled)]):
+        if isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < 128:
+            submitted[i] = answer
+    correct = submitted == compiled.answer_key
+    return int(correct.sum()), correct
+
+
+def pack_correct(correct):
+    import numpy as np
+
+    return np.packbits(correct).tobytes()
+
+
+def unpack_correct(packed, num_questions):
+    import numpy as np
+
+    return np.unpackbits(np.frombuffer(packed, dtype=np.uint8))[:num_questions].astype(bool)
+
+
+def item_statistics(packed_rows, num_questions):
+    """Per-question attempt count and share of correct answers over packed results."""
+    import numpy as np
+
+    width = (num_questions + 7) // 8
+    rows = [row for row in packed_rows if row is not None and len(row) == width]
+    if not rows:
+        return 0, np.zeros(num_questions)
+    matrix = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), width)
+    bits = np.unpackbits(matrix, axis=1)[:, :num_questions]
+    return len(rows), bits.mean(axis=0)
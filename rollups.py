@@ -0,0 +1,129 @@
+"""Time-bucketed analytics rollups and the background job that refreshes them.
+
+The rollup table holds one row per course and day, with enrollments,
+completions, quiz attempts and score sums. Weekly series and per-category
+series are sums of those rows. Averages are kept as sums and totals, so they
+combine exactly when buckets are merged.
+
+A refresh is incremental. It recomputes only the days from the stored
+watermark onwards, minus a lateness window, by reading base rows with
+indexed timestamp range scans. It then replaces those days' rollup rows.
+Replacing whole days, not adding deltas, makes a refresh idempotent: two
+workers running it at once, or a retry after a crash, cannot double count.
+Rows written later than the lateness window are picked up by a full rebuild.
+
+``PeriodicJob`` runs a function every ``interval`` seconds in a daemon
+thread. Jobs are started by ``flask run-jobs`` in one scheduler process,
+never from a request, so web workers, test clients and benchmarks do not run
+them or see their SQL.
+"""
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+log = logging.getLogger(__name__)
+
+METRICS = ('enrollments', 'completions', 'quiz_attempts', 'score_sum', 'question_sum')
+PERIODS = ('day', 'week')
+
+
+def bucket_start(day, period):
+    """First day of the bucket holding ``day``; weeks start on Monday."""
+    return day - timedelta(days=day.weekday()) if period == 'week' else day
+
+
+def build_series(rows, period):
+    """Merge ``(key, label, day, *METRICS)`` rows into per-key series of ``period`` buckets.
+
+    Returns ``[{'key', 'label', 'points': [{'bucket', *METRICS, 'avg_score'}]}]``
+    with points in bucket order; ``avg_score`` is the share of questions
+    answered correctly, in percent.
+    """
+    series = {}
+    for key, label, day, *values in rows:
+        entry = series.setdefault(key, {'key': key, 'label': label, 'buckets': {}})
+        bucket = entry['buckets'].setdefault(bucket_start(day, period), [0] * len(METRICS))
+        for index, value in enumerate(values):
+            bucket[index] += value or 0
+    result = []
+    for entry in series.values():
+        points = []
+        for bucket, values in sorted(entry['buckets'].items()):
+            point = dict(zip(METRICS, values), bucket=bucket.isoformat())
+            point['avg_score'] = round(point['score_sum'] * 100 / point['question_sum'], 2) if point['question_sum'] else None
+            points.append(point)
+        result.append({'key': entry['key'], 'label': entry['label'], 'points': points})
+    return result
+
+
+def csv_chunks(series):
+    """Yield the series as CSV text, one chunk per series."""
+    header = ['bucket', 'key', 'label', *METRICS, 'avg_score']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for entry in series:
+        for point in entry['points']:
+            writer.writerow([point['bucket'], entry['key'], entry['label'],
+                             *(point[name] for name in METRICS), point['avg_score']])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def parse_day(value, default=None):
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class PeriodicJob:
+    def __init__(self, fn, interval, name='periodic-job'):
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.counters = dict.fromkeys(('runs', 'failures'), 0)
+        self.last_run = None
+        self.last_duration = None
+
+    def ensure_started(self):
+        if self.interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            result = self.fn()
+        except Exception:
+            self.counters['failures'] += 1
+            log.exception('%s failed', self.name)
+            return None
+        self.counters['runs'] += 1
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - start
+        return result
+
+    def stats(self):
+        return dict(self.counters, interval=self.interval, last_run=self.last_run,
+                    last_duration=self.last_duration)
+
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
@@ -0,0 +1,287 @@
+"""BM25 search over course and lesson content.
+
+Documents are split into passages of about ``PASSAGE_WORDS`` words. Each
+term keeps a postings list of (passage slot, term frequency) in growable
+``array`` buffers, which are scored as NumPy views without copying.
+
+Updates are incremental: re-indexing a document tombstones its old slots and
+appends new ones, and the index compacts itself once too many slots are
+dead. The whole index is pickled to disk so a restart does not rebuild it,
+and workers pick up a newer file written by another process. Writers change
+the index inside ``updating()``, which holds a lock file, starts from the
+newest saved copy and saves on success, so two workers editing courses at
+once do not overwrite each other's changes.
+"""
+import html
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: serve.py runs a single process there
+    fcntl = None
+
+PASSAGE_WORDS = 120
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i in is it its me my of on or so that the
+their them then there these this to was what when where which who why will with you your
+""".split())
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def html_to_text(markup):
+    return re.sub(r'\s+', ' ', html.unescape(TAG_RE.sub(' ', markup or ''))).strip()
+
+
+def split_passages(text, size=PASSAGE_WORDS):
+    words = text.split(' ')
+    return [' '.join(words[i:i + size]) for i in range(0, len(words), size)] or ['']
+
+
+class Hit:
+    __slots__ = ('key', 'title', 'url', 'text', 'score', 'confidence', 'coverage')
+
+    def __init__(self, key, title, url, text, score, confidence, coverage):
+        self.key = key
+        self.title = title
+        self.url = url
+        self.text = text
+        self.score = score
+        self.confidence = confidence
+        # Share of the distinct query terms found in the passage
+        self.coverage = coverage
+
+
+class SearchIndex:
+    def __init__(self, path=None, k1=1.2, b=0.75, reload_interval=5.0):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._reset()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.postings = {}
+        self.passages = []
+        self.lengths = array('f')
+        self.alive = array('b')
+        self.doc_slots = {}
+        self.live_passages = 0
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_slots)
+
+    @property
+    def loaded(self):
+        return self._loaded_mtime is not None
+
+    # -- updates -------------------------------------------------------
+
+    def add(self, key, title, url, markup):
+        """Index (or re-index) one document from its title and HTML body."""
+        with self._lock:
+            self._remove(key)
+            title_tokens = tokenize(title)
+            slots = []
+            for passage in split_passages(html_to_text(markup)):
+                # The title is repeated in every passage so it weighs in each one
+                tokens = title_tokens + tokenize(passage)
+                slot = len(self.passages)
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    docs, tfs = self.postings.setdefault(token, (array('i'), array('f')))
+                    docs.append(slot)
+                    tfs.append(count)
+                self.passages.append((key, title, url, passage))
+                self.lengths.append(len(tokens))
+                self.alive.append(1)
+                self.live_passages += 1
+                self.total_length += len(tokens)
+                slots.append(slot)
+            self.doc_slots[key] = slots
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+            if len(self.passages) > 1000 and self.live_passages < len(self.passages) * 0.7:
+                self._compact()
+
+    def _remove(self, key):
+        for slot in self.doc_slots.pop(key, ()):
+            self.alive[slot] = 0
+            self.passages[slot] = None
+            self.live_passages -= 1
+            self.total_length -= int(self.lengths[slot])
+
+    def _compact(self):
+        documents = {}
+        for passage in self.passages:
+            if passage is not None:
+                key, title, url, text = passage
+                documents.setdefault(key, (title, url, []))[2].append(text)
+        self._reset()
+        for key, (title, url, texts) in documents.items():
+            self.add(key, title, url, ' '.join(texts))
+
+    # -- queries -------------------------------------------------------
+
+    def search(self, query, k=3):
+        """Return up to ``k`` best passages for ``query``, best first.
+
+        ``confidence`` compares the score with what a passage containing every
+        query term would get, counting terms the index has never seen at the
+        highest idf. A question that only shares one common word with a
+        passage therefore gets a low confidence.
+        """
+        # Only searching needs NumPy; editing and saving the index do not
+        import numpy as np
+
+        self.reload_if_changed()
+        with self._lock:
+            query_terms = set(tokenize(query))
+            terms = [t for t in query_terms if t in self.postings]
+            if not terms or not self.live_passages:
+                return []
+
+            n = len(self.passages)
+            lengths = np.frombuffer(self.lengths, dtype=np.float32)
+            alive = np.frombuffer(self.alive, dtype=np.int8)
+            avgdl = self.total_length / self.live_passages
+            scores = np.zeros(n, dtype=np.float32)
+            matched = np.zeros(n, dtype=np.int32)
+            reference = 2 * (self.k1 + 1) / (2 + self.k1)
+            # Unindexed terms count at the idf of a term in no passage
+            unseen_idf = math.log(1 + (self.live_passages + 0.5) / 0.5)
+            best_possible = unseen_idf * reference * (len(query_terms) - len(terms))
+
+            for term in terms:
+                docs_buf, tfs_buf = self.postings[term]
+                docs = np.frombuffer(docs_buf, dtype=np.int32)
+                tfs = np.frombuffer(tfs_buf, dtype=np.float32)
+                df = int(alive[docs].sum())
+                if not df:
+                    best_possible += unseen_idf * reference
+                    continue
+                idf = math.log(1 + (self.live_passages - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avgdl)
+                weights = idf * tfs * (self.k1 + 1) / (tfs + norm)
+                scores += np.bincount(docs, weights=weights, minlength=n).astype(np.float32)
+                matched += np.bincount(docs, minlength=n) > 0
+                # Reference score: the term appearing twice in an average-length passage
+                best_possible += idf * reference
+
+            scores *= alive
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            hits = []
+            for slot in top:
+                score = float(scores[slot])
+                if score <= 0:
+                    break
+                key, title, url, text = self.passages[slot]
+                confidence = min(1.0, score / best_possible) if best_possible else 0.0
+                hits.append(Hit(key, title, url, text, score, confidence, int(matched[slot]) / len(query_terms)))
+            return hits
+
+    # -- persistence ---------------------------------------------------
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = {
+                'postings': self.postings,
+                'passages': self.passages,
+                'lengths': self.lengths,
+                'alive': self.alive,
+                'doc_slots': self.doc_slots,
+                'live_passages': self.live_passages,
+                'total_length': self.total_length
+            }
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
+
+    def load(self):
+        """Load the index from disk; returns False when there is no saved index."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            self.__dict__.update(state)
+            self._loaded_mtime = mtime
+        return True
+
+    @contextmanager
+    def updating(self):
+        """Apply the block's changes to the newest saved index, then save it.
+
+        If the block raises, its changes are dropped by reloading the file.
+        """
+        with self._lock, self._file_lock():
+            if self.path and os.path.exists(self.path) and os.path.getmtime(self.path) != self._loaded_mtime:
+                self.load()
+            try:
+                yield self
+            except BaseException:
+                self.load()
+                raise
+            self.save()
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.path or fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reload_if_changed(self):
+        """Pick up an index file rewritten by another worker."""
+        now = time.monotonic()
+        if not self.path or now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if self._loaded_mtime is not None and mtime > self._loaded_mtime:
+            self.load()
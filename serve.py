@@ -0,0 +1,152 @@
+"""Production launcher: prepare the database once, then serve with several workers.
+
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8030
+
+1. ``init_db`` runs once in this process: it creates and migrates the schema,
+   seeds an empty database and builds the search index. Workers never run it,
+   so they cannot race each other on DDL or seeding. Pass --skip-init when a
+   deploy step already ran ``flask init-db``.
+2. Gunicorn forks ``--workers`` processes, each serving ``--threads``
+   requests at once (the gthread worker). Once step 1 has imported the app,
+   workers inherit it and start without importing it again. Database
+   connections opened by step 1 are closed before the fork, so no worker
+   shares a connection with another.
+3. One scheduler process runs ``flask run-jobs`` next to the server, so
+   periodic jobs (analytics rollups, recommendations, search index updates) run once per
+   deployment, not once per worker. Pass --no-jobs when the scheduler runs elsewhere.
+4. On SIGTERM, workers finish their in-flight requests (--graceful-timeout)
+   and flush queued learner events before exiting; the scheduler is stopped.
+
+With more than one worker, the page cache and chat conversation memory
+default to their SQLite backends (PAGE_CACHE_BACKEND, CHAT_MEMORY_BACKEND), so
+an admin edit evicts cached pages in every worker and a conversation
+continues whichever worker serves the next message. The search index file is
+shared already: the scheduler applies admin edits to it in batches and workers
+reload it when it changes.
+
+Defaults come from WEB_WORKERS, WEB_THREADS, WEB_BIND and WEB_TIMEOUT. Without
+gunicorn installed (e.g. on Windows), the app is served by Werkzeug's
+threaded server in a single process.
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def prepare():
+    from app import app, db, init_db
+
+    init_db()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def start_scheduler():
+    return subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app', 'run-jobs'], cwd=ROOT)
+
+
+def stop_scheduler(scheduler, timeout):
+    scheduler.terminate()
+    try:
+        scheduler.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        scheduler.kill()
+        scheduler.wait()
+
+
+def post_fork(server, worker):
+    # A worker forked from a master that loaded the app must not reuse its pool
+    if 'app' in sys.modules:
+        from app import app, db
+
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    if 'app' in sys.modules:
+        from app import learner_events
+
+        learner_events.close()
+
+
+def gunicorn_options(args):
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': 5,
+        'accesslog': '-' if args.access_log else None,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+
+def serve_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for name, value in gunicorn_options(args).items():
+                if value is not None:
+                    self.cfg.set(name, value)
+
+        def load(self):
+            from wsgi import create_app
+            return create_app()
+
+    Server().run()
+
+
+def serve_werkzeug(args):
+    from werkzeug.serving import run_simple
+
+    from wsgi import create_app
+
+    host, _, port = args.bind.rpartition(':')
+    if args.workers > 1:
+        print('gunicorn is not installed; serving from one process', file=sys.stderr)
+    run_simple(host or '0.0.0.0', int(port), create_app(), threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', 4)))
+    parser.add_argument('--bind', default=os.getenv('WEB_BIND', '0.0.0.0:8030'))
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', 60)))
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument('--access-log', action='store_true')
+    parser.add_argument('--skip-init', action='store_true', help='the database was prepared by flask init-db')
+    parser.add_argument('--no-jobs', action='store_true', help='do not start the background job scheduler')
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Set before the app is imported, here or in the workers
+        os.environ.setdefault('PAGE_CACHE_BACKEND', 'sqlite')
+        os.environ.setdefault('CHAT_MEMORY_BACKEND', 'sqlite')
+    # Chat requests block their thread until the upstream answers; keep the
+    # other half of each worker's threads for the rest of the site
+    os.environ.setdefault('CHAT_MAX_WAITING', str(max(1, args.threads // 2)))
+    if not args.skip_init:
+        prepare()
+    scheduler = None if args.no_jobs else start_scheduler()
+    try:
+        if importlib.util.find_spec('gunicorn') is None:
+            serve_werkzeug(args)
+        else:
+            serve_gunicorn(args)
+    finally:
+        if scheduler is not None:
+            stop_scheduler(scheduler, args.graceful_timeout)
+
+
+if __name__ == '__main__':
+    main()
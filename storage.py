@@ -0,0 +1,81 @@
+"""Database engine configuration.
+
+``engine_options`` builds the SQLAlchemy engine options for a database URL
+and ``install_pragmas`` applies SQLite pragmas to every new connection
+(``install_functions`` registers Python SQL functions the same way):
+
+* ``journal_mode=WAL`` lets readers run alongside the single writer;
+* ``busy_timeout`` makes a blocked writer wait instead of failing at once
+  with "database is locked";
+* ``synchronous=NORMAL`` is safe with WAL and skips an fsync per commit;
+* ``mmap_size`` and ``cache_size`` keep hot pages in memory.
+
+Any other SQLAlchemy URL, such as ``postgresql+psycopg://...``, can be set in
+``DATABASE_URL``. Then only the pool options apply, with pre-ping and
+recycling so connections dropped by the server are replaced.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, pool_size=10, max_overflow=20, pool_timeout=30, pool_recycle=1800):
+    if is_memory_sqlite(uri):
+        # Flask-SQLAlchemy shares one connection (StaticPool) for in-memory databases
+        return {}
+    options = {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout}
+    if not is_sqlite(uri):
+        options.update(pool_recycle=pool_recycle, pool_pre_ping=True)
+    return options
+
+
+def sqlite_pragmas(journal_mode='WAL', busy_timeout=5000, synchronous='NORMAL',
+                   mmap_size=256 * 1024 * 1024, cache_size=-64000):
+    """Pragmas in the order they are applied; a negative cache_size is in KiB."""
+    return [
+        ('busy_timeout', busy_timeout),
+        ('journal_mode', journal_mode),
+        ('synchronous', synchronous),
+        ('mmap_size', mmap_size),
+        ('cache_size', cache_size)
+    ]
+
+
+def install_pragmas(engine, pragmas):
+    """Run ``PRAGMA name=value`` on each new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def install_functions(engine, functions):
+    """Register ``{name: (num_args, fn)}`` as SQL functions on each new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def create_functions(dbapi_connection, connection_record):
+        for name, (num_args, fn) in functions.items():
+            dbapi_connection.create_function(name, num_args, fn, deterministic=True)
+
+
+def current_pragmas(connection, names=('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size', 'cache_size')):
+    if connection.dialect.name != 'sqlite':
+        return {}
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
@@ -0,0 +1,199 @@
+"""Deterministic synthetic data for load tests and benchmarks.
+
+``synthetic_rows(scale, seed, start_ids, password_hash, now)`` yields
+``(table, row)`` pairs ready for bulk ``INSERT``s. Courses come first, then
+their lessons and quizzes, then users, each followed by their own progress and
+quiz rows, so rows can be buffered per table and written in ``TABLES`` order.
+Primary keys are assigned here from ``start_ids``, so a run can add to an
+existing database without reading back generated ids.
+
+The same seed always produces the same rows. Course popularity follows a
+Zipf-like curve, so a few courses hold most enrollments, as in production.
+Each learner favours one category and draws most enrollments from it, so
+courses are taken together the way related courses are.
+Every learner shares ``password_hash``, because hashing a million distinct
+passwords would take longer than the rest of the run.
+
+The denormalised columns stay consistent with the base rows: lesson slots
+and counts, completion bitmaps and their percentages. ``CourseStats`` is
+left to ``rebuild_course_stats``.
+"""
+import itertools
+import json
+import random
+from collections import namedtuple
+from datetime import timedelta
+
+from bitmaps import set_bit
+from quiz_bank import pack_correct
+
+Scale = namedtuple('Scale', 'users courses lessons_per_course enrollments_per_user quiz_attempts_per_user')
+
+SCALES = {
+    'small': Scale(500, 30, 8, 3, 1),
+    'medium': Scale(20000, 300, 12, 4, 2),
+    'large': Scale(1000000, 2000, 20, 5, 2),
+}
+
+TABLES = ('course', 'lesson', 'quiz', 'question', 'user', 'progress', 'lesson_progress', 'quiz_result')
+
+QUESTIONS_PER_QUIZ = 10
+# Share of a learner's enrollments drawn from their favourite category
+CATEGORY_AFFINITY = 0.7
+OPTIONS_PER_QUESTION = 4
+
+CATEGORIES = ['Machine Learning', 'Deep Learning', 'Natural Language Processing', 'Computer Vision',
+              'Reinforcement Learning', 'Data Science']
+DIFFICULTIES = ['Beginner', 'Intermediate', 'Advanced']
+IMAGES = ['🤖', '🧠', '📊', '👁️', '💬', '🎮', '📈']
+TOPICS = ['gradient descent', 'backpropagation', 'regularization', 'attention', 'embeddings',
+          'convolutions', 'decision trees', 'clustering', 'transformers', 'policy gradients',
+          'feature engineering', 'cross-validation', 'tokenization', 'dropout', 'batch normalization',
+          'recurrent networks', 'support vector machines', 'bayesian inference', 'autoencoders',
+          'q-learning', 'data augmentation', 'transfer learning', 'loss functions', 'optimizers']
+
+
+def synthetic_rows(scale, seed, start_ids, password_hash, now):
+    # Imported here so app.py can offer the SCALES choices without loading NumPy
+    import numpy as np
+
+    rng = random.Random(seed)
+    course_ids = range(start_ids['course'], start_ids['course'] + scale.courses)
+    ranks_by_category = {}
+    for table, row in _catalog(rng, course_ids, scale.lessons_per_course, start_ids, now):
+        if table == 'course':
+            ranks_by_category.setdefault(row['category'], []).append(row['id'] - start_ids['course'])
+        yield table, row
+
+    # Zipf-like popularity: the course of rank r is chosen with weight 1 / (r + 1)
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(scale.courses)))
+    by_category = {category: (ranks, list(itertools.accumulate(1 / (rank + 1) for rank in ranks)))
+                   for category, ranks in ranks_by_category.items()}
+    categories = sorted(by_category)
+    ids = {name: itertools.count(start_ids[name]) for name in ('progress', 'lesson_progress', 'quiz_result')}
+    for user_id in range(start_ids['user'], start_ids['user'] + scale.users):
+        joined = now - timedelta(seconds=rng.randrange(365 * 86400))
+        yield 'user', {
+            'id': user_id,
+            'username': f'learner{user_id}',
+            'email': f'learner{user_id}@example.com',
+            'password': password_hash,
+            'is_admin': False,
+            'created_at': joined
+        }
+        enrolled = set()
+        wanted = min(scale.enrollments_per_user, scale.courses)
+        ranks, weights = by_category[rng.choice(categories)]
+        while len(enrolled) < wanted:
+            if rng.random() < CATEGORY_AFFINITY:
+                rank = rng.choices(ranks, cum_weights=weights)[0]
+            else:
+                rank = rng.choices(range(scale.courses), cum_weights=popularity)[0]
+            enrolled.add(course_ids[rank])
+        enrolled = sorted(enrolled)
+        skill = rng.betavariate(4, 2)
+        for course_id in enrolled:
+            yield from _enrollment(rng, ids, user_id, course_id, scale.lessons_per_course, joined, now)
+        for _ in range(scale.quiz_attempts_per_user):
+            correct = np.array([rng.random() < skill for _ in range(QUESTIONS_PER_QUIZ)])
+            course_id = rng.choice(enrolled)
+            yield 'quiz_result', {
+                'id': next(ids['quiz_result']),
+                'user_id': user_id,
+                'course_id': course_id,
+                'score': int(correct.sum()),
+                'total_questions': QUESTIONS_PER_QUIZ,
+                'completed_at': _between(rng, joined, now),
+                'quiz_id': start_ids['quiz'] + (course_id - start_ids['course']),
+                'quiz_version': 1,
+                'correct_bits': pack_correct(correct)
+            }
+
+
+def _catalog(rng, course_ids, lessons_per_course, start_ids, now):
+    lesson_ids = itertools.count(start_ids['lesson'])
+    question_ids = itertools.count(start_ids['question'])
+    for index, course_id in enumerate(course_ids):
+        topic = rng.choice(TOPICS)
+        category = rng.choice(CATEGORIES)
+        created = now - timedelta(days=rng.randrange(730))
+        title = f'{topic.title()} {category} {index + 1}'
+        yield 'course', {
+            'id': course_id,
+            'title': title,
+            'slug': f'synthetic-{course_id}',
+            'description': f'A course on {topic} and {rng.choice(TOPICS)} for {category.lower()} practitioners.',
+            'category': category,
+            'difficulty': rng.choice(DIFFICULTIES),
+            'duration': f'{rng.randint(2, 12)} weeks',
+            'image': rng.choice(IMAGES),
+            'content': _paragraphs(rng, 3),
+            'is_published': rng.random() < 0.95,
+            'created_at': created,
+            'lesson_count': lessons_per_course,
+            'lesson_slots': lessons_per_course
+        }
+        for order in range(lessons_per_course):
+            yield 'lesson', {
+                'id': next(lesson_ids),
+                'course_id': course_id,
+                'title': f'Lesson {order + 1}: {rng.choice(TOPICS).capitalize()}',
+                'content': _paragraphs(rng, 2),
+                'video_url': None,
+                'duration': f'{rng.randint(5, 45)} min',
+                'order': order + 1,
+                'created_at': created,
+                'slot': order
+            }
+        quiz_id = start_ids['quiz'] + index
+        yield 'quiz', {'id': quiz_id, 'course_id': course_id, 'title': f'{title} Quiz', 'version': 1,
+                       'created_at': created}
+        for position in range(QUESTIONS_PER_QUIZ):
+            yield 'question', {
+                'id': next(question_ids),
+                'quiz_id': quiz_id,
+                'position': position,
+                'text': f'Which statement about {rng.choice(TOPICS)} is correct?',
+                'options': json.dumps([f'Statement {chr(65 + n)}' for n in range(OPTIONS_PER_QUESTION)]),
+                'correct': rng.randrange(OPTIONS_PER_QUESTION)
+            }
+
+
+def _enrollment(rng, ids, user_id, course_id, lesson_count, joined, now):
+    roll = rng.random()
+    done = 0 if roll < 0.25 else lesson_count if roll < 0.45 else rng.randint(1, max(1, lesson_count - 1))
+    done = min(done, lesson_count)
+    bits = b''
+    for slot in rng.sample(range(lesson_count), done):
+        bits, _ = set_bit(bits, slot)
+    percentage = done * 100 // lesson_count if lesson_count else 0
+    enrolled = _between(rng, joined, now)
+    accessed = _between(rng, enrolled, now)
+    yield 'progress', {
+        'id': next(ids['progress']),
+        'user_id': user_id,
+        'course_id': course_id,
+        'completed': percentage == 100,
+        'progress_percentage': percentage,
+        'last_accessed': accessed,
+        'enrolled_at': enrolled,
+        'completed_at': accessed if percentage == 100 else None
+    }
+    if done:
+        yield 'lesson_progress', {
+            'id': next(ids['lesson_progress']),
+            'user_id': user_id,
+            'course_id': course_id,
+            'bits': bits,
+            'completed_lessons': done,
+            'updated_at': accessed
+        }
+
+
+def _between(rng, start, end):
+    return start + timedelta(seconds=rng.random() * (end - start).total_seconds())
+
+
+def _paragraphs(rng, count):
+    return ''.join(f'<p>This part covers {", ".join(rng.sample(TOPICS, 3))} with worked examples.</p>'
+                   for _ in range(count))
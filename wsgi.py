@@ -0,0 +1,15 @@
+"""WSGI entry point for production servers.
+
+    gunicorn 'wsgi:create_app()'
+
+``create_app`` imports the application when the server asks for it, so
+that the master process can start without loading it. Configuration comes
+from the environment (see the ``app.config`` block in app.py). The schema is
+not touched here: run ``flask init-db`` (or let serve.py do it) once per
+deploy, before any worker starts.
+"""
+
+
+def create_app():
+    from app import app
+    return app